@@ -26,6 +26,22 @@ OPTIONS:
                          multiple versions (same version is required
                          for remove command or remove will show error).
 --caption                Specify a caption for the icon.
+--compact-metadata       Save local_machine.json without indentation.
+--jobs                   Specify how many threads extract a zip file
+                         (default: the number of CPUs) or copy or
+                         delete a directory, or how many processes
+                         parse names for inspect or scan (default: 1).
+--cache                  Keep extracted archives in
+                         ~/.cache/nopackage/extracted so reinstalling
+                         the same archive only links the files.
+--cache-quota            Specify the maximum size of that cache in MiB
+                         (default: 4096).
+--sha256sums             Specify a SHA256SUMS file (as written by
+                         sha256sum) to verify the archive or file
+                         before installing it.
+--dedup                  Hard link files that are identical to files of
+                         other installed programs (such as other
+                         versions with --multi-version) to save space.
 
 EXAMPLES:
 nopackage install        <Program Name_version.AppImage>
@@ -47,6 +63,34 @@ nopackage remove keepassxc
 nopackage reinstall <path>
                     ^ removes it from $HOME/.local/lib64 first
 
+nopackage migrate
+          ^ Import local_machine.json into local_machine.sqlite3 (once).
+            After that, the SQLite database is used instead (faster
+            when many programs are tracked).
+
+nopackage dedup
+          ^ Hard link identical files of every installed versioned
+            package (See --dedup), and remove unused files from the
+            store. Only use it if the programs do not modify their own
+            files.
+
+nopackage inspect <directory>
+          ^ Show the luid, version, arch and platform detected from
+            the name of each file or directory in it (one JSON object
+            per line) without installing anything.
+
+nopackage inspect <archive>
+          ^ Also show the icons and .desktop files in a tar, tar.gz or
+            tar.xz archive without extracting it. Only the .desktop
+            files are decompressed if the archive was installed with
+            --cache or inspected before.
+
+nopackage scan <directory>
+          ^ Show the commands that would upgrade installed programs to
+            newer versions found in it (such as your Downloads folder).
+            Names are only parsed again if the file changed since the
+            last scan.
+
 nopackage help
           ^ Show this help screen.
 
@@ -54,17 +98,21 @@ nopackage help
 '''
 from __future__ import print_function
 
-from collections import OrderedDict
+from collections import (
+    OrderedDict,
+    namedtuple,
+)
+from contextlib import contextmanager
+from functools import lru_cache
 import sys
 import stat
 import os
 import shutil
-import tarfile
-import tempfile
-from zipfile import ZipFile
 import platform
 import json
 import copy
+import re
+import time
 from datetime import datetime
 import inspect
 
@@ -83,11 +131,6 @@ if __name__ == "__main__":
 
 from nopackage.find_hierosoft import hierosoft  # noqa F401
 
-from hierosoft.moreweb import (
-    # request,
-    download,
-)
-
 from hierosoft.moreplatform import (
     which_pixmap,
 )
@@ -136,8 +179,10 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
 
-COMMANDS = ['install', 'reinstall', 'remove']
-VALUE_PARAM_KEYS = ["caption", "version"]
+COMMANDS = ['install', 'reinstall', 'remove', 'migrate', 'dedup',
+            'inspect', 'scan']
+VALUE_PARAM_KEYS = ["caption", "version", "jobs", "cache-quota",
+                    "sha256sums"]
 
 
 lib64 = os.path.join(sysdirs['PREFIX'], "lib64")
@@ -254,8 +299,8 @@ iconNames = {
     # ^ commented since URL has 403 (icon is in "shortcut-metadata" dir now)
 }
 # ^ A list of icon names where the downloaded file should be renamed.
-# ^ Also generated names are put here during module load!
-#   See `iconNames[luid] = noExt` above `del luid`
+# ^ Also generated names are put here on first use!
+#   See `iconNames[luid] = noExt` in init_icon_names
 
 minimumUniquePartOfLuid = {
     'unityhub': "unity",
@@ -350,57 +395,66 @@ shortcutMetas['finetest']['Keywords'] += "minetest;"
 shortcutMetas['multicraft'] = copy.deepcopy(shortcutMetas['minetest'])
 shortcutMetas['multicraft']['Keywords'] += "minetest;"
 
-luid = None
-for rawLuid, url in iconLinks.items():
-    lastSlashI = url.rfind("/")
-    fileName = url[lastSlashI+1:]
-    if "?" in fileName:
-        lastSignI = fileName.rfind("=")
-        if lastSignI < 0:
-            lastSignI = fileName.rfind("?")
-        fileName = fileName[lastSignI+1:]
-    noExt, dotExt = os.path.splitext(fileName)
-    url_query_i = dotExt.rfind("?")
-    if url_query_i > -1:
-        dotExt = dotExt[:url_query_i-1]
-    if "?" in fileName:
-        raise NameError("? in icon name {}{}".format(fileName, dotExt))
-    if "?" in dotExt:
-        raise NameError("? in icon extension {}{}".format(fileName, dotExt))
-    if not dotExt:
-        echo0("Warning: No extension on <{}> from iconLinks. Assuming png."
-              "".format(url))
-        dotExt = ".png"  # FIXME: assumes format
-    fileName = rawLuid + dotExt
-    luid = rawLuid
-    # gotLuid = hyphenate_names_lookup.get(luid)
-    # if gotLuid is not None:
-    #     luid = gotLuid
-    gotName = iconNames.get(luid)
-    if gotName is not None:
-        fileName = gotName
-    else:
+
+def init_icon_names():
+    '''
+    Add a generated icon name to iconNames for each iconLinks entry that
+    doesn't have one, and make sure each name contains part of the luid.
+    This is done on first use (See ensure_initialized) rather than
+    during import.
+    '''
+    for rawLuid, url in iconLinks.items():
+        lastSlashI = url.rfind("/")
+        fileName = url[lastSlashI+1:]
+        if "?" in fileName:
+            lastSignI = fileName.rfind("=")
+            if lastSignI < 0:
+                lastSignI = fileName.rfind("?")
+            fileName = fileName[lastSignI+1:]
         noExt, dotExt = os.path.splitext(fileName)
-        iconNames[luid] = noExt  # Rewrite the generated name.
-    any_part_of_luid_in_name = False
-    luidParts = luid.split(".")
-    notDividedPart = minimumUniquePartOfLuid.get(luid)
-    if notDividedPart is not None:
-        luidParts.append(notDividedPart)
-    for luidPart in luidParts:
-        if luidPart in fileName.lower():
-            any_part_of_luid_in_name = True
-            break
-    if not any_part_of_luid_in_name:
-        print()
-        msg = (" None of {luidParts} are in {fileName} (end of {url})."
-               " Add an icon name containing {luid} (case insensitive,"
-               " no extension) as iconNames['{luid}']"
-               " to make the generated filename unique."
-               "".format(luid=luid, fileName=fileName, url=url,
-                         luidParts=luidParts))
-        raise AssertionError(msg)
-del luid
+        url_query_i = dotExt.rfind("?")
+        if url_query_i > -1:
+            dotExt = dotExt[:url_query_i-1]
+        if "?" in fileName:
+            raise NameError("? in icon name {}{}".format(fileName, dotExt))
+        if "?" in dotExt:
+            raise NameError("? in icon extension {}{}"
+                            "".format(fileName, dotExt))
+        if not dotExt:
+            echo0("Warning: No extension on <{}> from iconLinks."
+                  " Assuming png.".format(url))
+            dotExt = ".png"  # FIXME: assumes format
+        fileName = rawLuid + dotExt
+        luid = rawLuid
+        # gotLuid = hyphenate_names_lookup.get(luid)
+        # if gotLuid is not None:
+        #     luid = gotLuid
+        gotName = iconNames.get(luid)
+        if gotName is not None:
+            fileName = gotName
+        else:
+            noExt, dotExt = os.path.splitext(fileName)
+            iconNames[luid] = noExt  # Rewrite the generated name.
+        any_part_of_luid_in_name = False
+        luidParts = luid.split(".")
+        notDividedPart = minimumUniquePartOfLuid.get(luid)
+        if notDividedPart is not None:
+            luidParts.append(notDividedPart)
+        for luidPart in luidParts:
+            if luidPart in fileName.lower():
+                any_part_of_luid_in_name = True
+                break
+        if not any_part_of_luid_in_name:
+            print()
+            msg = (" None of {luidParts} are in {fileName} (end of {url})."
+                   " Add an icon name containing {luid} (case insensitive,"
+                   " no extension) as iconNames['{luid}']"
+                   " to make the generated filename unique."
+                   "".format(luid=luid, fileName=fileName, url=url,
+                             luidParts=luidParts))
+            raise AssertionError(msg)
+
+
 casedNames = {  # A list of correct icon captions indexed by LUID
     'umlet': "UMLet Standalone",  # as opposed to a plugin/web ver
     'freecad': "FreeCAD",
@@ -418,6 +472,11 @@ annotations = {  # Add a parenthetical to the shortcut caption.
     '.deb': "deb",
     '.appimage': "AppImage",
 }
+INSTALLER_ENDINGS = (".appimage", ".deb", ".zip", ".tar.bz2", ".tar.gz",
+                     ".tar.xz", ".tar.zst", ".tar.lz4", ".tgz", ".tbz2",
+                     ".tbz", ".txz", ".tzst", ".tar")
+# ^ Lowercase endings of files that `nopackage scan` considers (the
+#   archive endings are the same as archive_categories).
 
 
 known_binaries = ["RunAwesomeBump.sh", "monero-wallet-gui"]
@@ -455,10 +514,19 @@ def filename_from_url(url):
     return name
 
 
-def mark_executable(path, silent=False, reraise=False):
+def mark_executable(path, silent=False, reraise=False, if_needed=False):
     """Allow all permissions for user,
     but group & others can only execute & read.
+
+    If if_needed is True, keep the mode if the owner can already execute
+    it (such as a file extracted with the mode stored in the archive).
     """
+    if if_needed:
+        try:
+            if os.stat(path).st_mode & stat.S_IXUSR:
+                return True
+        except OSError:
+            pass  # Let chmod show the error.
     try:
         os.chmod(path, (stat.S_IRWXU | stat.S_IXGRP | stat.S_IRGRP
                         | stat.S_IROTH | stat.S_IXOTH))
@@ -596,12 +664,7 @@ def get_luid():
 
 
 def getProgramIDs():
-    results = []
-    programs = localMachine.get("programs")
-    if programs is None:
-        return None
-    results = list(programs.keys())
-    return results
+    return getMetaStore().entry_ids('programs')
 
 
 def encode_py_val(v):
@@ -678,11 +741,7 @@ def decode_py_val(valueStr, lineN=-1, path="(generated)"):
 
 
 def setDeepValue(category, luid, key, value):
-    if localMachine.get(category) is None:
-        localMachine[category] = {}
-    if localMachine[category].get(luid) is None:
-        localMachine[category][luid] = {}
-    if isinstance(localMachine[category][luid].get(key), list):
+    if isinstance(getMetaStore().get_value(category, luid, key), list):
         raise ValueError("You cannot change a list (key={}) to a"
                          "non-list.".format(key))
     if isinstance(value, list):
@@ -693,9 +752,8 @@ def setDeepValue(category, luid, key, value):
                          " individual values using setDeepValues"
                          " or something like {} instead."
                          "".format(category, luid, key, newCallName))
-    localMachine[category][luid][key] = value
-    if enableSaveOnWrite:
-        saveLocalMachine()
+    getMetaStore().set_value(category, luid, key, value)
+    localMachineChanged()
 
 
 def setProgramValue(luid, key, value):
@@ -720,11 +778,8 @@ def setPackageValue(sc_name, key, value):
 
 
 def getDeepValue(category, luid, key, delete=False):
-    if localMachine.get(category) is None:
-        return None
-    if localMachine[category].get(luid) is None:
-        return None
-    if isinstance(localMachine[category][luid].get(key), list):
+    value = getMetaStore().get_value(category, luid, key)
+    if isinstance(value, list):
         callerName = inspect.stack()[1][3]
         newCallName = callerName + "s"
         raise ValueError("You cannot get from a list ({}.{}.{}) in"
@@ -732,13 +787,9 @@ def getDeepValue(category, luid, key, delete=False):
                          "like {} (plural) instead."
                          "".format(category, luid, key, newCallName))
     if not delete:
-        return localMachine[category][luid].get(key)
-    value = None
-    if key in localMachine[category][luid]:
-        value = localMachine[category][luid][key]
-        del localMachine[category][luid][key]
-        if enableSaveOnWrite:
-            saveLocalMachine()
+        return value
+    if getMetaStore().delete_value(category, luid, key):
+        localMachineChanged()
     return value
 
 
@@ -771,20 +822,21 @@ def deleteProgramValue(luid, key, force=False):
 
 
 def getDeepValues(category, luid, key):
-    if localMachine.get(category) is None:
+    if not getMetaStore().has_category(category):
         echo0("Warning: getDeepValues didn't find the category {}"
               "".format(category))
         return None
-    if localMachine[category].get(luid) is None:
+    if not getMetaStore().has_entry(category, luid):
         return None
-    if not isinstance(localMachine[category][luid].get(key), list):
+    values = getMetaStore().get_value(category, luid, key)
+    if not isinstance(values, list):
         callerName = inspect.stack()[1][3]
         newCallName = callerName[:-1]  # Remove the 's'.
         raise ValueError("You can only get multiple values from a list"
                          " ({}.{}.{}). Use getDeepValue or"
                          " something like {} (singular) instead."
                          "".format(category, luid, key, newCallName))
-    return localMachine[category][luid].get(key)
+    return values
 
 
 def getProgramValues(luid, key):
@@ -815,21 +867,15 @@ def addDeepValue(category, luid, key, value, unique=True):
     unique -- True of the value should only be added if it isn't already
         in the list named by `key`.
     '''
-    if localMachine.get(category) is None:
+    if not getMetaStore().has_category(category):
         echo0("Warning: addDeepValue didn't find the category {}"
               "".format(category))
-        localMachine[category] = {}
-    if localMachine[category].get(luid) is None:
-        localMachine[category][luid] = {}
-    if localMachine[category][luid].get(key) is None:
-        localMachine[category][luid][key] = []
-    if not isinstance(localMachine[category][luid][key], list):
+    oldValue = getMetaStore().get_value(category, luid, key)
+    if (oldValue is not None) and (not isinstance(oldValue, list)):
         raise ValueError("You cannot append to non-list ({}.{}.{})."
                          "".format(category, luid, key))
-    if (not unique) or (value not in localMachine[category][luid][key]):
-        localMachine[category][luid][key].append(value)
-    if enableSaveOnWrite:
-        saveLocalMachine()
+    getMetaStore().append_value(category, luid, key, value, unique=unique)
+    localMachineChanged()
 
 
 def addProgramValue(luid, key, value, unique=True):
@@ -1001,14 +1047,11 @@ def get_annotation(s):
 def find_all_cs(haystack, needle):
     '''get indices of every match of the needle (case sensitive)'''
     results = []
-    i = 0
     nLen = len(needle)
-    while i < len(haystack):
-        if haystack[i:i+nLen] == needle:
-            results.append(i)
-            i += nLen
-            continue
-        i += 1
+    i = haystack.find(needle)
+    while i > -1:
+        results.append(i)
+        i = haystack.find(needle, i + nLen)
     return results
 
 
@@ -1065,6 +1108,71 @@ def has_tuple_with(tuples, index, needle):
     return find_tuple_with(tuples, index, needle) > -1
 
 
+@lru_cache(maxsize=32)
+def _tokenizer(delimiters, blobs):
+    '''
+    Compile the patterns used by tokenize for one combination of
+    delimiters and blobs (both must be tuples so they can be cached).
+
+    Returns:
+    A tuple of (dots, splitter) where dots matches a dot before a blob
+    (None if there are no blobs) and splitter matches a blob
+    (case-insensitive, in the order of blobs so the first listed wins)
+    or else a delimiter (group 1).
+    '''
+    chars = "".join(re.escape(c) for c in delimiters if len(c) == 1)
+    delimiterPattern = "[{}]".format(chars) if chars else "(?!)"
+    if not blobs:
+        return None, re.compile("({})".format(delimiterPattern))
+    if len(delimiters[0]) > 1:
+        raise ValueError("delimiter[0] ('{}') is too long (should be 1"
+                         " character).".format(delimiters[0]))
+    anyBlob = "|".join(re.escape(blob) for blob in blobs)
+    dots = re.compile(r"\.(?=(?:{}))".format(anyBlob), re.IGNORECASE)
+    splitter = re.compile("(?:{})|({})".format(anyBlob, delimiterPattern),
+                          re.IGNORECASE)
+    # ^ Not "(?i:...)" for only the blobs, which Python 2 lacks (See
+    #   tokenize for delimiters that differ only by case).
+    return dots, splitter
+
+
+def tokenize(s, delimiters, blobs=None):
+    '''
+    Split s in one pass (See split_any).
+
+    Returns:
+    A tuple of (parts, oldDelimiters) where oldDelimiters[i] is the
+    character of s that followed parts[i] ("" after the last part),
+    such as "." where a dot before a blob was treated as delimiters[0].
+    '''
+    if blobs is not None:
+        blobs = tuple(blobs)
+    dots, splitter = _tokenizer(tuple(delimiters), blobs)
+    scanned = s
+    if dots is not None:
+        # replace bad dots with delimiters (example: change .i386 to
+        # _i386.
+        scanned = dots.sub(delimiters[0], s)
+    parts = []
+    oldDelimiters = []
+    start = 0
+    for match in splitter.finditer(scanned):
+        if match.lastindex is None:
+            continue
+            # ^ A blob, so skip to the end of it without splitting.
+        i = match.start()
+        if scanned[i] not in delimiters:
+            continue
+            # ^ Delimiters are case-sensitive.
+        parts.append(scanned[start:i])
+        oldDelimiters.append(s[i])
+        start = i + 1
+    # Add the last slice, whether ends in delimiter or not.
+    parts.append(scanned[start:])
+    oldDelimiters.append("")
+    return parts, oldDelimiters
+
+
 def split_any(s, delimiters, blobs=None):
     '''
     Sequential arguments:
@@ -1075,71 +1183,7 @@ def split_any(s, delimiters, blobs=None):
         'x86_64' as a blob when '_' is in delimiters but you want
         to not split at '_' in cases where it is in that blob)
     '''
-    ret = []
-    start = 0
-    blobIs = None
-    oldS = s
-    print("[split_any] checking for {}".format(blobs))
-    if blobs is not None:
-        # replace bad dots with delimiters (example: change .i386 to
-        # _i386.
-        i = -1
-        while i + 1 < len(s):
-            i += 1
-            for blob in blobs:
-                if i == 0:
-                    continue
-                elif s[i-1] != '.':
-                    continue
-                if s[i:i+len(blob)].lower() == blob.lower():
-                    # if s[i-1] == '.':
-                    if len(delimiters[0]) > 1:
-                        raise ValueError("delimiter[0] ('{}') is too"
-                                         " long (should be 1"
-                                         " character)."
-                                         "".format(delimiters[0]))
-                    s = s[:i-1] + delimiters[0] + s[i:]
-                # else:
-                #     print("[split_any] {} is not {}"
-                #           "".format(s[i:i+len(blob)].lower(),
-                #                     blob.lower()))
-        del i
-    if s != oldS:
-        print("[split_any] preprocessed {} to {}".format(oldS, s))
-    else:
-        print("[split_any] There was nothing to preprocess in {}"
-              "".format(s))
-    if blobs is not None:
-        blobIs = find_all_any_ci(s, blobs)
-    i = 0
-    while i < len(s):
-        c = s[i]
-        if blobIs is not None:
-            # print("[split_any] checking in {}".format(blobIs))
-            foundI = find_tuple_with(blobIs, 0, i)
-            if foundI > -1:
-                # print("[split_any] {} is in {}".format(i, blobIs))
-                # If a blob had been found at i, skip i to end of blob.
-                # Do not end here.
-                i += len(blobIs[foundI][1])
-                continue
-        if c in delimiters:
-            print("[split_any] {} is in {}".format(c, delimiters))
-            ret.append(s[start:i])
-            start = i + 1
-        i += 1
-    # Add the last slice, whether ends in delimiter or not.
-    ret.append(s[start:i])
-    '''
-    parts = s.split(delimiters[0])
-    if len(delimiters) > 1:
-        for part in parts:
-            ret += split_any(part, delimiters[1:])
-    else:
-        ret = parts
-    '''
-    # print("[split_any] split into {}".format(ret))
-    return ret
+    return tokenize(s, delimiters, blobs=blobs)[0]
 
 
 def find_startswith(haystacks, needle, cs=True):
@@ -1245,6 +1289,22 @@ noAlphaErrorFmt = ('Parsing names with no alphabetic characters'
                    ')')
 
 
+class NoVersionError(ValueError):
+    '''
+    The name has no version and none was specified (See
+    parse_package_name).
+    '''
+    def __init__(self, fnamePartial):
+        ValueError.__init__(
+            self,
+            "{} (any of '{}' or '.' is not in {} and no version was"
+            " specified)".format(PackageInfo.NO_VER_FLAG,
+                                 PackageInfo.DELIMITERS,
+                                 encode_py_val(fnamePartial))
+        )
+        self.fnamePartial = fnamePartial
+
+
 class PackageInfo:
     '''
     To get a globally unique name based on whether multiVersion or
@@ -1276,13 +1336,13 @@ class PackageInfo:
         "32",  # such as Godot 32-bit
         "64",  # such as Godot 64-bit
     ]
-    NON_BIN_EXTS = [
+    NON_BIN_EXTS = {
         "txt",
         "md",
         "doc",
-    ]
+    }
 
-    NON_BIN_NOEXTS = [  # exclude these regardless of ext since '' in BIN_EXTS
+    NON_BIN_NOEXTS = {  # exclude these regardless of ext since '' in BIN_EXTS
         "00readme",
         "__base__",
         "_htaccess",
@@ -1377,7 +1437,7 @@ class PackageInfo:
         "yargs",
         "zip-safe",
         "zram",
-    ]  # some were discovered by ~/git/find-no-ext.py | sort
+    }  # some were discovered by ~/git/find-no-ext.py | sort
     # TODO: do something about docker rc files such as
     #   ~/git/dockapps/washerdryer/washerDryer/wdryerrc
     #   (conf file format)
@@ -1505,215 +1565,54 @@ class PackageInfo:
         if removeExt is None:
             removeExt = not is_dir
         self.fname = os.path.split(self.path)[-1]
-        fnamePartial = self.fname
-        if removeExt:
-            fnamePartial = os.path.splitext(self.fname)[0]
-            if fnamePartial.lower().endswith(".tar"):
-                fnamePartial = fnamePartial[:-4]
-        startChar = 0
-        while not fnamePartial[startChar].isalpha():
-            startChar += 1
-            if startChar >= len(fnamePartial):
-                msg = noAlphaErrorFmt.format(self.fname, fnamePartial)
-                echo0(msg)
-                echo0("raw_src_path: {}".format(raw_src_path))
-                echo0("src_path: {}".format(src_path))
-                echo0("kwargs: {}".format(kwargs))
-                raise ValueError(msg)
-                # print(msg)
-                # break
-                # startChar = 0
-        fnamePartial = fnamePartial[startChar:]
-        self.caption = kwargs.get('caption')
-        parts = split_any(fnamePartial, PackageInfo.DELIMITERS,
-                          blobs=PackageInfo.ARCHES)
-        archI = -1
-        if PackageInfo.verbosity > 0:
-            print("* name without extension: {}"
-                  "".format(encode_py_val(fnamePartial)))
-        platformI = -1
-        versionI = -1
-        if len(parts) < 2:
-            # re-split
-            tmpParts = fnamePartial.split(".")
-            parts, versionI = PackageInfo.join_version(tmpParts)
-            print("* split {} into {} len {} (version is at [{}])"
-                  "".format(fnamePartial, tmpParts, len(tmpParts),
-                            versionI))
-        else:
-            oldDelimiters = []
-            cI = 0
-            for i in range(len(parts)):
-                cI += len(parts[i])
-                if cI < len(fnamePartial):
-                    oldDelimiters.append(fnamePartial[cI])
-                    cI += 1  # add the delimiter length
-                else:
-                    oldDelimiters.append("")
-                if parts[i][:1].lower() == "v":
-                    # Remove v such as "v1.0" to "1.0".
-                    if is_digits(parts[i][1:]):
-                        parts[i] = parts[i][1:]
-                partL = parts[i].lower()
-                if partL in PackageInfo.X64S:
-                    self.arch = "64bit"
-                    archI = i
-                    # Always do 64-bit first so that x86_64 is found
-                    # before x86.
-                elif partL in PackageInfo.X32S:
-                    self.arch = "32bit"
-                    archI = i
-                elif partL == "x86":
-                    if (len(parts) > i + 1) and (parts[i+1] == "64"):
-                        self.arch = "64bit"
-                    else:
-                        self.arch = "32bit"
-                elif partL in PackageInfo.NOARCHES:
-                    self.arch = "noarch"
-                if partL in PackageInfo.LINS:
-                    self.platform = "Linux"
-                    platformI = i
-                elif partL in PackageInfo.WINS:
-                    self.platform = "Windows"
-                    platformI = i
-            parts, versionI = PackageInfo.join_version(
-                parts,
-                oldDelimiters=oldDelimiters
+        try:
+            parsed = parse_package_name(
+                self.fname,
+                casedName=self.casedName,
+                luid=self.luid,
+                version=self.version,
+                caption=kwargs.get('caption'),
+                removeExt=removeExt,
+                dry_run=bool(self.dry_run),
             )
-            # ^ still do join_version, because the version may be
-            # #   multiple parts such as in ['Slic3r', '1.3.1', 'dev']
-            del i
-        if (len(parts) < 2) and (self.version is None):
-            if not self.dry_run:
-                usage()
-                raise ValueError(PackageInfo.NO_VER_FLAG + " (any of"
-                                 " '{}' or '.' is not in {} and you"
-                                 " didn't specify a version such as:\n"
-                                 " {} {} --version x"
-                                 "".format(PackageInfo.DELIMITERS,
-                                           encode_py_val(fnamePartial),
-                                           me, sh_literal(original_src)))
-            else:
-                echo0("WARNING: no version is in {}"
-                      "".format(fnamePartial))
+        except NoVersionError as ex:
+            usage()
+            raise ValueError(PackageInfo.NO_VER_FLAG + " (any of"
+                             " '{}' or '.' is not in {} and you"
+                             " didn't specify a version such as:\n"
+                             " {} {} --version x"
+                             "".format(PackageInfo.DELIMITERS,
+                                       encode_py_val(ex.fnamePartial),
+                                       me, sh_literal(original_src)))
+        except ValueError as ex:
+            echo0(str(ex))
+            echo0("raw_src_path: {}".format(raw_src_path))
+            echo0("src_path: {}".format(src_path))
+            echo0("kwargs: {}".format(kwargs))
+            raise
+        if (parsed.version is None) and self.dry_run:
+            echo0("WARNING: no version is in {}".format(self.fname))
         if self.version is None:
-            # INFO: Any "v" prefix was already removed and multi-part
-            #       versions were already un-split into one part
-            #       using join_version (in re-split code or the
-            #       `else` case).
-            if versionI > -1:
-                self.version = parts[versionI]
-                if True:  # TODO: if PackageInfo.verbosity > 0:
-                    print("* using '" + self.version + "' as version")
+            if parsed.version is not None:
+                print("* using '" + parsed.version + "' as version")
         else:
-            if True:  # TODO: PackageInfo.verbosity > 0:
-                print("* using specified '{}' as version"
-                      "".format(self.version))
-
-        nameEnder = -1
-        if versionI > -1:
-            nameEnder = versionI
-            if PackageInfo.verbosity > 0:
-                print("* ending name at version {}"
-                      "".format(encode_py_val(parts[versionI])))
-        if platformI > -1:
-            if nameEnder < 0 or (platformI < nameEnder):
-                nameEnder = platformI
-        if versionI > -1:
-            if (nameEnder < 0) or (versionI < nameEnder):
-                nameEnder = versionI
-
-        if self.casedName is None:
-            self.casedName = parts[0]
-            hyphenateI = find_startswith(hyphenate_names,
-                                         "-".join(parts), cs=False)
-            if hyphenateI >= 0:
-                lowerCaseParts = hyphenate_names[hyphenateI].split("-")
-                newPartsCount = len(lowerCaseParts)
-                self.casedName = "-".join(parts[:newPartsCount])
-                '''
-                ^ Reconstruct the uppercase name even though it will
-                  become lowercase later.
-                  - Why not add a lookup instead:
-                    Adding a lookup for luid based on a partial name
-                    such as "ninja" (extracted from "ninja-ide" at this
-                    point) would result in a false positive for a
-                    program actually called "ninja".
-                '''
-            elif nameEnder > 0:
-                self.casedName = " ".join(parts[:nameEnder])
-            else:
-                print("WARNING: there is no name ender such as arch,"
-                      " platform or version, so the first part will be"
-                      " the name: {}."
-                      "".format(encode_py_val(self.casedName)))
-            if PackageInfo.verbosity > 0:
-                print("* using '{}' as human-readable name"
-                      " before adding version".format(self.casedName))
-        else:
-            if PackageInfo.verbosity > 0:
-                print("* using specified name: {}"
-                      "".format(self.casedName))
-
-        annotation = get_annotation(src_path)
-        if annotation is not None:
-            self.suffix = "-" + annotation
-
+            print("* using specified '{}' as version"
+                  "".format(self.version))
         if self.luid is None:
-            self.luid = toLUID(self.casedName)
             print("* luid (generated from casedName): {}"
-                  "".format(self.luid))
-
-        if kwargs.get('casedName') is None:
-            # only use a build-in cased name if not specified manually
-            # (a casedName may have been generated above, but the
-            # following can't be completed until LUID is generated if
-            # not present)
-            tryCasedName = casedNames.get(self.luid)
-            if tryCasedName is None:
-                if self.casedName.lower() == self.casedName:
-                    if PackageInfo.verbosity > 1:
-                        print("* The program {} is not in the"
-                              " casedNames dict and is all lowercase,"
-                              " so the caption {} will become"
-                              " title case (parts: {})."
-                              "".format(encode_py_val(self.casedName),
-                                        encode_py_val(fnamePartial),
-                                        parts))
-                    self.casedName = self.casedName.title()
-                # else use self.casedName since not all lower.
-            else:
-                self.casedName = tryCasedName
-                if PackageInfo.verbosity > 1:
-                    print("* detected '{}' so changed case to '{}'"
-                          "".format(self.luid, tryCasedName))
-
+                  "".format(parsed.luid))
+        self.casedName = parsed.casedName
+        self.luid = parsed.luid
+        self.version = parsed.version
+        self.caption = parsed.caption
+        self.arch = parsed.arch
+        self.platform = parsed.platform
+        self.suffix = parsed.suffix
         if PackageInfo.verbosity > 0:
             print("* using {} as icon filename prefix (luid)"
                   " (The version will be added later if multiVersion)"
                   "".format(encode_py_val(self.luid)))
 
-        if self.caption is None:
-            if versionI > -1:
-                self.caption = self.casedName + " " + parts[versionI]
-            else:
-                print("WARNING: the caption will not have a version"
-                      " since no version was detected in {}"
-                      "".format(parts))
-                self.caption = self.casedName
-            if annotation is not None:
-                suffix = " (" + annotation + ")"
-                if PackageInfo.verbosity > 1:
-                    print("* appending \" ({})\" to caption..."
-                          "".format(annotation))
-                if not self.caption.endswith(suffix):
-                    self.caption += suffix
-                    print("  OK")
-                else:
-                    if PackageInfo.verbosity > 0:
-                        print("  - skipped: it already ends with {}"
-                              "".format(encode_py_val(suffix)))
-
     # @classmethod
     # def joinArch(cls, tmpParts):
 
@@ -1783,7 +1682,7 @@ class PackageInfo:
         if firstNumI > -1:
             if letteredI > -1:
                 if lastNumI > letteredI:
-                    print(
+                    echo0(
                         "  [{}] WARNING: version numbers {} appear"
                         " after the alphabetical suffix {} in {}."
                         "".format(fn, tmpParts[lastNumI],
@@ -1792,7 +1691,7 @@ class PackageInfo:
                     )
             if firstNumI == 0:
                 parts = ["", ".".join(tmpParts)]
-                print("  [{}] WARNING: No name was detected in {}"
+                echo0("  [{}] WARNING: No name was detected in {}"
                       "".format(fn, tmpParts))
             else:
                 firstNameI = 0
@@ -1803,14 +1702,16 @@ class PackageInfo:
                         ".".join(tmpParts[firstNumI:lastNumI+1]),
                     ]
                     versionI = 1
-                    print("  [{}] TwoOnly is enabled, so version part"
-                          " is {}".format(fn, parts[versionI]))
+                    if PackageInfo.verbosity > 1:
+                        print("  [{}] TwoOnly is enabled, so version"
+                              " part is {}".format(fn, parts[versionI]))
                 else:
                     if oldDelimiters is not None:
                         parts = tmpParts[:firstNumI]
                         i = len(parts)
-                        print("  [{}] firstNumI={}, lastNumI={}"
-                              "".format(fn, firstNumI, lastNumI))
+                        if PackageInfo.verbosity > 1:
+                            print("  [{}] firstNumI={}, lastNumI={}"
+                                  "".format(fn, firstNumI, lastNumI))
                         joined = ""
                         while i <= lastNumI:
                             oldDelimiter = oldDelimiters[i]
@@ -1839,15 +1740,53 @@ class PackageInfo:
                             + tmpParts[lastNumI+1:]
                         )
                     versionI = firstNumI
-            if PackageInfo.verbosity > 0:
+            if PackageInfo.verbosity > 1:
                 print("  [{}] changed parts to {}".format(fn, parts))
             # "since no "
             # "".format(parts, PackageInfo.DELIMITERS))
-        else:
+        elif PackageInfo.verbosity > 1:
             print("  [{}] There are no version strings in {}"
                   "".format(fn, tmpParts))
         return parts, versionI
 
+    @classmethod
+    def parse_many(cls, paths, processes=None, chunksize=256):
+        '''
+        Parse the names of many files or directories without any
+        metadata or output (See parse_package_name), such as to
+        classify a folder of downloads.
+
+        Sequential arguments:
+        cls -- Class (Don't specify this--Call
+            PackageInfo.parse_many to prepend the class)
+        paths -- Paths, or (path, is_dir) tuples (such as from
+            scan_entries) so whether each is a directory isn't checked
+            again. An is_dir of None means check it.
+
+        Keyword arguments:
+        processes -- Parse in a pool of this many processes (default:
+            parse in this process, which is faster unless there are
+            tens of thousands of names).
+        chunksize -- How many paths to send to a process at once.
+
+        Returns:
+        A generator of one dict per path (in the same order) with
+        "path", "is_dir" and the PackageName fields such as "luid"
+        and "version" (None if not detected), or "path", "is_dir"
+        and "error" if the name can't be parsed.
+        '''
+        entries = (path if isinstance(path, tuple) else (path, None)
+                   for path in paths)
+        if (processes is None) or (processes < 2):
+            for entry in entries:
+                yield _parse_entry(entry)
+            return
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            for result in executor.map(_parse_entry, entries,
+                                       chunksize=chunksize):
+                yield result
+
     def get_bits(self):
         '''
         Get 32 or 64 (integer) or None if unknown.
@@ -1891,6 +1830,307 @@ class PackageInfo:
         return str(self.toDict())
 
 
+class PackageName(namedtuple('PackageName', [
+    'casedName', 'luid', 'version', 'caption', 'arch', 'platform',
+    'suffix',
+])):
+    '''
+    The result of parse_package_name (See the PackageInfo attributes of
+    the same names). It is immutable so it can be cached and shared.
+    '''
+    __slots__ = ()
+
+
+@lru_cache(maxsize=1024)
+def _scan_package_name(fname, removeExt):
+    '''
+    Split a file name into parts (the part of parse_package_name that
+    does not depend on the hints, so it is cached even if the hints
+    differ).
+
+    Returns:
+    A tuple of (fnamePartial, parts, versionI, nameEnder, arch,
+    platform) where parts is a tuple and versionI or nameEnder is -1 if
+    not found.
+    '''
+    fnamePartial = fname
+    if removeExt:
+        fnamePartial = os.path.splitext(fname)[0]
+        if fnamePartial.lower().endswith(".tar"):
+            fnamePartial = fnamePartial[:-4]
+    startChar = 0
+    while not fnamePartial[startChar].isalpha():
+        startChar += 1
+        if startChar >= len(fnamePartial):
+            raise ValueError(noAlphaErrorFmt.format(fname, fnamePartial))
+    fnamePartial = fnamePartial[startChar:]
+    parts, oldDelimiters = tokenize(fnamePartial, PackageInfo.DELIMITERS,
+                                    blobs=PackageInfo.ARCHES)
+    arch = None
+    platform_name = None
+    platformI = -1
+    versionI = -1
+    if len(parts) < 2:
+        # re-split
+        tmpParts = fnamePartial.split(".")
+        parts, versionI = PackageInfo.join_version(tmpParts)
+    else:
+        for i in range(len(parts)):
+            if parts[i][:1].lower() == "v":
+                # Remove v such as "v1.0" to "1.0".
+                if is_digits(parts[i][1:]):
+                    parts[i] = parts[i][1:]
+            partL = parts[i].lower()
+            if partL in PackageInfo.X64S:
+                arch = "64bit"
+                # Always do 64-bit first so that x86_64 is found
+                # before x86.
+            elif partL in PackageInfo.X32S:
+                arch = "32bit"
+            elif partL == "x86":
+                if (len(parts) > i + 1) and (parts[i+1] == "64"):
+                    arch = "64bit"
+                else:
+                    arch = "32bit"
+            elif partL in PackageInfo.NOARCHES:
+                arch = "noarch"
+            if partL in PackageInfo.LINS:
+                platform_name = "Linux"
+                platformI = i
+            elif partL in PackageInfo.WINS:
+                platform_name = "Windows"
+                platformI = i
+        parts, versionI = PackageInfo.join_version(
+            parts,
+            oldDelimiters=oldDelimiters
+        )
+        # ^ still do join_version, because the version may be
+        # #   multiple parts such as in ['Slic3r', '1.3.1', 'dev']
+    nameEnder = -1
+    if versionI > -1:
+        nameEnder = versionI
+    if platformI > -1:
+        if nameEnder < 0 or (platformI < nameEnder):
+            nameEnder = platformI
+    return (fnamePartial, tuple(parts), versionI, nameEnder, arch,
+            platform_name)
+
+
+@lru_cache(maxsize=1024)
+def parse_package_name(fname, casedName=None, luid=None, version=None,
+                       caption=None, removeExt=True, dry_run=False):
+    '''
+    Get the name, version and other metadata from a file or directory
+    name without any side effects (no metadata, filesystem or output),
+    so the result is cached and several PackageInfo objects for the
+    same source only parse it once.
+
+    Sequential arguments:
+    fname -- The file or directory name (not a path).
+
+    Keyword arguments:
+    casedName, luid, version, caption -- Hints that are used instead of
+        parsing them (See PackageInfo).
+    removeExt -- Remove the extension (such as for a file but not a
+        directory).
+    dry_run -- Return a version of None instead of raising
+        NoVersionError if the name has no delimiters and no version
+        was specified.
+
+    Returns:
+    A PackageName.
+    '''
+    (fnamePartial, parts, versionI, nameEnder, arch,
+     platform_name) = _scan_package_name(fname, removeExt)
+    if (len(parts) < 2) and (version is None) and (not dry_run):
+        raise NoVersionError(fnamePartial)
+    if (version is None) and (versionI > -1):
+        # INFO: Any "v" prefix was already removed and multi-part
+        #       versions were already un-split into one part
+        #       using join_version.
+        version = parts[versionI]
+    specifiedName = casedName is not None
+    if casedName is None:
+        casedName = parts[0]
+        hyphenateI = find_startswith(hyphenate_names,
+                                     "-".join(parts), cs=False)
+        if hyphenateI >= 0:
+            lowerCaseParts = hyphenate_names[hyphenateI].split("-")
+            newPartsCount = len(lowerCaseParts)
+            casedName = "-".join(parts[:newPartsCount])
+            # ^ Reconstruct the uppercase name even though it will
+            #   become lowercase later (A lookup for luid based on a
+            #   partial name such as "ninja" from "ninja-ide" would be a
+            #   false positive for a program actually called "ninja").
+        elif nameEnder > 0:
+            casedName = " ".join(parts[:nameEnder])
+    annotation = get_annotation(fname)
+    suffix = ""
+    if annotation is not None:
+        suffix = "-" + annotation
+    if luid is None:
+        luid = toLUID(casedName)
+    if not specifiedName:
+        # only use a build-in cased name if not specified manually
+        tryCasedName = casedNames.get(luid)
+        if tryCasedName is not None:
+            casedName = tryCasedName
+        elif casedName.lower() == casedName:
+            casedName = casedName.title()
+    if caption is None:
+        caption = casedName
+        if versionI > -1:
+            caption += " " + parts[versionI]
+        if annotation is not None:
+            if not caption.endswith(" (" + annotation + ")"):
+                caption += " (" + annotation + ")"
+    return PackageName(casedName, luid, version, caption, arch,
+                       platform_name, suffix)
+
+
+def _parse_entry(entry):
+    '''
+    Parse a (path, is_dir) tuple for PackageInfo.parse_many (This is
+    not a method so a process pool can send it to other processes).
+    '''
+    path, is_dir = entry
+    if is_dir is None:
+        is_dir = os.path.isdir(path)
+    result = OrderedDict([('path', path), ('is_dir', is_dir)])
+    try:
+        parsed = parse_package_name(os.path.basename(path),
+                                    removeExt=not is_dir, dry_run=True)
+    except ValueError as ex:
+        result['error'] = str(ex)
+        return result
+    result.update(parsed._asdict())
+    return result
+
+
+def scan_entries(directory):
+    '''
+    Get a sorted list of (path, is_dir) tuples for the files and
+    directories in directory except hidden ones. The type comes from
+    os.scandir, so most filesystems don't need a stat call per entry.
+    '''
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.name.startswith("."):
+            continue
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = None
+            # ^ Let _parse_entry check it.
+        entries.append((entry.path, is_dir))
+    entries.sort()
+    return entries
+
+
+def inspect_dir(directory, processes=None):
+    '''
+    Write the name, version, arch and platform detected from each file
+    or directory name in directory to stdout as JSON lines (one object
+    per line; See PackageInfo.parse_many).
+
+    Keyword arguments:
+    processes -- Parse using this many processes (See parse_many).
+
+    Returns:
+    0 if successful, otherwise 1 (for use as an exit code).
+    '''
+    if not os.path.isdir(directory):
+        echo0("Error: '{}' is not a directory.".format(directory))
+        return 1
+    for result in PackageInfo.parse_many(scan_entries(directory),
+                                         processes=processes):
+        sys.stdout.write(json.dumps(result) + "\n")
+    return 0
+
+
+DESKTOP_INSPECT_KEYS = ["Name", "Exec", "Icon", "Version", "Categories"]
+# ^ Values of each .desktop file shown by inspect_archive.
+
+
+def parse_desktop_entry(data):
+    '''
+    Get the [Desktop Entry] values from the content of a .desktop file.
+
+    Sequential arguments:
+    data -- The content as bytes.
+
+    Returns:
+    An OrderedDict of the keys in DESKTOP_INSPECT_KEYS that are present.
+    '''
+    values = {}
+    section = None
+    for line in data.decode('utf-8', 'replace').splitlines():
+        line = line.strip()
+        if line.startswith("[") and line.endswith("]"):
+            section = line[1:-1]
+        elif (section == "Desktop Entry") and ("=" in line):
+            key, value = line.split("=", 1)
+            values.setdefault(key.strip(), value.strip())
+    return OrderedDict((key, values[key]) for key in DESKTOP_INSPECT_KEYS
+                       if key in values)
+
+
+def inspect_archive(path):
+    '''
+    Write what inspect_dir shows for a tar archive, plus the icons and
+    the values of each .desktop file in it, to stdout as a JSON object
+    without extracting the archive. The .desktop files are read using
+    the seek index of the archive (See SeekIndex in seekindex.py) from
+    seekIndexPath, which is saved while installing the archive with
+    --cache, or else built by reading the archive once, so after that
+    only the .desktop files are decompressed.
+
+    Returns:
+    0 if successful, otherwise 1 (for use as an exit code).
+    '''
+    import tarfile
+    from nopackage.seekindex import SeekIndex
+    try:
+        index = SeekIndex.load_or_build(seekIndexPath, path)
+    except (ValueError, tarfile.TarError) as ex:
+        echo0("Error: {}".format(ex))
+        return 1
+    result = _parse_entry((path, False))
+    names = index.names()
+    result['icons'] = [name for name in names
+                       if os.path.splitext(name)[1].lower() in ICON_DOT_EXTS
+                       and ("/icons/" in name or "/pixmaps/" in name)]
+    result['desktop_entries'] = OrderedDict(
+        (name, parse_desktop_entry(index.read_member(name)))
+        for name in names if name.endswith(".desktop")
+    )
+    sys.stdout.write(json.dumps(result) + "\n")
+    return 0
+
+
+def save_seek_index(path, archive):
+    '''
+    Save the seek index of a tar archive from the member offsets
+    recorded while it was extracted (See SeekIndex.from_members), so
+    inspect_archive doesn't have to read the archive again.
+
+    Sequential arguments:
+    path -- The archive.
+    archive -- The TarArchive after extract.
+    '''
+    from nopackage.seekindex import (
+        SEEKABLE_COMPRESSIONS,
+        SeekIndex,
+    )
+    if archive.compression not in SEEKABLE_COMPRESSIONS:
+        return
+    try:
+        SeekIndex.from_members(path, archive.compression,
+                               archive.offsets).save(seekIndexPath)
+    except (OSError, ValueError) as ex:
+        logLn("* could not save the seek index of {}: {}".format(path, ex))
+
+
 def dir_is_empty(folder_path):
     count = 0
     sub_names = os.listdir(folder_path)
@@ -1901,40 +2141,95 @@ def dir_is_empty(folder_path):
 
 OLD_CONFS = get_unique_path("install_any", "Configs:Unique")
 MY_CONFS = get_unique_path("nopackage", "Configs:Unique")  # formerly myAppData
-if not os.path.isdir(MY_CONFS):
-    os.makedirs(MY_CONFS)
+# ^ created on first use (See ensure_initialized)
 
 oldLMP = os.path.join(OLD_CONFS, "local_machine.json")
 localMachineMetaPath = os.path.join(MY_CONFS, "local_machine.json")
+metaStorePath = os.path.join(MY_CONFS, "local_machine.sqlite3")
+# ^ If present, it is used instead of local_machine.json
+#   (See `nopackage migrate`).
+extractionCachePath = os.path.join(
+    os.environ.get('XDG_CACHE_HOME',
+                   os.path.join(os.path.expanduser("~"), ".cache")),
+    "nopackage",
+    "extracted",
+)
+# ^ Only used with --cache (See ExtractionCache in extractcache.py).
+seekIndexPath = os.path.join(os.path.dirname(extractionCachePath),
+                             "seekindex")
+# ^ Member offsets of tar archives (See inspect_archive).
+scanCachePath = os.path.join(os.path.dirname(extractionCachePath), "scan")
+# ^ Names parsed by `nopackage scan` (See ScanCache in scancache.py).
+defaultCacheQuota = 4 * 1024 * 1024 * 1024  # bytes
 oldLP = os.path.join(OLD_CONFS, "install_any.log")
 logPath = os.path.join(MY_CONFS, "nopackage.log")
 
-echo0('[nopackage] logPath="{}"'.format(logPath))
 
-if os.path.isfile(oldLMP):
-    if not os.path.isfile(localMachineMetaPath):
-        shutil.move(oldLMP, localMachineMetaPath)
-        echo0("* migrated old metadata:")
-        echo0("mv {} {}"
-              "".format(sh_literal(oldLMP),
-                        sh_literal(localMachineMetaPath)))
-if os.path.isfile(oldLP):
-    if not os.path.isfile(logPath):
-        shutil.move(oldLP, logPath)
-        echo0("* migrated an old log:")
-        echo0("mv {} {}"
-              "".format(sh_literal(oldLP), sh_literal(logPath)))
+def migrate_old_confs():
+    '''
+    Move the metadata and log from the old install_any configuration
+    directory if present.
+    '''
+    if os.path.isfile(oldLMP):
+        if not os.path.isfile(localMachineMetaPath):
+            shutil.move(oldLMP, localMachineMetaPath)
+            echo0("* migrated old metadata:")
+            echo0("mv {} {}"
+                  "".format(sh_literal(oldLMP),
+                            sh_literal(localMachineMetaPath)))
+    if os.path.isfile(oldLP):
+        if not os.path.isfile(logPath):
+            shutil.move(oldLP, logPath)
+            echo0("* migrated an old log:")
+            echo0("mv {} {}"
+                  "".format(sh_literal(oldLP), sh_literal(logPath)))
+        else:
+            echo0("WARNING: There is an old {} which should be prepended"
+                  " to the new {}."
+                  "".format(sh_literal(oldLP), sh_literal(logPath)))
     else:
-        echo0("WARNING: There is an old {} which should be prepended to"
-              " the new {}."
-              "".format(sh_literal(oldLP), sh_literal(logPath)))
-else:
-    pass
-    # echo0("INFO: There is no {}".format(oldLP))
+        pass
+        # echo0("INFO: There is no {}".format(oldLP))
 
-localMachine = {
-    'programs': {}
-}
+
+localMachine = None
+# ^ Only the JSON backend uses this (loaded on first use--See metaStore).
+compactLocalMachine = False
+# ^ If True, save local_machine.json without indentation (faster for
+#   large registries). Set by --compact-metadata.
+metaStore = None
+# ^ The MetaStore behind getDeepValue, setDeepValue, addDeepValue etc.
+#   (loaded on first use--See getMetaStore).
+_initialized = False
+
+
+def ensure_initialized():
+    '''
+    Do the setup that importing nopackage doesn't do, so that importing
+    it is fast and has no side effects: Create the configuration
+    directory, migrate old files, load (or regenerate) the metadata, and
+    generate icon names. This only runs once, and is called
+    automatically by any function that needs it.
+    '''
+    global _initialized
+    if _initialized:
+        return
+    _initialized = True
+    init_icon_names()
+    if not os.path.isdir(MY_CONFS):
+        os.makedirs(MY_CONFS)
+    echo0('[nopackage] logPath="{}"'.format(logPath))
+    migrate_old_confs()
+    load_metadata()
+
+
+def getMetaStore():
+    '''
+    Get the MetaStore for the metadata of installed programs (loaded on
+    first use).
+    '''
+    ensure_initialized()
+    return metaStore
 
 
 def fillProgramMeta(programMeta):
@@ -1959,7 +2254,18 @@ def fillProgramMeta(programMeta):
     return programMeta
 
 
-if not os.path.isfile(localMachineMetaPath):
+def generate_local_machine():
+    '''
+    Reconstruct the metadata from nopackage.log (only used when there is
+    no local_machine.json) and save it as local_machine.json.
+
+    Returns:
+    a dict in the localMachine format (empty if there is no log).
+    '''
+    from nopackage.metastore import write_json_atomic
+    localMachine = {
+        'programs': {}
+    }
     if os.path.isfile(logPath):
         echo0("* generating {} from {}"
               "".format(localMachineMetaPath, logPath))
@@ -2088,27 +2394,118 @@ if not os.path.isfile(localMachineMetaPath):
         echo0("")
         echo0("localMachine: {}"
               "".format(json.dumps(localMachine, indent=2)))
-        with open(localMachineMetaPath, 'w') as outs:
-            json.dump(localMachine, outs, indent=2)
-else:
-    with open(localMachineMetaPath, 'r') as ins:
-        localMachine = json.load(ins)
+        write_json_atomic(localMachineMetaPath, localMachine,
+                          compact=compactLocalMachine)
+    return localMachine
+
+
+def load_metadata():
+    '''
+    Load the metadata of installed programs into metaStore (and into
+    localMachine if using local_machine.json).
+    '''
+    global localMachine
+    global metaStore
+    from nopackage.metastore import (
+        JSONMetaStore,
+        SQLiteMetaStore,
+    )
+    if os.path.isfile(metaStorePath):
+        metaStore = SQLiteMetaStore(metaStorePath)
+        localMachine = None
+        echo0("* using installed programs metadata: {}"
+              "".format(metaStorePath))
+        return
+    if not os.path.isfile(localMachineMetaPath):
+        localMachine = generate_local_machine()
+    else:
+        with open(localMachineMetaPath, 'r') as ins:
+            localMachine = json.load(ins)
+
+        echo0("* using installed programs metadata: {}"
+              "".format(localMachineMetaPath))
+    metaStore = JSONMetaStore(localMachineMetaPath, localMachine)
+
 
-    echo0("* using installed programs metadata: {}"
-          "".format(localMachineMetaPath))
 fm = None
 
 
 def saveLocalMachine():
-    with open(localMachineMetaPath, 'w') as outs:
-        json.dump(localMachine, outs, indent=2)
+    store = getMetaStore()
+    store.compact = compactLocalMachine
+    store.save()
 
 
 enableSaveOnWrite = True
+localMachineUnsaved = False
+# ^ True when a change was made while enableSaveOnWrite was False.
+_transactionDepth = 0
+
+
+def localMachineChanged():
+    '''
+    Save metaStore, or only mark it as unsaved if saving is deferred
+    (enableSaveOnWrite is False, such as during a
+    localMachineTransaction).
+    '''
+    global localMachineUnsaved
+    if enableSaveOnWrite:
+        saveLocalMachine()
+        localMachineUnsaved = False
+    else:
+        localMachineUnsaved = True
+
+
+@contextmanager
+def localMachineTransaction():
+    '''
+    Batch every change to the metadata made in the block into one save
+    at the end instead of one save per setDeepValue, addDeepValue or
+    deleteDeepValue call. If the block raises an exception (including
+    KeyboardInterrupt), the metadata is rolled back to the state it had
+    before the block and nothing is saved.
+
+    A nested transaction joins the outermost one, so only the outermost
+    transaction saves (or rolls back).
+
+    Example:
+    with localMachineTransaction():
+        setProgramValue(luid, 'installed', True)
+        setProgramValue(luid, 'dst_path', dst_path)
+    '''
+    global enableSaveOnWrite
+    global localMachineUnsaved
+    global _transactionDepth
+    if _transactionDepth > 0:
+        _transactionDepth += 1
+        try:
+            yield
+        finally:
+            _transactionDepth -= 1
+        return
+    getMetaStore().begin()
+    prevSaveOnWrite = enableSaveOnWrite
+    prevUnsaved = localMachineUnsaved
+    enableSaveOnWrite = False
+    localMachineUnsaved = False
+    _transactionDepth = 1
+    try:
+        yield
+    except BaseException:
+        metaStore.rollback()
+        localMachineUnsaved = prevUnsaved
+        raise
+    finally:
+        _transactionDepth = 0
+        enableSaveOnWrite = prevSaveOnWrite
+    if localMachineUnsaved and enableSaveOnWrite:
+        saveLocalMachine()
+        localMachineUnsaved = False
 
 
 def logLn(line, path=logPath):
     print("[logged]:" + line)
+    ensure_initialized()  # Make sure MY_CONFS exists.
     global fm
     if fm is None:
         fm = 'w'
@@ -2119,6 +2516,224 @@ def logLn(line, path=logPath):
         fm = 'a'
 
 
+def detect_binary(tree, src_name):
+    '''
+    Detect the binary (or script) that runs the program.
+
+    Sequential arguments:
+    tree -- A DirectoryTree or MemberTree (See nopackage.trees), so the
+        detection can run on the member list of an archive before it is
+        extracted.
+    src_name -- The name of the program directory (such as
+        "blender-2.79b-linux-glibc219-x86_64"), which the binary name is
+        usually derived from.
+
+    Returns:
+    The path of the binary relative to the tree, or None if the binary
+    could not be detected.
+    '''
+    from nopackage.headers import (
+        SCORES,
+        host_bits,
+        read_headers,
+    )
+    arch_suffixes = ["64", ".x86_64"]
+    if host_bits() == 32:
+        arch_suffixes = ["32", ".x86"]
+    print("* trying to detect {} binary...".format(arch_suffixes))
+    only_name = src_name.strip("-0123456789. ")
+    name_parts = src_name.split("-")
+    try_name = name_parts[0]
+    try_names = []
+    if src_name not in hyphenate_names:
+        name_partial0 = src_name.split("-")[0]
+    else:
+        name_partial0 = src_name
+    for name_partial in (name_partial0, name_partial0.lower()):
+        try_names.append(name_partial + ".sh")
+        try_names.append(name_partial + ".py")
+        for arch_suffix in arch_suffixes:
+            try_names.append(name_partial + arch_suffix)
+            try_names.append(name_partial + "." + arch_suffix)
+        # ^ sh takes priority in case environment vars are necessary
+        try_names.append(name_partial)
+        if len(src_name.split("-")) > 1:
+            try_names.append(src_name.split("-")[1] + ".sh")
+            # ^ such as studio.sh for android-studio
+        print("  src_name: {}".format(src_name))
+        print("  only_name: {}".format(only_name))
+        print("  name_partial: {}".format(name_partial))
+
+    if len(name_parts) > 1:
+        try_names.append("-".join(name_parts[:2]))  # e.g. boscaceoil-blue
+    by_prefix = []
+    # ^ For the root then bin, a dict of {prefix: names} where prefix is
+    #   any part of a name before a "-", so each directory is listed
+    #   once instead of once per try_name.
+    for this_parent in ("", "bin"):
+        prefixes = {}
+        if tree.isdir(this_parent):
+            for sub in tree.listdir(this_parent):
+                for i in range(len(sub)):
+                    if sub[i] == "-":
+                        prefixes.setdefault(sub[:i], []).append(sub)
+        by_prefix.append((this_parent, prefixes))
+    try_paths = []
+    for try_name in try_names:
+        try_paths.append(os.path.join("bin", try_name))
+        try_paths.append(try_name)
+        for this_parent, prefixes in by_prefix:
+            for sub in prefixes.get(try_name, ()):
+                # Such as Godot programs ("boscaceoil-blue.x86_64" etc)
+                # (since arch_suffixes fails when name itself has "-"
+                try_paths.append(os.path.join(this_parent, sub))
+    found_paths = []
+    for try_path in try_paths:
+        if (try_path not in found_paths) and tree.isfile(try_path):
+            found_paths.append(try_path)
+    headers = read_headers(tree, found_paths)
+    # ^ Only the first 64 bytes of each (See nopackage.headers).
+    for try_path in found_paths:
+        kind, machine, score = headers[try_path]
+        if score == SCORES['elf-foreign']:
+            print("  - \"{}\" is for another architecture (ELF machine {})"
+                  "".format(try_path, machine))
+            continue
+        print("* detected binary: '{}'".format(try_path))
+        return try_path
+
+    enable_force_script = False
+    all_files = tree.listdir()
+    scripts = []
+    jars = []
+    candidates = []
+    for sub in all_files:
+        ext = os.path.splitext(sub)[1].strip(".")
+        if sub.startswith("."):
+            continue
+        if ext.lower() in PackageInfo.NON_BIN_EXTS:
+            continue
+        if sub.lower() in PackageInfo.NON_BIN_NOEXTS:
+            # exclude these regardless of ext since '' in BIN_EXTS
+            #   (such as "LICENSE")
+            continue
+        if tree.isdir(sub):
+            print("  - \"{}\" is a directory".format(sub))
+            continue
+        candidates.append(sub)
+    headers = read_headers(tree, candidates)
+    for sub in candidates:
+        ext = os.path.splitext(sub)[1].strip(".")
+        kind, _, score = headers[sub]
+        named_bin = ((ext in PackageInfo.BIN_EXTS)
+                     and ((ext != "") or tree.is_executable(sub)))
+        # ^ Such as run.sh, which is 'data' if it has no shebang.
+        if sub.endswith(".jar") or (kind == 'jar'):
+            jars.append(sub)
+        elif score == SCORES['elf-foreign']:
+            logger.warning(
+                "SKIPPED \"{}\" since it is for another architecture."
+                .format(sub))
+        elif (score < 0) and not named_bin:
+            logger.warning(
+                "SKIPPED \"{}\" since the content is {} (not a program)."
+                .format(sub, kind))
+        elif ext in PackageInfo.BIN_EXTS:
+            scripts.append(sub)
+            logger.warning(
+                "Adding \"{}\" since in {}"
+                .format(sub, PackageInfo.BIN_EXTS))
+        elif (kind in ('elf', 'script')) and (ext != "so") \
+                and (".so." not in sub):
+            scripts.append(sub)
+            logger.warning(
+                "Adding \"{}\" since the content is {}"
+                .format(sub, kind))
+        elif not tree.is_executable(sub):
+            logger.warning(
+                "SKIPPED \"{}\" since not executable, jar, nor {}."
+                .format(sub, PackageInfo.BIN_EXTS))
+    if len(scripts) >= 2:
+        bad_indices = []
+        good_indices = []
+        for i in range(len(scripts)):
+            script = scripts[i]
+            if script.startswith(only_name):
+                good_indices.append(i)
+            elif script in known_binaries:
+                good_indices.append(i)
+            else:
+                bad_indices.append(i)
+        if len(good_indices) == 1:
+            for bad_ii in range(len(bad_indices)-1, -1, -1):
+                bad_i = bad_indices[bad_ii]
+                del scripts[bad_i]
+            print("  only one matches \"{}\"".format(only_name))
+            enable_force_script = True
+    if len(scripts) >= 2:
+        best = max(headers[sub][2] for sub in scripts)
+        top = [sub for sub in scripts if headers[sub][2] == best]
+        if len(top) == 1:
+            print("  only \"{}\" is {}".format(top[0], headers[top[0]][0]))
+            # ^ Such as a program for this architecture beside scripts.
+            scripts = top
+            enable_force_script = True
+    if len(scripts) == 2:
+        short_i = 0
+        long_i = 1
+        if len(scripts[0]) > len(scripts[1]):
+            short_i = 1
+            long_i = 0
+        # TODO: sName = scripts[short_i]
+        lName = scripts[long_i]
+        if lName.startswith(os.path.splitext(lName)):
+            # if has something like argouml.sh and
+            # argouml2.sh (experimental), use argouml.sh.
+            logger.warning(
+                "Excluding \"{}\" icon since longer than \"{}\""
+                .format(scripts[long_i], scripts[short_i]))
+            del scripts[long_i]
+    if len(scripts) > 1:
+        for known_binary in known_binaries:
+            if known_binary in scripts:
+                scripts = [known_binary]
+                logger.warning(
+                    "Choosing {} since it is a known_binary name"
+                    .format(scripts[0]))
+                break
+    if len(jars) > 0:
+        enable_force_script = True
+
+    if (len(scripts) > 0) and (enable_force_script or (len(scripts) == 1)):
+        print("* detected executable script: '{}'".format(scripts[0]))
+        return scripts[0]
+    print("* could not detect binary in {}"
+          "".format(all_files))
+    print("  jars: {}".format(jars))
+    print("  scripts: {}".format(scripts))
+    # if len(scripts) == 1:
+    #     print("  - There is only {} script.")
+    return None
+
+
+def verified_sha256(sums_path, path, digest):
+    '''
+    Check the digest of path against a SHA256SUMS file (See
+    nopackage.integrity.verify_sha256sums) and show the result.
+
+    Returns:
+    True if path is listed with the same digest, otherwise False.
+    '''
+    from nopackage.integrity import verify_sha256sums
+    try:
+        verify_sha256sums(sums_path, path, digest)
+    except ValueError as ex:
+        print("ERROR: nothing was installed since {}".format(ex))
+        return False
+    print("* verified '{}' using '{}'".format(path, sums_path))
+    return True
+
+
 def install_program_in_place(src_path, **kwargs):
     """
     Install or uninstall the application.
@@ -2174,7 +2789,53 @@ def install_program_in_place(src_path, **kwargs):
     original_src (str): The original src arg passed by the caller, for
         generating accurate instructions in case of errors.
         Defaults to src_path.
+
+    jobs -- The number of threads for extracting a zip file (None for
+        the number of CPUs). Other archives are extracted by one thread.
+        It is also the number of threads for copying a directory from
+        another filesystem or deleting one (See nopackage.fileops).
+
+    use_cache -- Keep the extracted archive in the extraction cache (See
+        extractionCachePath), and if the same archive (by SHA-256) is
+        installed again, link the files from there instead of
+        extracting it.
+
+    cache_quota -- The maximum size of the extraction cache in bytes
+        (default: defaultCacheQuota). The least recently used archives
+        are removed from the cache to stay within it.
+
+    dedup -- Hard link files of the installed directory that are
+        identical to files of other installed programs (See
+        dedup_installed).
+
+    sha256sums -- The path of a SHA256SUMS file. If set, the install
+        stops before anything is installed unless the source file (or
+        archive) is listed in it with the same SHA-256.
+
+    archive_sha256 -- The SHA-256 of the archive that src_path came
+        from (only set by the deb case when calling itself).
+
+    The SHA-256 of the source file (or archive) is recorded as
+    'archive_sha256' in the metadata if it is known, and for tar and
+    zip archives, 'manifest' is set to {relative path: [size, mode,
+    sha256]} for each installed file (See nopackage.integrity). A tar
+    or deb is hashed while it is extracted, but a zip or other file is
+    only read again for the digest if sha256sums (or use_cache for a
+    zip that isn't known to the cache yet) needs it.
+
+    All metadata changes are saved once at the end (See
+    localMachineTransaction), or discarded if an exception occurs.
     """
+    ensure_initialized()
+    with localMachineTransaction():
+        return _install_program_in_place(src_path, **kwargs)
+
+
+def _install_program_in_place(src_path, **kwargs):
+    '''
+    Install or uninstall the application without a transaction. Call
+    install_program_in_place instead (See its documentation).
+    '''
     original_src = kwargs.get('original_src')
     if not original_src:
         original_src = src_path
@@ -2200,11 +2861,38 @@ def install_program_in_place(src_path, **kwargs):
     move_what = kwargs.get("move_what")
     print("move_what: {}".format(move_what))
     pull_back = kwargs.get("pull_back")
+    jobs = kwargs.get("jobs")
+    use_cache = kwargs.get("use_cache")
+    cache_quota = kwargs.get("cache_quota")
+    if cache_quota is None:
+        cache_quota = defaultCacheQuota
+    dedup = kwargs.get("dedup")
+    sha256sums = kwargs.get("sha256sums")
+    archive_sha256 = kwargs.get("archive_sha256")
+    file_manifest = None
+    binary_mode_set = False
+    # ^ True if the archive stores an executable mode for the binary,
+    #   which extract already set (so no chmod is needed).
 
-    enable_force_script = False
     dst_programs = lib64  # changed if deb has a different programs dir
     if '32' in platform.architecture()[0]:
         dst_programs = lib
+    from nopackage.fileops import (
+        delete_tree,
+        move_path,
+    )
+    from nopackage.staging import (
+        clean_staging,
+        commit_staged,
+        make_staging_dir,
+    )
+    from nopackage.trash import resume_purge
+    from nopackage.versions import version_key
+    staging_programs = dst_programs
+    # ^ Where temporary directories are made, even if dst_programs is
+    #   changed (so clean_staging finds them after a stopped install).
+    clean_staging(staging_programs)
+    resume_purge(staging_programs)
     dirname = None
     dirpath = None
     ex_tmp = None
@@ -2217,7 +2905,14 @@ def install_program_in_place(src_path, **kwargs):
     # if luid is None:
     if not os.path.isfile(src_path):
         tryLuid = os.path.basename(src_path)
-        knownMeta = localMachine['programs'].get(tryLuid)
+        knownMeta = getMetaStore().get_entry('programs', tryLuid)
+        if knownMeta is None:
+            # Try the source path of a previous install (such as an
+            #   AppImage that was moved to the programs directory).
+            foundLuids = getMetaStore().find('programs', 'src_path', src_path)
+            if len(foundLuids) == 1:
+                tryLuid = foundLuids[0]
+                knownMeta = getMetaStore().get_entry('programs', tryLuid)
     # if knownMeta is None:
     #     echo1('There is no meta for "{}"'.format(src_path))
     # ^ In case src_path is a luid, get some metadata.
@@ -2266,49 +2961,40 @@ def install_program_in_place(src_path, **kwargs):
         else:
             enable_reinstall = True
             logLn("  * OK")
-        ex_tmp = tempfile.mkdtemp()
-        print("* extracting '{}' to '{}'...".format(src_path, ex_tmp))
-        ex_command = "cd '{}' && ar xv '{}'".format(ex_tmp, src_path)
-        # NOTE: Instead of `ar`, python-libarchive could also work.
-        cmd_return = os.system(ex_command)
-        if dir_is_empty(ex_tmp):
-            print("ERROR: `{}` did not result in any extracted files or"
-                  " directories in"
-                  " '{}'".format(ex_command, ex_tmp))
-            return False
-        elif cmd_return != 0:
-            print("ERROR: `{}` returned an error value"
-                  " ({})".format(ex_command, cmd_return))
-            return False
-        print("")
-        # tar = tarfile.open(src_path)
-        # tar.extractall(path=ex_tmp)
-        # tar.close()
-        next_path = os.path.join(ex_tmp, "data.tar.gz")
-        if not os.path.isfile(next_path):
-            next_path = os.path.join(ex_tmp, "data.tar.xz")
-        if not os.path.isfile(next_path):
-            print("ERROR: Extracting deb did not result in"
-                  " '{}'.".format(next_path))
-            print("Got:")
-            for sub in os.listdir(ex_tmp):
-                print(sub)
-            print()
-            shutil.rmtree(ex_tmp)
-            print("  * deleted {}.".format(ex_tmp))
-            return False
-        next_temp = tempfile.mkdtemp()
-        print("* extracting '{}'...".format(next_path))
+        next_temp = make_staging_dir(staging_programs)
+        # ^ On the same filesystem as the installed program, so moving
+        #   the program directory and icons out of it is only a rename.
+        print("* extracting '{}' to '{}'...".format(src_path, next_temp))
+        import tarfile
+        from nopackage.archives import (
+            DEB_NOT_PROGRAMS,
+            extract_deb_data,
+        )
+        from nopackage.integrity import (
+            HashingReader,
+            verify_sha256sums,
+        )
+        # ^ The data.tar.* member is streamed from the deb, and only the
+        #   program directories and icons are extracted (See
+        #   deb_member_filter), so there is no `ar` subprocess nor any
+        #   intermediate file. The deb is hashed during the same read.
         try:
-            tar = tarfile.open(next_path)
-            tar.extractall(path=next_temp)
-            tar.close()
-        except tarfile.ReadError:
-            print("ERROR: tar could not extract '{}'".format(next_path))
+            with open(src_path, 'rb') as ins:
+                reader = HashingReader(ins)
+                data_name, backend = extract_deb_data(reader, next_temp)
+                reader.drain()
+            archive_sha256 = reader.hexdigest()
+            if sha256sums:
+                verify_sha256sums(sha256sums, src_path, archive_sha256)
+        except (ValueError, tarfile.TarError) as ex:
+            print("ERROR: extracting the data.tar.* member of '{}' failed:"
+                  " {}".format(src_path, ex))
+            delete_tree(next_temp, workers=jobs)
+            print("  * deleted {}.".format(next_temp))
             return False
-        shutil.rmtree(ex_tmp)
-        # ^ Remove temporary directory containing only control.tar.gz,
-        #   data.tar.xz, and debian-binary.
+        next_path = "{}:{}".format(src_path, data_name)
+        logLn("* decompressor: {} for {}".format(backend, next_path))
+        print("")
 
         # Now next_temp should contain directories such as usr & etc.
         src_usr = os.path.join(next_temp, "usr")
@@ -2324,20 +3010,18 @@ def install_program_in_place(src_path, **kwargs):
                   " any of the following:"
                   " '{}'".format(next_temp, next_path,
                                  try_programs_paths))
-            shutil.rmtree(next_temp)
+            delete_tree(next_temp, workers=jobs)
             return False
         found_programs_paths = []
         sub_names = None
         for folder_path in try_programs_paths:
             if not os.path.isdir(folder_path):
                 continue
-            not_programs = ["applications", "icons", "doc", "pixmaps",
-                            "lintian"]
             sub_names = os.listdir(folder_path)
             for sub_name in sub_names:
                 sub_path = os.path.join(folder_path, sub_name)
                 if os.path.isdir(sub_path) and (sub_name[:1] != "."):
-                    if sub_name not in not_programs:
+                    if sub_name not in DEB_NOT_PROGRAMS:
                         found_programs_paths.append(sub_path)
                         print("found program dir: {}".format(sub_name))
         if len(found_programs_paths) == 0:
@@ -2353,7 +3037,7 @@ def install_program_in_place(src_path, **kwargs):
                     print("{} only contains:"
                           " {}".format(folder_path,
                                        os.listdir(folder_path)))
-            shutil.rmtree(next_temp)
+            delete_tree(next_temp, workers=jobs)
             print("* removed '{}'".format(next_temp))
             return False
         elif len(found_programs_paths) > 1:
@@ -2366,7 +3050,7 @@ def install_program_in_place(src_path, **kwargs):
                     found_programs_paths
                 )
             )
-            shutil.rmtree(next_temp)
+            delete_tree(next_temp, workers=jobs)
             print("* removed '{}'".format(next_temp))
             return False
         # program_temp = tempfile.mkdtemp()
@@ -2381,7 +3065,7 @@ def install_program_in_place(src_path, **kwargs):
             print("ERROR: source programs directory (directory"
                   " containing {}) was not"
                   " detected in deb.".format(program_path))
-            shutil.rmtree(next_temp)
+            delete_tree(next_temp, workers=jobs)
             print("* removed '{}'".format(next_temp))
             print("")
             raise RuntimeError("{} did not complete.".format(verb))
@@ -2409,7 +3093,7 @@ def install_program_in_place(src_path, **kwargs):
             if len(binaries) == 1:
                 binary_path = os.path.join(program_path, binaries[0])
             else:
-                shutil.rmtree(next_temp)
+                delete_tree(next_temp, workers=jobs)
                 if len(binaries) == 0:
                     print(
                         "ERROR: extracting '{}' from '{}' did not"
@@ -2460,7 +3144,7 @@ def install_program_in_place(src_path, **kwargs):
                             print("ERROR: moving '{}' to '{}'"
                                   " failed.".format(sub_path,
                                                     icon_path), e)
-                            shutil.rmtree(next_temp)
+                            delete_tree(next_temp, workers=jobs)
                             print("* removed '{}'".format(next_temp))
                             return False
                     icon_count += 1
@@ -2527,22 +3211,29 @@ def install_program_in_place(src_path, **kwargs):
             detect_program_parent=True,
             pull_back=pull_back,
             original_src=original_src,
+            archive_sha256=archive_sha256,
         )
-        shutil.rmtree(next_temp)
+        delete_tree(next_temp, workers=jobs)
         print("* removed '{}'".format(next_temp))
         return result
         # ^ return archive within extracted archive
         # end if deb (containing tar.xz)
 
     archive_categories = {}
-    archive_categories["tar"] = [".tar.bz2", ".tar.gz", ".tar.xz"]
+    archive_categories["tar"] = [".tar.bz2", ".tar.gz", ".tar.xz",
+                                 ".tar.zst", ".tar.lz4", ".tgz", ".tbz2",
+                                 ".tbz", ".txz", ".tzst", ".tar"]
+    # ^ The endings only determine dirname. The format and compression
+    #   are detected from the content (See sniff_format).
     archive_categories["zip"] = [".zip"]
     # found_ending = None
     ar_cat = None
     for category, endings in archive_categories.items():
         for ending in endings:
             if src_path.lower()[-(len(ending)):] == ending:
-                dirname = src_path[:-(len(ending))]
+                dirname = os.path.basename(src_path[:-(len(ending))])
+                # ^ Only the name (The destination is in dst_programs
+                #   not next to the archive).
                 echo1("* generated dirname {} from src_path {}"
                       "".format(dirname, src_path))
                 # found_ending = ending
@@ -2572,181 +3263,180 @@ def install_program_in_place(src_path, **kwargs):
                 break
     if (dirname is not None) and (not do_uninstall):
         move_what = 'directory'
-        ex_tmp = tempfile.mkdtemp()
-        print("* created '{}'".format(ex_tmp))
-        print("* enabling move from directory '{}'".format(ex_tmp))
-        sub_dirs = []
-        sub_files = []
-        print("* extracting '{}'...".format(src_path))
-        if ar_cat == "tar":
-            tar = tarfile.open(src_path)
-            tar.extractall(path=ex_tmp)
-            tar.close()
-        elif ar_cat == "zip":
-            with ZipFile(src_path, 'r') as zipfile:
-                zipfile.extractall(path=ex_tmp)
-        else:
-            raise NotImplementedError("There is no case for " + ar_cat)
-        print("* extracted '{}'".format(ex_tmp))
-        folder_path = ex_tmp
-        for sub_name in os.listdir(folder_path):
-            sub_path = os.path.join(folder_path, sub_name)
-            if os.path.isfile(sub_path):  # sub_name[:1]!="." and
-                sub_files.append(sub_path)
-            elif os.path.isdir(sub_path):
-                sub_dirs.append(sub_path)
-        dirpath = None
-        new_tmp = None
-        if (len(sub_dirs) == 1) and (len(sub_files) == 0):
-            dirpath = sub_dirs[0]
-            print("* detected program path '{}'".format(dirpath))
+        dirpath = os.path.join(dst_programs, dirname)
+        # ^ Extract to the staging directory then rename it to dirpath
+        #   (the same as dst_dirpath below unless detect_program_parent
+        #   changes dst_programs).
+        from nopackage.archives import (
+            ARCHIVE_CLASSES,
+            open_archive,
+            sniff_file,
+        )
+        sniffed_cat = sniff_file(src_path)[0]
+        if (sniffed_cat in ARCHIVE_CLASSES) and (sniffed_cat != ar_cat):
+            print("* '{}' is a {} file regardless of the name"
+                  "".format(src_path, sniffed_cat))
+            ar_cat = sniffed_cat
+        from nopackage.integrity import sha256_file
+        cache = None
+        cache_key = None
+        cached = None
+        if use_cache:
+            from nopackage.extractcache import ExtractionCache
+            cache = ExtractionCache(extractionCachePath, quota=cache_quota)
+            cache_key = cache.source_key(src_path)
+            if (cache_key is None) and (ar_cat == 'zip'):
+                cache_key = sha256_file(src_path)
+                # ^ A zip is not read in order while it is extracted, so
+                #   it is hashed once now (A tar is hashed while it is
+                #   extracted, then added by that key).
+            cached = cache.get(cache_key)
+        archive = None
+        tree = None
+        from nopackage.trees import DirectoryTree
+        if cached is not None:
+            tree = DirectoryTree(cache.tree_path(cache_key))
+            archive_root = cached['root']
+            member_count = "cached"
+            total_size = cached['size']
+            archive_sha256 = cache_key
         else:
-            dirpath = ex_tmp
-            print("* detected program path '{}'".format(dirpath))
-            new_tmp = tempfile.mkdtemp()
-            dirpath = os.path.join(new_tmp, dirname)
-            shutil.move(ex_tmp, dirpath)
-            print("* changed temp program path to '{}'".format(dirpath))
-        src_path = dirpath
-        move_what = 'directory'
+            try:
+                archive = open_archive(src_path, ar_cat)
+            except ValueError as ex:
+                # Such as if there is no decompressor for zstd.
+                print("ERROR: {}".format(ex))
+                return False
+            archive_root = None
+            if archive.listed:
+                tree = archive.tree()
+                archive_root = archive.root
+                member_count = len(archive.members)
+                total_size = archive.total_size()
+                archive_sha256 = cache_key
+                if (archive_sha256 is None) and sha256sums:
+                    archive_sha256 = archive.sha256
+                    # ^ Only read the whole zip if the digest is needed
+                    #   (Extracting it only reads each member).
+        try:
+            if os.path.isdir(dirpath) and not enable_reinstall:
+                raise FileExistsError(
+                    "ERROR: '{}' already exists."
+                    " Use the reinstall command"
+                    " to ERASE the entire directory!"
+                    .format(dirpath)
+                )
+            binary_relpath = None
+            if tree is not None:
+                # Make the install plan from the member list (or cached
+                #   tree) so a failed detection doesn't cost an
+                #   extraction.
+                binary_relpath = detect_binary(tree, archive_root or dirname)
+                if binary_relpath is None:
+                    print("ERROR: nothing was extracted since the binary"
+                          " could not be detected in '{}'"
+                          "".format(src_path))
+                    return False
+                print("* install plan: extract {} member(s) ({} bytes)"
+                      " of '{}' to '{}' (stripped top-level directory: {})"
+                      " and run '{}'"
+                      "".format(member_count, total_size, src_path,
+                                dirpath, archive_root, binary_relpath))
+                if sha256sums and not verified_sha256(
+                        sha256sums, src_path, archive_sha256):
+                    return False
+            stage = make_staging_dir(dst_programs)
+            staged_path = os.path.join(stage, dirname)
+            try:
+                if cached is not None:
+                    print("* linking '{}' from the extraction cache..."
+                          "".format(staged_path))
+                    cache.materialize(cache_key, staged_path)
+                    file_manifest = cache.load_files(cache_key)
+                else:
+                    print("* extracting '{}' to '{}'..."
+                          "".format(src_path, staged_path))
+                    logLn("* decompressor: {} for {}"
+                          "".format(archive.backend, src_path))
+                    archive.extract(staged_path, workers=jobs)
+                    file_manifest = archive.manifest
+                if binary_relpath is None:
+                    # A tar is only listed while it is extracted (Listing
+                    #   it first would decompress it twice), so detect the
+                    #   binary in the staged files before committing them.
+                    archive_root = archive.root
+                    archive_sha256 = archive.sha256
+                    # ^ Computed during extract, so it costs no read.
+                    binary_relpath = detect_binary(
+                        DirectoryTree(staged_path),
+                        archive_root or dirname,
+                    )
+                    if binary_relpath is None:
+                        print("ERROR: nothing was installed since the"
+                              " binary could not be detected in '{}'"
+                              "".format(src_path))
+                        delete_tree(stage, workers=jobs)
+                        return False
+                    print("* extracted {} member(s) ({} bytes) of '{}'"
+                          " (stripped top-level directory: {}) to run"
+                          " '{}'".format(len(archive.members),
+                                         archive.total_size(), src_path,
+                                         archive_root, binary_relpath))
+                    if sha256sums and not verified_sha256(
+                            sha256sums, src_path, archive_sha256):
+                        delete_tree(stage, workers=jobs)
+                        return False
+                if cached is None:
+                    binary_mode = archive.stored_mode(binary_relpath)
+                    binary_mode_set = bool(binary_mode
+                                           and (binary_mode & stat.S_IXUSR))
+                if os.path.isdir(dirpath):
+                    print("* removing '{}' to reinstall...".format(dirpath))
+                    trash_tree(dirpath)
+                    # ^ Only now, so the old version stays usable while
+                    #   the new one is extracted.
+                commit_staged(staged_path, dirpath)
+                print("* moved '{}' to '{}'".format(staged_path, dirpath))
+            except BaseException:
+                delete_tree(stage, workers=jobs)
+                print("* removed incomplete '{}'".format(staged_path))
+                raise
+            os.rmdir(stage)
+        finally:
+            if archive is not None:
+                archive.close()
+        if cache is not None:
+            if cached is None:
+                cache.add(cache_key or archive_sha256, dirpath,
+                          root=archive_root,
+                          source=src_path, files=file_manifest)
+                if archive.offsets:
+                    save_seek_index(src_path, archive)
+            stats = cache.stats()
+            logLn("* extraction cache {} for {} (hits: {}, misses: {},"
+                  " evictions: {}, size: {}/{} bytes)"
+                  "".format("hit" if cached is not None else "miss",
+                            src_path, stats['hits'], stats['misses'],
+                            stats['evictions'], stats['size'],
+                            stats['quota']))
+        src_path = os.path.join(dirpath, binary_relpath)
         print("* changed {} source to '{}'".format(verb, src_path))
+    elif sha256sums and (not do_uninstall) and os.path.isfile(src_path):
+        # Such as an AppImage (There is no extraction pass to hash it
+        #   during, so read it now).
+        from nopackage.integrity import sha256_file
+        archive_sha256 = sha256_file(src_path)
+        if not verified_sha256(sha256sums, src_path, archive_sha256):
+            return False
 
     if os.path.isdir(src_path):
         dirpath = src_path
-        import struct
-        arch_suffixes = ["64", ".x86_64"]
-        if struct.calcsize('P') * 8 == 32:
-            arch_suffixes = ["32", ".x86"]
-        print("* trying to detect {} binary...".format(arch_suffixes))
+        from nopackage.trees import DirectoryTree
         src_name = os.path.split(src_path)[-1]
-        only_name = src_name.strip("-0123456789. ")
-        name_parts = src_name.split("-")
-        try_name = name_parts[0]
-        try_names = []
-        if src_name not in hyphenate_names:
-            name_partial0 = src_name.split("-")[0]
-        else:
-            name_partial0 = src_name
-        for name_partial in (name_partial0, name_partial0.lower()):
-            try_names.append(name_partial + ".sh")
-            try_names.append(name_partial + ".py")
-            for arch_suffix in arch_suffixes:
-                try_names.append(name_partial + arch_suffix)
-                try_names.append(name_partial + "." + arch_suffix)
-            # ^ sh takes priority in case environment vars are necessary
-            try_names.append(name_partial)
-            if len(src_name.split("-")) > 1:
-                try_names.append(src_name.split("-")[1] + ".sh")
-                # ^ such as studio.sh for android-studio
-            print("  src_name: {}".format(src_name))
-            print("  only_name: {}".format(only_name))
-            print("  name_partial: {}".format(name_partial))
-
-        got_path = None
-        if len(name_parts) > 1:
-            try_names.append("-".join(name_parts[:2]))  # e.g. boscaceoil-blue
-        try_paths = []
-        for try_name in try_names:
-            try_paths.append(os.path.join(src_path, "bin", try_name))
-            try_paths.append(os.path.join(src_path, try_name))
-            for this_parent in (src_path, os.path.join(src_path, "bin")):
-                for sub in os.listdir(src_path):
-                    if sub.startswith(try_name + "-"):
-                        # Such as Godot programs ("boscaceoil-blue.x86_64" etc)
-                        # (since arch_suffixes fails when name itself has "-"
-                        try_paths.append(os.path.join(this_parent, sub))
-        for try_path in try_paths:
-            if os.path.isfile(try_path):
-                got_path = try_path
-                break
-
-        if got_path is not None:
-            print("* detected binary: '{}'".format(got_path))
-            src_path = got_path
-        else:
-            all_files = os.listdir(src_path)
-            scripts = []
-            jars = []
-            for sub in all_files:
-                sub_path = os.path.join(src_path, sub)
-                ext = os.path.splitext(sub)[1].strip(".")
-                if sub.startswith("."):
-                    continue
-                if ext.lower() in PackageInfo.NON_BIN_EXTS:
-                    continue
-                if sub.lower() in PackageInfo.NON_BIN_NOEXTS:
-                    # exclude these regardless of ext since '' in BIN_EXTS
-                    #   (such as "LICENSE")
-                    continue
-                if os.path.isdir(sub_path):
-                    print("  - \"{}\" is a directory".format(sub))
-                    continue
-                if sub.endswith(".jar"):
-                    jars.append(sub)
-                elif ext in PackageInfo.BIN_EXTS:
-                    scripts.append(sub)
-                    logger.warning(
-                        "Adding \"{}\" since in {}"
-                        .format(sub, PackageInfo.BIN_EXTS))
-                elif not os.access(sub_path, os.X_OK):
-                    logger.warning(
-                        "SKIPPED \"{}\" since not executable, jar, nor {}."
-                        .format(sub_path, PackageInfo.BIN_EXTS))
-            if len(scripts) >= 2:
-                bad_indices = []
-                good_indices = []
-                for i in range(len(scripts)):
-                    script = scripts[i]
-                    if script.startswith(only_name):
-                        good_indices.append(i)
-                    elif script in known_binaries:
-                        good_indices.append(i)
-                    else:
-                        bad_indices.append(i)
-                if len(good_indices) == 1:
-                    for bad_ii in range(len(bad_indices)-1, -1, -1):
-                        bad_i = bad_indices[bad_ii]
-                        del scripts[bad_i]
-                    print("  only one matches \"{}\"".format(only_name))
-                    enable_force_script = True
-            if len(scripts) == 2:
-                short_i = 0
-                long_i = 1
-                if len(scripts[0]) > len(scripts[1]):
-                    short_i = 1
-                    long_i = 0
-                # TODO: sName = scripts[short_i]
-                lName = scripts[long_i]
-                if lName.startswith(os.path.splitext(lName)):
-                    # if has something like argouml.sh and
-                    # argouml2.sh (experimental), use argouml.sh.
-                    logger.warning(
-                        "Excluding \"{}\" icon since longer than \"{}\""
-                        .format(scripts[long_i], scripts[short_i]))
-                    del scripts[long_i]
-            if len(scripts) > 1:
-                for known_binary in known_binaries:
-                    if known_binary in scripts:
-                        scripts = [known_binary]
-                        logger.warning(
-                            "Choosing {} since it is a known_binary name"
-                            .format(scripts[0]))
-                        break
-            if len(jars) > 0:
-                enable_force_script = True
-
-            if enable_force_script or (len(scripts) == 1):
-                src_path = os.path.join(src_path, scripts[0])
-                print("* detected executable script: '{}'"
-                      "".format(src_path))
-            else:
-                print("* could not detect binary in {}"
-                      "".format(all_files))
-                print("  jars: {}".format(jars))
-                print("  scripts: {}".format(scripts))
-                # if len(scripts) == 1:
-                #     print("  - There is only {} script.")
-                return False
+        binary_relpath = detect_binary(DirectoryTree(src_path), src_name)
+        if binary_relpath is None:
+            return False
+        src_path = os.path.join(src_path, binary_relpath)
 
     if src_path is None:
         usage()
@@ -2798,11 +3488,11 @@ def install_program_in_place(src_path, **kwargs):
                   " detected.".format(src_path))
             if ex_tmp is not None:
                 if os.path.isdir(ex_tmp):
-                    shutil.rmtree(ex_tmp)
+                    delete_tree(ex_tmp, workers=jobs)
                     print("* removed '{}'".format(ex_tmp))
             if new_tmp is not None:
                 if os.path.isdir(new_tmp):
-                    shutil.rmtree(new_tmp)
+                    delete_tree(new_tmp, workers=jobs)
                     print("* removed '{}'".format(new_tmp))
             echo0("")
             echo0("{} did not complete.".format(verb.title()))
@@ -3091,6 +3781,7 @@ def install_program_in_place(src_path, **kwargs):
                 if not os.path.isfile(icon_path):
                     print("* downloading \"{}\" to \"{}\"..."
                           "".format(try_icon_url, icon_path))
+                    from hierosoft.moreweb import download
                     with open(icon_path, 'wb') as f:
                         download(
                             f,
@@ -3182,8 +3873,15 @@ def install_program_in_place(src_path, **kwargs):
         echo0("* using setting for move_what: {}"
               "".format(move_what))
     if dirname is not None:
-        dst_dirpath = os.path.join(dst_programs, dirname)
-        setProgramValue(luid, 'dst_dirpath', dst_dirpath)
+        if do_uninstall and (try_dst_dirpath is not None):
+            echo0("* using the recorded dst_dirpath '{}'"
+                  "".format(dst_dirpath))
+            # ^ Remove it from wherever it was installed (Older versions
+            #   installed archives next to the archive instead of in
+            #   dst_programs).
+        else:
+            dst_dirpath = os.path.join(dst_programs, dirname)
+            setProgramValue(luid, 'dst_dirpath', dst_dirpath)
     '''
     is_what = None
     if os.path.isfile(dst_path):
@@ -3281,7 +3979,7 @@ def install_program_in_place(src_path, **kwargs):
             if not do_uninstall:
                 print("mv \"{}\" \"{}\"".format(src_path, dst_path))
                 if src_path != dst_path:
-                    shutil.move(src_path, dst_path)
+                    move_path(src_path, dst_path)
                     logLn("install_file:{}".format(dst_path))
                     setProgramValue(luid, 'installed', True)
                 else:
@@ -3294,7 +3992,7 @@ def install_program_in_place(src_path, **kwargs):
                     if not os.path.isfile(src_path) and pull_back:
                         print("mv \"{}\" \"{}\""
                               "".format(dst_path, src_path))
-                        shutil.move(dst_path, src_path)
+                        move_path(dst_path, src_path)
                         logLn("uninstall_file:{}".format(dst_path))
                         logLn("recovered_to:{}".format(src_path))
                         setProgramValue(luid, 'installed', False)
@@ -3323,7 +4021,7 @@ def install_program_in_place(src_path, **kwargs):
             if os.path.isdir(dst_dirpath):
                 if not os.path.isfile(src_path) and pull_back:
                     print("mv \"{}\" \"{}\"".format(dst_path, src_path))
-                    shutil.move(dst_dirpath, src_path)
+                    move_path(dst_dirpath, src_path, workers=jobs)
                     logLn("recovered_to:{}".format(src_path))
                     setProgramValue(luid, 'src_path', src_path)
                     setProgramValue(luid, 'dst_path', dst_path)
@@ -3332,7 +4030,16 @@ def install_program_in_place(src_path, **kwargs):
                               " \"{}\" was moved to \"{}\"."
                               "".format(dst_path, src_path))
                 else:
-                    shutil.rmtree(dst_dirpath)
+                    if multiVersion:
+                        manifest = getDeepValue('packages', sc_name,
+                                                'manifest')
+                    else:
+                        manifest = getProgramValue(luid, 'manifest')
+                    if manifest:
+                        release_dedup_objects(dst_dirpath, manifest)
+                        # ^ Before trashing it, while the paths in the
+                        #   manifest are still valid.
+                    trash_tree(dst_dirpath, files=manifest)
             else:
                 print("There is no '{}'.".format(dst_dirpath))
             logLn("uninstall_dir:{}".format(dst_dirpath))
@@ -3344,7 +4051,7 @@ def install_program_in_place(src_path, **kwargs):
             print("mv '{}' '{}'".format(dirpath, dst_dirpath))
             if os.path.isdir(dst_dirpath) and (dirpath != dst_dirpath):
                 if enable_reinstall:
-                    shutil.rmtree(dst_dirpath)
+                    trash_tree(dst_dirpath)
                 else:
                     error = (
                         "ERROR: '{}' already exists."
@@ -3361,8 +4068,12 @@ def install_program_in_place(src_path, **kwargs):
                       " was a file."
                       "".format(dst_bin_path))
             if dirpath != dst_dirpath:
-                shutil.move(dirpath, dst_dirpath)
+                move_path(dirpath, dst_dirpath, workers=jobs)
+                # ^ Copies with a pool of threads if dirpath is on another
+                #   filesystem (such as /tmp).
             logLn("install_move_dir:{}".format(dst_dirpath))
+            if dedup:
+                dedup_installed(dst_dirpath, manifest=file_manifest)
     else:
         if os.path.isdir(src_path):
             setProgramValue(luid, 'is_dir', True)
@@ -3391,12 +4102,26 @@ def install_program_in_place(src_path, **kwargs):
         setPackageValue(sc_name, 'dst_dirpath', dst_dirpath)
     else:
         setProgramValue(luid, 'dst_dirpath', dst_dirpath)
-
     if not do_uninstall:
+        integrity = [('archive_sha256', archive_sha256),
+                     ('manifest', file_manifest)]
+        if file_manifest is not None:
+            integrity.append(('manifest_time', time.time()))
+            # ^ Files modified after this are hashed again by dedup.
+        for key, value in integrity:
+            if value is None:
+                continue
+            if multiVersion:
+                setPackageValue(sc_name, key, value)
+            else:
+                setProgramValue(luid, key, value)
+
+    if (not do_uninstall) and (not binary_mode_set):
+        # Such as a file from a zip made on Windows, or a bare file.
         sys.stderr.write("* marking \"{}\" as executable..."
                          "".format(dst_path))
         sys.stderr.flush()
-        if mark_executable(dst_path):
+        if mark_executable(dst_path, if_needed=True):
             sys.stderr.write("OK\n")
         else:
             # Should already have shown an error.
@@ -3449,9 +4174,14 @@ def install_program_in_place(src_path, **kwargs):
         setPackageValue(sc_name, 'luid', luid)
         setPackageValue(sc_name, 'caption', caption)
         setPackageValue(sc_name, 'sc_path', sc_path)
+        if version is not None:
+            setPackageValue(sc_name, 'version', version)
+            setPackageValue(sc_name, 'version_key', version_key(version))
+            # ^ So installed_packages sorts without parsing versions.
     else:
         if version is not None:
             setProgramValue(luid, 'version', version)
+            setProgramValue(luid, 'version_key', version_key(version))
     '''
     dst_bin_path = dst_path
     if src_path is not None:
@@ -3609,10 +4339,10 @@ def install_program_in_place(src_path, **kwargs):
         # shutil.rmtree(dirpath)
         if ex_tmp is not None:
             if os.path.isdir(ex_tmp):
-                shutil.rmtree(ex_tmp)
+                delete_tree(ex_tmp, workers=jobs)
         if new_tmp is not None:
             if os.path.isdir(new_tmp):
-                shutil.rmtree(new_tmp)
+                delete_tree(new_tmp, workers=jobs)
     desktop_installer = "xdg-desktop-menu"
     u_cmd_parts = [desktop_installer, "uninstall", sc_path]
     # PATH_ELEMENT_I = -1  # The place in u_cmd_parts that is the path
@@ -3682,7 +4412,7 @@ def install_program_in_place(src_path, **kwargs):
                   "".format(encode_py_val(sc_path)))
         return True
     else:
-        tmp_sc_dir_path = tempfile.mkdtemp()
+        tmp_sc_dir_path = make_staging_dir(staging_programs)
         tmp_sc_path = os.path.join(tmp_sc_dir_path, sc_name)
         ok = False
         with open(tmp_sc_path, 'w') as outs:
@@ -3703,6 +4433,7 @@ def install_program_in_place(src_path, **kwargs):
             install_proc = subprocess.run([desktop_installer,
                                            "install", "--novendor",
                                            tmp_sc_path])
+            delete_tree(tmp_sc_dir_path)
             inst_msg = "OK"
             # print("sp_run's returned process {} has {}"
             #       "".format(install_proc, dir(install_proc)))
@@ -3727,14 +4458,15 @@ def install_program_in_place(src_path, **kwargs):
                     pass
 
                 print("* installing '{}'...{}".format(sc_path, inst_msg))
-                sys.stderr.write("* marking \"{}\" as executable..."
-                                 "".format(dst_path))
-                if mark_executable(dst_path):
-                    sys.stderr.write("OK\n")
-                    sys.stderr.flush()
-                else:
-                    # Should already have shown an error.
-                    pass
+                if not binary_mode_set:
+                    sys.stderr.write("* marking \"{}\" as executable..."
+                                     "".format(dst_path))
+                    if mark_executable(dst_path, if_needed=True):
+                        sys.stderr.write("OK\n")
+                        sys.stderr.flush()
+                    else:
+                        # Should already have shown an error.
+                        pass
             else:
                 print("* installing '{}'...{}".format(sc_name, inst_msg))
             print("  Name={}".format(caption))
@@ -3746,14 +4478,13 @@ def install_program_in_place(src_path, **kwargs):
                 if not runner:
                     # exe is *not* executable in non-Windows!
                     #   it should open with wine or fail.
-                    sys.stderr.write(
-                        "* marking \"{}\" as executable..."
-                        .format(dst_bin_path))
-                    os.chmod(
-                        dst_bin_path, stat.S_IRWXU | stat.S_IXGRP
-                        | stat.S_IRGRP
-                        | stat.S_IROTH | stat.S_IXOTH)
-                    print("OK", file=sys.stderr)
+                    if not binary_mode_set:
+                        sys.stderr.write(
+                            "* marking \"{}\" as executable..."
+                            .format(dst_bin_path))
+                        mark_executable(dst_bin_path, reraise=True,
+                                        if_needed=True)
+                        print("OK", file=sys.stderr)
                 else:
                     print(
                         "Warning: {} icon may not appear in your menu"
@@ -3779,11 +4510,385 @@ def install_program_in_place(src_path, **kwargs):
     return False
 
 
+def trash_tree(path, files=None):
+    '''
+    Remove an installed directory without waiting for it to be deleted:
+    Rename it into the trash directory beside it, then delete it in a
+    detached process (See nopackage.trash). If it can't be renamed (such
+    as if it is a mount point), delete it now.
+
+    Keyword arguments:
+    files -- The manifest (or list of relative paths) of the installed
+        files, so they are deleted without listing every directory.
+    '''
+    from nopackage.fileops import delete_tree
+    from nopackage.trash import (
+        move_to_trash,
+        purge_in_background,
+        trash_dir_for,
+    )
+    try:
+        entry = move_to_trash(path, files=files)
+    except OSError as ex:
+        echo0("* deleting '{}' now since moving it to the trash failed:"
+              " {}".format(path, ex))
+        delete_tree(path)
+        return
+    print("* moved '{}' to '{}' (deleting it in the background)"
+          "".format(path, entry))
+    purge_in_background(trash_dir_for(path))
+
+
+def dedup_installed(dirpath, manifest=None, since=None):
+    '''
+    Hard link the files of an installed program to identical files of
+    other programs in the same programs directory (See DedupStore in
+    dedupstore.py).
+
+    Sequential arguments:
+    dirpath -- The installed directory (such as
+        ~/.local/lib64/blender-4.1.0).
+
+    Keyword arguments:
+    manifest -- The manifest recorded when dirpath was installed, so
+        only changed files are read (See DedupStore.dedup_tree).
+    since -- The 'manifest_time' recorded with the manifest (None if
+        it was just recorded).
+
+    Returns:
+    The number of bytes freed.
+    '''
+    from nopackage.dedupstore import DedupStore
+    store = DedupStore.for_programs(os.path.dirname(dirpath))
+    result = store.dedup_tree(dirpath, manifest=manifest, since=since)
+    logLn("* dedup: checked {} file(s) in {} ({} hashed, {} bytes freed)"
+          "".format(result['files'], dirpath, result['hashed'],
+                    result['freed']))
+    return result['freed']
+
+
+def release_dedup_objects(dirpath, manifest):
+    '''
+    Remove the objects of the dedup store that only an installed
+    program that is being removed uses (See DedupStore.release).
+    '''
+    from nopackage.dedupstore import DedupStore
+    store = DedupStore.for_programs(os.path.dirname(dirpath))
+    removed, freed = store.release(dirpath, manifest)
+    if removed:
+        logLn("* dedup: removed {} object(s) ({} bytes) only used by {}"
+              "".format(removed, freed, dirpath))
+
+
+def installed_packages(luid=None, newest_first=True):
+    '''
+    Get the installed versioned packages (See --multi-version) sorted
+    by the version_key stored when each was installed (See
+    nopackage.versions).
+
+    Keyword arguments:
+    luid -- Only get the packages of this program.
+    newest_first -- Put the newest version first.
+
+    Returns:
+    A list of (sc_name, entry) tuples where entry is the metadata dict
+    of the package (do not modify it).
+    '''
+    from nopackage.versions import version_key
+    store = getMetaStore()
+    if luid is not None:
+        sc_names = store.find('packages', 'luid', luid)
+    else:
+        sc_names = store.entry_ids('packages') or []
+    results = []
+    for sc_name in sc_names:
+        entry = store.get_entry('packages', sc_name)
+        if entry.get('installed') is False:
+            continue
+        key = entry.get('version_key')
+        if key is None:
+            key = version_key(entry.get('version'))
+            # ^ Installed before keys were stored.
+        results.append((key, sc_name, entry))
+    results.sort(key=lambda result: result[:2], reverse=newest_first)
+    return [(sc_name, entry) for _, sc_name, entry in results]
+
+
+def newest_archive(paths, luid=None, flavor=""):
+    '''
+    Get the path with the newest version in its name (See
+    PackageInfo.parse_many), such as to choose which of several
+    downloaded releases to install.
+
+    Keyword arguments:
+    luid -- Only consider names detected as this program.
+    flavor -- Only consider versions of this flavor (See
+        nopackage.versions), such as "mono" (default: only versions
+        without a flavor).
+
+    Returns:
+    The path, or None if no name has a version (or matches luid and
+    flavor).
+    '''
+    from nopackage.versions import (
+        newest,
+        parse_version,
+    )
+    candidates = []
+    for result in PackageInfo.parse_many(paths):
+        if result.get('version') is None:
+            continue
+        if (luid is not None) and (result['luid'] != luid):
+            continue
+        key, versionFlavor = parse_version(result['version'])
+        if versionFlavor != flavor:
+            continue
+        candidates.append((result['path'], key))
+    best = newest(candidates, key=lambda candidate: candidate[1])
+    if best is None:
+        return None
+    return best[0]
+
+
+def installed_versions(luid):
+    '''
+    Get the newest installed version of each flavor of a program (See
+    installed_packages for versioned packages, and nopackage.versions
+    for flavors).
+
+    Returns:
+    A dict of {flavor: (version, version_key, multiVersion)}, empty if
+    the program isn't installed or its version wasn't recorded.
+    '''
+    from nopackage.versions import parse_version
+    packages = installed_packages(luid=luid)
+    multiVersion = len(packages) > 0
+    if multiVersion:
+        entries = [entry for _, entry in packages]
+        # ^ Newest first, so the first of each flavor is the newest.
+    else:
+        entry = getMetaStore().get_entry('programs', luid)
+        if (entry is None) or (entry.get('installed') is False):
+            return {}
+        entries = [entry]
+    versions = {}
+    for entry in entries:
+        version = entry.get('version')
+        if version is None:
+            continue
+        key, flavor = parse_version(version)
+        if flavor in versions:
+            continue
+        storedKey = entry.get('version_key')
+        if storedKey is not None:
+            key = storedKey
+        versions[flavor] = (version, key, multiVersion)
+    return versions
+
+
+def find_upgrades(directory, processes=None, cache_dir=None):
+    '''
+    Find installers (See INSTALLER_ENDINGS) in directory that are newer
+    than the installed version of the same program and flavor (See
+    installed_versions). Installers for another platform, or for
+    another architecture (32-bit or 64-bit) than this computer's, are
+    ignored. If several installers have the newest version, one for
+    this computer's architecture is preferred over one with no
+    architecture in its name. Only names of files that are new or
+    changed since the last scan are parsed (See nopackage.scancache).
+
+    Keyword arguments:
+    processes -- Parse using this many processes (See
+        PackageInfo.parse_many).
+    cache_dir -- Where to keep the results (default: scanCachePath).
+
+    Returns:
+    A list of dicts (sorted by luid) with "luid", "installed" (the
+    installed version), "version", "path" and "multiVersion", for the
+    newest installer of each program (and flavor) that can be
+    upgraded.
+    '''
+    from nopackage.headers import host_bits
+    from nopackage.scancache import ScanCache
+    from nopackage.versions import (
+        newest,
+        parse_version,
+    )
+    hostPlatform = platform.system()
+    hostArch = "{}bit".format(host_bits())
+    if cache_dir is None:
+        cache_dir = scanCachePath
+    cache = ScanCache(cache_dir, directory)
+    results = []
+    stale = []
+    stats = {}
+    for entry in os.scandir(cache.directory):
+        name = entry.name
+        if name.startswith("."):
+            continue
+        if not name.lower().endswith(INSTALLER_ENDINGS):
+            continue
+        try:
+            if not entry.is_file():
+                continue
+            st = entry.stat()
+        except OSError:
+            continue
+        stats[name] = (st.st_size, st.st_mtime_ns)
+        result = cache.get(name, st.st_size, st.st_mtime_ns)
+        if result is None:
+            stale.append((entry.path, False))
+        else:
+            results.append(result)
+    for result in PackageInfo.parse_many(stale, processes=processes):
+        versionKey, versionFlavor = parse_version(result.get('version'))
+        result['version_key'] = versionKey
+        result['version_flavor'] = versionFlavor
+        size, mtime_ns = stats[os.path.basename(result['path'])]
+        cache.set(os.path.basename(result['path']), size, mtime_ns,
+                  result)
+        results.append(result)
+    cache.prune(stats)
+    cache.save()
+    echo0("* scanned {} installer(s) in {} ({} parsed)"
+          "".format(len(stats), cache.directory, len(stale)))
+    candidates = {}
+    for result in sorted(results, key=lambda result: result['path']):
+        # ^ Sorted so that the same installer wins a tie every time.
+        if result.get('version') is None:
+            continue
+        if result.get('platform') not in (None, hostPlatform):
+            continue
+            # ^ Such as a Windows zip on Linux.
+        if result.get('arch') in ("32bit", "64bit"):
+            if result['arch'] != hostArch:
+                continue
+        candidates.setdefault(result['luid'], []).append(result)
+    upgrades = []
+    for luid in sorted(candidates):
+        installed = installed_versions(luid)
+        for flavor in sorted(installed):
+            version, key, multiVersion = installed[flavor]
+            best = newest(
+                [result for result in candidates[luid]
+                 if result['version_flavor'] == flavor],
+                key=lambda result: (result['version_key'],
+                                    result.get('arch') == hostArch),
+            )
+            # ^ Only the same flavor, such as not to switch from Godot
+            #   to Godot Mono.
+            if (best is None) or (best['version_key'] <= key):
+                continue
+            upgrades.append({
+                'luid': luid,
+                'installed': version,
+                'version': best['version'],
+                'path': best['path'],
+                'multiVersion': multiVersion,
+            })
+    return upgrades
+
+
+def scan_dir(directory, processes=None):
+    '''
+    Write the commands that would upgrade installed programs to newer
+    versions in directory to stdout, as a shell script (See
+    find_upgrades).
+
+    Returns:
+    0 if successful, otherwise 1 (for use as an exit code).
+    '''
+    import shlex
+    if not os.path.isdir(directory):
+        echo0("Error: '{}' is not a directory.".format(directory))
+        return 1
+    for upgrade in find_upgrades(directory, processes=processes):
+        print("# {luid}: {installed} -> {version}".format(**upgrade))
+        if upgrade['multiVersion']:
+            print("{} install {} --multi-version"
+                  "".format(me, shlex.quote(upgrade['path'])))
+            # ^ Install beside the other versions.
+        else:
+            print("{} reinstall {}"
+                  "".format(me, shlex.quote(upgrade['path'])))
+    return 0
+
+
+def dedup_packages():
+    '''
+    Deduplicate every installed versioned package (See dedup_installed),
+    then remove any object of the dedup store that is no longer used.
+
+    Returns:
+    0 if successful, otherwise 1 (for use as an exit code).
+    '''
+    from nopackage.dedupstore import DedupStore
+    store = getMetaStore()
+    sc_names = store.entry_ids('packages')
+    if not sc_names:
+        echo0("There are no versioned packages (See --multi-version).")
+        return 0
+    total = 0
+    programs_dirs = set()
+    for sc_name in sc_names:
+        entry = store.get_entry('packages', sc_name)
+        dirpath = entry.get('dst_dirpath')
+        if dirpath is not None:
+            programs_dirs.add(os.path.dirname(dirpath))
+        if (entry.get('installed') is False) or (dirpath is None):
+            continue
+        if not os.path.isdir(dirpath):
+            echo0("* skipping {} since there is no {}"
+                  "".format(sc_name, dirpath))
+            continue
+        total += dedup_installed(dirpath, manifest=entry.get('manifest'),
+                                 since=entry.get('manifest_time', 0))
+        # ^ Without a manifest_time, every file is hashed again.
+    for programs_dir in sorted(programs_dirs):
+        dedup_store = DedupStore.for_programs(programs_dir)
+        removed, freed = dedup_store.collect_garbage()
+        # ^ Only here (not on each remove), such as for objects left by
+        #   versions removed before manifests were recorded.
+        total += freed
+        if removed:
+            echo0("* removed {} unused object(s) from {}"
+                  "".format(removed, dedup_store.path))
+    echo0("* freed {} bytes".format(total))
+    return 0
+
+
+def migrate_metadata():
+    '''
+    Import the metadata from local_machine.json into
+    local_machine.sqlite3, which will be used instead from then on.
+    The JSON file is kept as a backup.
+
+    Returns:
+    0 if successful, otherwise 1 (for use as an exit code).
+    '''
+    from nopackage.metastore import import_json_to_sqlite
+    ensure_initialized()
+    if os.path.isfile(metaStorePath):
+        echo0("Error: {} is already in use.".format(metaStorePath))
+        return 1
+    if not os.path.isfile(localMachineMetaPath):
+        saveLocalMachine()
+    count = import_json_to_sqlite(localMachineMetaPath, metaStorePath)
+    echo0("* imported {} value(s) from {} to {}"
+          "".format(count, localMachineMetaPath, metaStorePath))
+    echo0("  {} will no longer be used (It can be deleted)."
+          "".format(localMachineMetaPath))
+    return 0
+
+
 def main():
-    print("")
+    if sys.argv[1:2] not in (["inspect"], ["scan"]):
+        print("")
+        # ^ Only JSON lines (inspect) or commands (scan) go to stdout.
     caption = None
     src_path = None
     global verbosity
+    global compactLocalMachine
     if len(sys.argv) < 2:
         usage()
         echo0("")
@@ -3795,6 +4900,8 @@ def main():
     enable_reinstall = False
     move_what = None
     multiVersion = None
+    use_cache = False
+    dedup = False
     valueParams = {}
     valueParamsKey = None
     command = None
@@ -3818,8 +4925,18 @@ def main():
                 valueParamsKey = "version"
             elif arg == "--caption":
                 valueParamsKey = "caption"
+            elif arg == "--jobs":
+                valueParamsKey = "jobs"
+            elif arg == "--cache":
+                use_cache = True
+            elif arg == "--cache-quota":
+                valueParamsKey = "cache-quota"
             elif arg == "--multi-version":
                 multiVersion = True
+            elif arg == "--dedup":
+                dedup = True
+            elif arg == "--sha256sums":
+                valueParamsKey = "sha256sums"
             elif arg == "--help":
                 usage()
                 return 0
@@ -3827,6 +4944,8 @@ def main():
                 verbosity = 1
             elif arg == "--debug":
                 verbosity = 2
+            elif arg == "--compact-metadata":
+                compactLocalMachine = True
             elif arg == "--reinstall":
                 # alternate syntax:
                 # install --reinstall = reinstall
@@ -3854,6 +4973,10 @@ def main():
         do_uninstall = True
     elif command == "reinstall":
         enable_reinstall = True
+    elif command == "migrate":
+        return migrate_metadata()
+    elif command == "dedup":
+        return dedup_packages()
     if src_path is None:
         echo0("")
         echo0("Error: You must specify a source path.")
@@ -3875,6 +4998,35 @@ def main():
         move_what = 'file'
     version = valueParams.get('version')
     caption = valueParams.get('caption')
+    jobs = valueParams.get('jobs')
+    if jobs is not None:
+        try:
+            jobs = int(jobs)
+        except ValueError:
+            print("ERROR: --jobs must be a number but got '{}'."
+                  "".format(jobs))
+            return 1
+    if command == "inspect":
+        if os.path.isfile(src_path):
+            return inspect_archive(src_path)
+        return inspect_dir(src_path, processes=jobs)
+    elif command == "scan":
+        return scan_dir(src_path, processes=jobs)
+    sha256sums = valueParams.get('sha256sums')
+    if sha256sums is not None:
+        sha256sums = os.path.abspath(sha256sums)
+        if not os.path.isfile(sha256sums):
+            print("ERROR: There is no SHA256SUMS file '{}'."
+                  "".format(sha256sums))
+            return 1
+    cache_quota = valueParams.get('cache-quota')
+    if cache_quota is not None:
+        try:
+            cache_quota = int(float(cache_quota) * 1024 * 1024)
+        except ValueError:
+            print("ERROR: --cache-quota must be a number (MiB) but got"
+                  " '{}'.".format(cache_quota))
+            return 1
     try:
         result = install_program_in_place(
             src_path,
@@ -3884,6 +5036,11 @@ def main():
             enable_reinstall=enable_reinstall,
             multiVersion=multiVersion,
             version=version,
+            jobs=jobs,
+            use_cache=use_cache,
+            cache_quota=cache_quota,
+            dedup=dedup,
+            sha256sums=sha256sums,
         )
         if not result:
             return 1
@@ -0,0 +1,951 @@
+#!/usr/bin/env python
+'''
+Read archives (such as the ar container of a deb) in-process and
+extract them without intermediate files.
+'''
+from __future__ import print_function
+
+import copy
+import hashlib
+import os
+import shutil
+import stat
+import sys
+import tarfile
+import tempfile
+from contextlib import contextmanager
+
+from nopackage.decompressors import (
+    DECOMPRESSORS,
+    find_decompressor,
+)
+from nopackage.integrity import (
+    HashingReader,
+    sha256_file,
+)
+
+CHUNK_SIZE = 1024 * 1024
+
+AR_MAGIC = b"!<arch>\n"
+AR_HEADER_SIZE = 60
+
+MAX_WORKERS = 32
+ZIP_PARALLEL_MIN_FILES = 32
+# ^ Smaller zips are extracted by one thread (less overhead).
+ZIP_UNIX = 3
+# ^ The ZipInfo.create_system of a zip made by a Unix zip program (The
+#   high 16 bits of external_attr are then st_mode).
+UNTRUSTED_MODE_BITS = (stat.S_ISUID | stat.S_ISGID | stat.S_ISVTX
+                       | stat.S_IWGRP | stat.S_IWOTH)
+# ^ Cleared from modes in a zip (like the 'tar' filter of tarfile).
+
+COMPRESSION_MAGIC = [
+    (b"\x1f\x8b", 'gz'),
+    (b"\xfd7zXZ\x00", 'xz'),
+    (b"BZh", 'bz2'),
+    (b"\x28\xb5\x2f\xfd", 'zst'),
+    (b"\x04\x22\x4d\x18", 'lz4'),
+]
+# ^ The first bytes of each compression format (See sniff_format).
+ZIP_MAGICS = (b"PK\x03\x04", b"PK\x05\x06")  # The latter is empty.
+TAR_MAGIC = b"ustar"
+TAR_MAGIC_OFFSET = 257
+SNIFF_SIZE = 512  # Enough for a tar header.
+
+DEB_NOT_PROGRAMS = ["applications", "icons", "doc", "pixmaps", "lintian"]
+# ^ Directories in usr/share (or opt) of a deb that are not programs.
+DEB_PROGRAMS_DIRS = ["usr/share/", "opt/"]
+# ^ Directories of a deb that may contain the program's directory.
+
+
+def echo0(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+class LimitedReader(object):
+    '''
+    A read-only file-like view of the next `size` bytes of a stream,
+    such as one member of an ar archive.
+    '''
+    def __init__(self, fileobj, size):
+        self.fileobj = fileobj
+        self.remaining = size
+
+    def read(self, size=-1):
+        if (size is None) or (size < 0) or (size > self.remaining):
+            size = self.remaining
+        if size == 0:
+            return b""
+        data = self.fileobj.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def skip(self):
+        '''
+        Discard any unread bytes of the member.
+        '''
+        if self.remaining < 1:
+            return
+        try:
+            self.fileobj.seek(self.remaining, os.SEEK_CUR)
+            self.remaining = 0
+        except (AttributeError, OSError, IOError):
+            while self.read(1024 * 1024):
+                pass
+
+
+def iter_ar_members(fileobj):
+    '''
+    Read a Unix ar archive (such as a deb) as a stream without
+    extracting it.
+
+    Sequential arguments:
+    fileobj -- A binary file-like object positioned at the start of the
+        archive (only read() is required).
+
+    Yields:
+    a (name, size, stream) tuple for each member, where stream is a
+    LimitedReader that is only valid until the next member is requested.
+    '''
+    magic = fileobj.read(len(AR_MAGIC))
+    if magic != AR_MAGIC:
+        raise ValueError("This is not an ar archive (no {} signature)."
+                         "".format(AR_MAGIC))
+    while True:
+        header = fileobj.read(AR_HEADER_SIZE)
+        if not header.strip():
+            return
+        if (len(header) < AR_HEADER_SIZE) or (header[58:60] != b"`\n"):
+            raise ValueError("The ar archive has a truncated or bad member"
+                             " header: {}".format(header))
+        name = header[0:16].decode('utf-8').rstrip()
+        size = int(header[48:58].decode('ascii').strip())
+        stream = LimitedReader(fileobj, size)
+        if name.startswith("#1/"):
+            # BSD long name (stored at the start of the data)
+            name_len = int(name[3:])
+            name = stream.read(name_len).decode('utf-8').rstrip("\0")
+        elif name.endswith("/") and (name != "/") and (name != "//"):
+            name = name[:-1]  # GNU-style terminator
+        yield name, stream.remaining, stream
+        stream.skip()
+        if size % 2 == 1:
+            fileobj.read(1)  # Members are aligned to even offsets.
+
+
+def normalize_member_name(name):
+    '''
+    Remove a leading "./" or "/" (such as in deb data members).
+    '''
+    while name.startswith("./"):
+        name = name[2:]
+    return name.lstrip("/")
+
+
+def deb_member_filter(name):
+    '''
+    Check whether a member of the data tar of a deb may be needed to
+    install the program: the program directory in usr/share or opt
+    (See DEB_PROGRAMS_DIRS), and any icons.
+    '''
+    name = normalize_member_name(name)
+    for parent in DEB_PROGRAMS_DIRS:
+        if (name + "/") == parent:
+            return True
+        if not name.startswith(parent):
+            continue
+        sub_name = name[len(parent):].split("/")[0]
+        if sub_name == "icons":
+            return True
+        return sub_name not in DEB_NOT_PROGRAMS
+    return False
+
+
+def extract_kwargs():
+    '''
+    Get keyword arguments for TarFile.extract that keep the traditional
+    behavior (trust permissions and absolute symlinks, but never write
+    outside of the destination) on Python versions that have extraction
+    filters.
+    '''
+    if hasattr(tarfile, 'tar_filter'):
+        return {'filter': 'tar'}
+    return {}
+
+
+class PrefixedReader(object):
+    '''
+    A readable stream of bytes that were already read (such as to sniff
+    the format) followed by the rest of a stream.
+    '''
+    def __init__(self, prefix, fileobj):
+        self.prefix = prefix
+        self.fileobj = fileobj
+
+    def read(self, size=-1):
+        if not self.prefix:
+            return self.fileobj.read(size)
+        if (size is None) or (size < 0):
+            data = self.prefix + self.fileobj.read()
+            self.prefix = b""
+            return data
+        data = self.prefix[:size]
+        self.prefix = self.prefix[size:]
+        if len(data) < size:
+            data += self.fileobj.read(size - len(data))
+        return data
+
+
+def sniff_compression(header):
+    '''
+    Get the compression format (such as 'zst') from the first bytes of
+    a file (See COMPRESSION_MAGIC), or None if not compressed (or
+    unknown).
+    '''
+    for magic, compression in COMPRESSION_MAGIC:
+        if header.startswith(magic):
+            return compression
+    return None
+
+
+def sniff_format(header):
+    '''
+    Detect the format of an archive from its first bytes, regardless of
+    the file extension.
+
+    Sequential arguments:
+    header -- The first bytes (SNIFF_SIZE is enough) of the file.
+
+    Returns:
+    a (category, compression) tuple where category is 'ar' (such as a
+    deb), 'zip', 'tar' (assumed if the data is compressed), or None if
+    unknown, and compression is the result of sniff_compression.
+    '''
+    if header.startswith(AR_MAGIC):
+        return 'ar', None
+    if header.startswith(ZIP_MAGICS):
+        return 'zip', None
+    compression = sniff_compression(header)
+    if compression is not None:
+        return 'tar', compression
+    end = TAR_MAGIC_OFFSET + len(TAR_MAGIC)
+    if header[TAR_MAGIC_OFFSET:end] == TAR_MAGIC:
+        return 'tar', None
+    return None, None
+
+
+def sniff_file(path):
+    '''
+    Detect the format of an archive file (See sniff_format).
+    '''
+    with open(path, 'rb') as ins:
+        return sniff_format(ins.read(SNIFF_SIZE))
+
+
+class ManifestTarFile(tarfile.TarFile):
+    '''
+    A TarFile that hashes each regular file while writing it if manifest
+    is a dict, and adds it to the manifest (See nopackage.integrity).
+    '''
+    manifest = None
+
+    def makefile(self, tarinfo, targetpath):
+        if (self.manifest is None) or (tarinfo.sparse is not None):
+            tarfile.TarFile.makefile(self, tarinfo, targetpath)
+            if self.manifest is not None:
+                self._add(tarinfo, sha256_file(targetpath))
+                # ^ Sparse files are rare, so read those back.
+            return
+        source = self.fileobj
+        source.seek(tarinfo.offset_data)
+        sha = hashlib.sha256()
+        remaining = tarinfo.size
+        with open(targetpath, 'wb') as target:
+            while remaining > 0:
+                chunk = source.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise tarfile.ReadError("unexpected end of data")
+                sha.update(chunk)
+                target.write(chunk)
+                remaining -= len(chunk)
+        self._add(tarinfo, sha.hexdigest())
+
+    def makelink(self, tarinfo, targetpath):
+        tarfile.TarFile.makelink(self, tarinfo, targetpath)
+        if (self.manifest is not None) and tarinfo.islnk():
+            target = self.manifest.get(
+                normalize_member_name(tarinfo.linkname))
+            if target is not None:
+                self.manifest.setdefault(
+                    normalize_member_name(tarinfo.name), target)
+
+    def _add(self, tarinfo, digest):
+        self.manifest[normalize_member_name(tarinfo.name)] = \
+            [tarinfo.size, tarinfo.mode & 0o7777, digest]
+
+
+@contextmanager
+def open_tar_stream(source, compression=None):
+    '''
+    Open a tar for one sequential pass (tarfile stream mode), using the
+    preferred decompressor (See nopackage.decompressors) if the
+    compression is known, otherwise the codecs built into tarfile.
+
+    Sequential arguments:
+    source -- A path or a readable binary file-like object.
+
+    Keyword arguments:
+    compression -- The compression format such as 'xz' (See
+        sniff_compression).
+
+    Yields:
+    a (ManifestTarFile, backend) tuple where backend is the name of the
+    decompressor (such as "xz -T0") or "tarfile".
+    '''
+    decompressor = None
+    if compression is not None:
+        decompressor = find_decompressor(compression)
+        if decompressor is None:
+            raise ValueError(
+                "There is no decompressor for {} (install any of: {})."
+                "".format(compression,
+                          [d.name for d in DECOMPRESSORS
+                           if d.compression == compression])
+            )
+    stream = None
+    backend = "tarfile"
+    if decompressor is not None:
+        stream = decompressor.open(source)
+        backend = decompressor.name
+    try:
+        if stream is not None:
+            tar = ManifestTarFile.open(fileobj=stream, mode="r|")
+        elif hasattr(source, 'read'):
+            tar = ManifestTarFile.open(fileobj=source, mode="r|*")
+        else:
+            tar = ManifestTarFile.open(source, mode="r|*")
+        try:
+            yield tar, backend
+        finally:
+            tar.close()
+    finally:
+        if stream is not None:
+            stream.close()
+
+
+def extract_tar_stream(tar, dst, member_filter=None):
+    '''
+    Extract members from a TarFile (opened in stream mode such as "r|*")
+    in one sequential pass.
+
+    Sequential arguments:
+    tar -- An open TarFile.
+    dst -- The destination directory.
+
+    Keyword arguments:
+    member_filter -- A function that accepts a member name and returns
+        True to extract it (None to extract all).
+
+    Returns:
+    The number of members extracted.
+    '''
+    count = [0]
+
+    def members():
+        for member in tar:
+            if member_filter is not None:
+                if not member_filter(member.name):
+                    continue
+            count[0] += 1
+            yield member
+
+    tar.extractall(path=dst, members=members(), **extract_kwargs())
+    # ^ extractall (unlike extract) sets directory permissions after
+    #   their contents are extracted.
+    return count[0]
+
+
+def extract_deb_data(deb_path, dst, member_filter=deb_member_filter):
+    '''
+    Extract the data.tar.* member of a deb directly from the deb file
+    (without running `ar` or writing the inner archive to disk).
+
+    Sequential arguments:
+    deb_path -- The deb file, or a readable binary file-like object
+        (such as a HashingReader).
+    dst -- The destination directory.
+
+    Keyword arguments:
+    member_filter -- A function that accepts a member name of the data
+        tar and returns True to extract it (defaults to
+        deb_member_filter, so only the program directory and icons are
+        extracted; None to extract all).
+
+    Returns:
+    a (name, backend) tuple where name is the name of the data member
+    (such as "data.tar.xz") and backend is the name of the decompressor
+    (See open_tar_stream).
+    '''
+    if hasattr(deb_path, 'read'):
+        return _extract_deb_data(deb_path, getattr(deb_path, 'name', None),
+                                 dst, member_filter)
+    with open(deb_path, 'rb') as ins:
+        return _extract_deb_data(ins, deb_path, dst, member_filter)
+
+
+def _extract_deb_data(ins, deb_path, dst, member_filter):
+    names = []
+    for name, size, stream in iter_ar_members(ins):
+        names.append(name)
+        if not name.startswith("data.tar"):
+            continue
+        header = stream.read(SNIFF_SIZE)
+        compression = sniff_compression(header)
+        # ^ Any compression (such as data.tar.zst) is detected, and the
+        #   name isn't trusted.
+        source = PrefixedReader(header, stream)
+        with open_tar_stream(source, compression) as (tar, backend):
+            count = extract_tar_stream(tar, dst, member_filter=member_filter)
+        echo0("* extracted {} member(s) of {} from {} using {}"
+              "".format(count, name, deb_path, backend))
+        return name, backend
+    raise ValueError("There is no data.tar.* member in {} (only {})"
+                     "".format(deb_path, names))
+
+
+def common_root(entries):
+    '''
+    Get the top-level directory that contains every member of an archive
+    (so that it can be stripped like `tar --strip-components=1`).
+
+    Sequential arguments:
+    entries -- A list of (name, is_dir) tuples for the archive members.
+
+    Returns:
+    The name of the top-level directory, or None if the archive has
+    several top-level entries or any top-level file.
+    '''
+    root = None
+    for name, is_dir in entries:
+        name = normalize_member_name(name).rstrip("/")
+        if not name:
+            continue
+        parts = name.split("/")
+        if root is None:
+            root = parts[0]
+        elif parts[0] != root:
+            return None
+        if (len(parts) == 1) and (not is_dir):
+            return None
+    return root
+
+
+def strip_root(name, root):
+    '''
+    Remove the root directory (See common_root) from a member name.
+
+    Returns:
+    The relative name, or "" if the name is the root itself.
+    '''
+    name = normalize_member_name(name)
+    if root is None:
+        return name
+    if name.rstrip("/") == root:
+        return ""
+    return name[len(root)+1:]
+
+
+def default_workers():
+    '''
+    Get the default number of extraction threads (the number of CPUs,
+    limited to MAX_WORKERS).
+    '''
+    count = None
+    if hasattr(os, 'sched_getaffinity'):
+        count = len(os.sched_getaffinity(0))
+    elif hasattr(os, 'cpu_count'):
+        count = os.cpu_count()
+    return max(1, min(MAX_WORKERS, count or 1))
+
+
+def safe_parts(name):
+    '''
+    Split a member name into the path components that ZipFile.extract
+    would use (without empty, "." or ".." components).
+    '''
+    return [part for part in name.split("/")
+            if part not in ("", ".", "..")]
+
+
+def partition_by_size(items, count, size=len):
+    '''
+    Split items into at most count lists with similar total sizes (The
+    largest items are assigned first, each to the smallest list).
+    '''
+    parts = [[] for _ in range(min(count, len(items)))]
+    totals = [0] * len(parts)
+    for item in sorted(items, key=size, reverse=True):
+        i = totals.index(min(totals))
+        parts[i].append(item)
+        totals[i] += size(item)
+    return parts
+
+
+class Archive(object):
+    '''
+    An open archive that can be inspected (See tree) before it is
+    extracted, so that a failed detection costs no extraction.
+
+    Subclasses must open the archive, set self.members to a list of
+    (name, is_dir, mode, size, member) tuples from the metadata of the
+    archive (mode is None if unknown), and implement _extract (which
+    must add each regular file to self.manifest). A subclass that can
+    only list the members by reading the whole archive sets listed to
+    False and fills members while extracting instead, so root, tree
+    and total_size are only known after extract.
+
+    After extract, manifest is {relative path: [size, mode, sha256]}
+    for each regular file (See nopackage.integrity).
+
+    Subclasses that can read one member without reading the ones before
+    it set random_access to True and implement _read_header, so the tree
+    can classify files by content (See nopackage.headers).
+    '''
+    random_access = False
+    listed = True
+
+    def __init__(self, path):
+        self.path = path
+        self.members = []
+        self.backend = None  # The name of the decompressor used.
+        self.manifest = None
+        self.offsets = None  # Only recorded by TarArchive.
+        self._root = False  # False since None means there is no root.
+        self._sha256 = None  # Set by subclasses that read the whole file.
+
+    @property
+    def sha256(self):
+        '''
+        The SHA-256 hex digest of the archive file.
+        '''
+        if self._sha256 is None:
+            self._sha256 = sha256_file(self.path)
+        return self._sha256
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        pass
+
+    @property
+    def root(self):
+        '''
+        The top-level directory that every member is in (See
+        common_root), or None.
+        '''
+        if self._root is False:
+            self._root = common_root([(name, is_dir) for name, is_dir, _,
+                                      _, _ in self.members])
+        return self._root
+
+    def total_size(self):
+        return sum(size for _, is_dir, _, size, _ in self.members
+                   if not is_dir)
+
+    def stored_mode(self, relpath, strip=True):
+        '''
+        Get the mode that the archive stores for a member (so extract
+        already set it), or None if it stores none (such as in a zip
+        made on Windows) or there is no such member.
+
+        Sequential arguments:
+        relpath -- The member name (relative to root if strip is True).
+        '''
+        root = self.root if strip else None
+        for name, _, mode, _, _ in self.members:
+            if strip_root(name, root) == relpath:
+                return mode
+        return None
+
+    def tree(self, strip=True):
+        '''
+        Get a MemberTree of the member list (relative to root if strip
+        is True) for detecting the binary before extracting.
+        '''
+        from nopackage.trees import MemberTree
+        root = self.root if strip else None
+        entries = []
+        members = {}
+        for name, is_dir, mode, _, member in self.members:
+            name = strip_root(name, root)
+            entries.append((name, is_dir, mode))
+            members[name] = member
+        read = None
+        if self.random_access:
+            def read(name, size):
+                return self._read_header(members[name], size)
+        return MemberTree(entries, read=read)
+
+    def _read_header(self, member, size):
+        raise NotImplementedError("{} can't read a member by itself"
+                                  "".format(type(self).__name__))
+
+    def extract(self, dst, strip=True, workers=None):
+        '''
+        Extract the archive directly into its destination directory, so
+        the data is written once instead of being extracted to a
+        temporary directory then moved (which is a full copy if the
+        temporary directory is on a different device such as tmpfs).
+
+        Sequential arguments:
+        dst -- The destination directory (created if not present).
+
+        Keyword arguments:
+        strip -- If every member is in one top-level directory, extract
+            the contents of that directory instead (See common_root).
+        workers -- The number of threads for formats that can be
+            extracted in parallel (None for default_workers()).
+
+        Returns:
+        The stripped top-level directory name, or None if nothing was
+        stripped.
+        '''
+        root = self.root if strip else None
+        if not os.path.isdir(dst):
+            os.makedirs(dst)
+        self.manifest = {}
+        self._extract(dst, root, workers)
+        return root
+
+    def _extract(self, dst, root, workers):
+        raise NotImplementedError("_extract")
+
+
+class TarArchive(Archive):
+    '''
+    A tar (optionally compressed). It can only be read sequentially
+    through the preferred decompressor (See open_tar_stream), so it is
+    read once: extract lists the members, computes sha256 and writes
+    each member in the same pass, then strips the top-level directory
+    by renaming it (Detect the binary in the extracted files, since
+    listing the members first would decompress the archive twice).
+
+    After extract, offsets is {member name: [offset, size]} for each
+    regular file, where offset is where its data starts in the
+    uncompressed tar (See SeekIndex.from_members).
+    '''
+    listed = False
+
+    def __init__(self, path):
+        Archive.__init__(self, path)
+        _, self.compression = sniff_file(path)
+        self.backend = "tarfile"
+        if self.compression is not None:
+            decompressor = find_decompressor(self.compression)
+            if decompressor is None:
+                raise ValueError(
+                    "There is no decompressor for {} (install any of: {})."
+                    "".format(self.compression,
+                              [d.name for d in DECOMPRESSORS
+                               if d.compression == self.compression])
+                )
+                # ^ Before anything is extracted.
+            self.backend = decompressor.name
+
+    def extract(self, dst, strip=True, workers=None):
+        # A tar can only be decompressed sequentially, so workers is
+        #   not used (The decompressor may still use several threads).
+        parent = os.path.dirname(os.path.abspath(dst))
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+        tmp = tempfile.mkdtemp(prefix=".nopackage-tar-", dir=parent)
+        # ^ Beside dst, so stripping the top-level directory is only a
+        #   rename.
+        self.members = []
+        self.manifest = {}
+        self.offsets = {}
+        self._root = False
+
+        def listed(tar):
+            for m in tar:
+                self.members.append((m.name, m.isdir(), m.mode, m.size,
+                                     None))
+                if m.isfile():
+                    self.offsets[m.name] = [m.offset_data, m.size]
+                yield m
+
+        try:
+            with open(self.path, 'rb') as ins:
+                reader = HashingReader(ins)
+                with open_tar_stream(reader,
+                                     self.compression) as (tar, backend):
+                    self.backend = backend
+                    tar.manifest = self.manifest
+                    tar.extractall(path=tmp, members=listed(tar),
+                                   **extract_kwargs())
+                reader.drain()
+            self._sha256 = reader.hexdigest()
+            root = self.root if strip else None
+            if root is not None:
+                self.manifest = {strip_root(name, root): entry
+                                 for name, entry in self.manifest.items()}
+                move_contents(os.path.join(tmp, root), dst)
+            else:
+                move_contents(tmp, dst)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        return root
+
+
+def move_contents(src, dst):
+    '''
+    Rename src to dst, or if dst is a directory already, rename each
+    entry in src into it (src and dst must be on the same filesystem).
+    '''
+    if not os.path.isdir(dst):
+        os.rename(src, dst)
+        return
+    for name in os.listdir(src):
+        os.rename(os.path.join(src, name), os.path.join(dst, name))
+
+
+class ZipArchive(Archive):
+    def __init__(self, path):
+        from zipfile import ZipFile
+        Archive.__init__(self, path)
+        self._zip = ZipFile(path, 'r')
+        self.backend = "zipfile"
+        self.members = []
+        for info in self._zip.infolist():
+            mode = zip_unix_mode(info)
+            # ^ Only set by Unix zip programs (See extract_zip_member).
+            if mode is not None:
+                mode &= 0o7777
+            self.members.append((info.filename, info.filename.endswith("/"),
+                                 mode or None, info.file_size, info))
+
+    random_access = True
+
+    def close(self):
+        self._zip.close()
+
+    def _read_header(self, info, size):
+        mode = zip_unix_mode(info)
+        if (mode is not None) and stat.S_ISLNK(mode):
+            return None  # The content is only the target.
+        with self._zip.open(info) as ins:
+            return ins.read(size)
+
+    def _extract(self, dst, root, workers):
+        infos = []
+        links = []
+        for name, _, _, _, info in self.members:
+            if root is not None:
+                name = strip_root(name, root)
+                if not name:
+                    continue
+                info = copy.copy(info)
+                info.filename = name
+                # ^ Only the output path changes (ZipFile still checks
+                #   the local header against info.orig_filename).
+            mode = zip_unix_mode(info)
+            if (mode is not None) and stat.S_ISLNK(mode):
+                links.append(info)
+                # ^ Last, so no member is written through a symlink.
+                continue
+            infos.append(info)
+        if links:
+            link_names = set("/".join(safe_parts(info.filename))
+                             for info in links)
+            infos = [info for info in infos
+                     if not under_link(info.filename, link_names)]
+        if workers is None:
+            workers = default_workers()
+        files = [info for info in infos if not info.filename.endswith("/")]
+        if (workers < 2) or (len(files) < ZIP_PARALLEL_MIN_FILES):
+            for info in infos:
+                extract_zip_member(self._zip, info, dst, self.manifest)
+        else:
+            self._extract_parallel(dst, infos, files, workers)
+        for info in links:
+            extract_zip_symlink(self._zip, info, dst)
+        dirs = [info for info in infos if info.filename.endswith("/")]
+        for info in sorted(dirs, key=lambda info: len(info.filename),
+                           reverse=True):
+            # ^ Deepest first, in case a mode prevents writing.
+            mode = zip_unix_mode(info)
+            if mode is not None:
+                os.chmod(os.path.join(dst, *safe_parts(info.filename)),
+                         trusted_mode(mode))
+
+    def _extract_parallel(self, dst, infos, files, workers):
+        # Create every directory first (parents before children) so that
+        #   workers never race to create the same one.
+        dir_paths = set()
+        for info in infos:
+            parts = safe_parts(info.filename)
+            if not info.filename.endswith("/"):
+                parts = parts[:-1]
+            for i in range(1, len(parts) + 1):
+                dir_paths.add(os.path.join(dst, *parts[:i]))
+        for dir_path in sorted(dir_paths):
+            if not os.path.isdir(dir_path):
+                os.mkdir(dir_path)
+        parts = partition_by_size(files, workers,
+                                  size=lambda info: info.compress_size)
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=len(parts)) as executor:
+            futures = [executor.submit(self._extract_part, dst, part)
+                       for part in parts]
+            for future in futures:
+                self.manifest.update(future.result())
+                # ^ Also raises any exception from the worker.
+
+    def _extract_part(self, dst, infos):
+        '''
+        Extract some members using a separate file handle (so each
+        worker reads at its own position instead of waiting for the
+        lock on the shared one).
+
+        Returns:
+        The manifest of the members (See Archive).
+        '''
+        from zipfile import ZipFile
+        manifest = {}
+        with ZipFile(self.path, 'r') as zf:
+            for info in infos:
+                extract_zip_member(zf, info, dst, manifest)
+        return manifest
+
+
+def extract_zip_member(zf, info, dst, manifest):
+    '''
+    Extract a member of a zip file (to the same path as ZipFile.extract)
+    and hash it while writing it.
+
+    Sequential arguments:
+    zf -- The open ZipFile.
+    info -- The ZipInfo of the member.
+    dst -- The destination directory.
+    manifest -- A dict where [size, mode, sha256] of a file is set (See
+        Archive).
+
+    The mode stored by a Unix zip program is set on the file while it is
+    open (See trusted_mode), so there is no chmod pass afterward. The
+    mode of a directory is set by ZipArchive after its contents.
+    '''
+    parts = safe_parts(info.filename)
+    path = os.path.join(dst, *parts)
+    if info.filename.endswith("/"):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        return
+    parent = os.path.dirname(path)
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    zip_mode = zip_unix_mode(info)
+    sha = hashlib.sha256()
+    with zf.open(info) as source, open(path, 'wb') as target:
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            sha.update(chunk)
+            target.write(chunk)
+        if (zip_mode is not None) and hasattr(os, 'fchmod'):
+            os.fchmod(target.fileno(), trusted_mode(zip_mode))
+        mode = os.fstat(target.fileno()).st_mode & 0o7777
+    manifest["/".join(parts)] = [info.file_size, mode, sha.hexdigest()]
+
+
+def extract_zip_symlink(zf, info, dst):
+    '''
+    Create a symlink stored in a zip file (The content of the member is
+    the target). If symlinks aren't supported (such as on Windows
+    without privileges), write the target as a file like ZipFile.extract
+    does.
+    '''
+    path = os.path.join(dst, *safe_parts(info.filename))
+    parent = os.path.dirname(path)
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    target = os.fsdecode(zf.read(info))
+    if os.path.lexists(path):
+        os.remove(path)
+    try:
+        os.symlink(target, path)
+    except (OSError, NotImplementedError) as ex:
+        print("* writing symlink {} as a file: {}".format(path, ex),
+              file=sys.stderr)
+        with open(path, 'w') as outs:
+            outs.write(target)
+
+
+def under_link(name, link_names):
+    '''
+    Check whether a member would be written through a symlink member
+    (such as "lib/evil" if "lib" is a symlink), and if so, warn.
+    '''
+    parts = safe_parts(name)
+    for i in range(1, len(parts)):
+        if "/".join(parts[:i]) in link_names:
+            print("* skipped {} since {} is a symlink"
+                  "".format(name, "/".join(parts[:i])), file=sys.stderr)
+            return True
+    return False
+
+
+def zip_unix_mode(info):
+    '''
+    Get the Unix st_mode (including the file type) of a zip member, or
+    None if the zip program did not store one (such as on Windows).
+    '''
+    if info.create_system != ZIP_UNIX:
+        return None
+    return (info.external_attr >> 16) or None
+
+
+def trusted_mode(mode):
+    '''
+    Get the permission bits to set from a mode in an archive, without
+    setuid, setgid, sticky or write permission for group and others.
+    '''
+    return stat.S_IMODE(mode) & ~UNTRUSTED_MODE_BITS
+
+
+ARCHIVE_CLASSES = {
+    'tar': TarArchive,
+    'zip': ZipArchive,
+}
+
+
+def open_archive(path, category):
+    '''
+    Open an archive for inspection and extraction (use it as a context
+    manager or call close).
+
+    Sequential arguments:
+    path -- The archive file.
+    category -- The key in ARCHIVE_CLASSES, such as 'tar' or 'zip'.
+    '''
+    cls = ARCHIVE_CLASSES.get(category)
+    if cls is None:
+        raise NotImplementedError("There is no case for {}"
+                                  "".format(category))
+    return cls(path)
+
+
+def extract_archive(path, category, dst, strip=True, workers=None):
+    '''
+    Extract an archive directly into dst (See Archive.extract).
+
+    Returns:
+    The stripped top-level directory name, or None if nothing was
+    stripped.
+    '''
+    with open_archive(path, category) as archive:
+        return archive.extract(dst, strip=strip, workers=workers)
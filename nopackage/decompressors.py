@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+'''
+Decompression backends for archives, in order of preference.
+
+A multi-threaded command (such as `xz -T0`, `pigz` or `lbzip2`) is used
+if it is installed, since it decompresses on several cores and in
+another process than the one extracting. Otherwise the codec from the
+standard library (lzma, gzip or bz2) is used. Either way the result is
+a stream that can be read sequentially (such as by tarfile in stream
+mode "r|"). zstd and lz4 require the command or an optional module
+(such as zstandard or lz4).
+
+To add a backend, call register_decompressor.
+'''
+from __future__ import print_function
+
+import importlib
+import shutil
+import subprocess
+import sys
+import threading
+
+CHUNK_SIZE = 1024 * 1024
+
+DECOMPRESSORS = []
+# ^ Decompressor objects in order of preference (See
+#   register_decompressor).
+
+
+def echo0(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+def which(name):
+    if hasattr(shutil, 'which'):
+        return shutil.which(name)
+    from distutils.spawn import find_executable  # Python 2
+    return find_executable(name)
+
+
+class CommandStream(object):
+    '''
+    A readable stream of the output of a command that reads the
+    compressed data from stdin.
+    '''
+    def __init__(self, command, source):
+        '''
+        Sequential arguments:
+        command -- The command as a list (such as ["xz", "-dc"]).
+        source -- A path or a readable binary file-like object. A path
+            is opened as stdin directly. Otherwise a thread copies it to
+            stdin (so it works with streams such as ar members).
+        '''
+        self.command = command
+        self.eof = False
+        self._feeder = None
+        self._feed_error = None
+        if hasattr(source, 'read'):
+            self.proc = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE)
+            self._feeder = threading.Thread(target=self._feed,
+                                            args=(source,))
+            self._feeder.daemon = True
+            self._feeder.start()
+        else:
+            with open(source, 'rb') as ins:
+                self.proc = subprocess.Popen(command, stdin=ins,
+                                             stdout=subprocess.PIPE)
+
+    def _feed(self, source):
+        try:
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                self.proc.stdin.write(chunk)
+        except (IOError, OSError) as ex:
+            # Such as a broken pipe if the command exited early.
+            self._feed_error = ex
+        except Exception as ex:
+            self._feed_error = ex
+        finally:
+            try:
+                self.proc.stdin.close()
+            except (IOError, OSError):
+                pass
+
+    def read(self, size=-1):
+        data = self.proc.stdout.read(size)
+        if (not data) and (size != 0):
+            self.eof = True
+        return data
+
+    def close(self):
+        '''
+        Stop the command. If all of the output was read, raise IOError
+        if the command failed (If the reader stopped early, such as at
+        the end-of-archive marker of a tar, the command may have failed
+        only due to the closed pipe).
+        '''
+        if self.proc.stdout.closed:
+            return
+        self.proc.stdout.close()
+        if not self.eof:
+            self.proc.kill()
+        returncode = self.proc.wait()
+        if self._feeder is not None:
+            self._feeder.join()
+        if self.eof and (returncode != 0):
+            raise IOError("`{}` failed with code {}"
+                          "".format(" ".join(self.command), returncode))
+        if self.eof and (self._feed_error is not None):
+            raise self._feed_error
+
+
+class Decompressor(object):
+    '''
+    A way to decompress one compression format: either an external
+    command or a standard library module.
+    '''
+    def __init__(self, name, compression, command=None, module=None):
+        '''
+        Sequential arguments:
+        name -- The name shown in the log (such as "xz -T0").
+        compression -- The format, such as 'gz', 'xz', 'bz2', 'zst' or
+            'lz4' (See COMPRESSION_MAGIC in nopackage.archives).
+
+        Keyword arguments:
+        command -- The command that decompresses stdin to stdout.
+        module -- The name of a module that has an open(fileobj, 'rb')
+            function (such as 'lzma' or 'lz4.frame'). Either command or
+            module is required.
+        '''
+        if (command is None) == (module is None):
+            raise ValueError("Specify either command or module.")
+        self.name = name
+        self.compression = compression
+        self.command = command
+        self.module = module
+        self._available = None
+
+    def __repr__(self):
+        return "Decompressor({})".format(repr(self.name))
+
+    def is_available(self):
+        if self._available is None:
+            if self.command is not None:
+                self._available = which(self.command[0]) is not None
+            else:
+                try:
+                    importlib.import_module(self.module)
+                    self._available = True
+                except ImportError:
+                    self._available = False
+        return self._available
+
+    def open(self, source):
+        '''
+        Get a readable stream of the decompressed data (close it when
+        done).
+
+        Sequential arguments:
+        source -- A path or a readable binary file-like object.
+        '''
+        if self.command is not None:
+            return CommandStream(self.command, source)
+        module = importlib.import_module(self.module)
+        return module.open(source, 'rb')
+
+
+def register_decompressor(decompressor, first=False):
+    '''
+    Add a decompressor (The first available one for a compression
+    format is used).
+
+    Keyword arguments:
+    first -- Prefer it over any decompressor already registered.
+    '''
+    if first:
+        DECOMPRESSORS.insert(0, decompressor)
+    else:
+        DECOMPRESSORS.append(decompressor)
+
+
+def find_decompressor(compression):
+    '''
+    Get the preferred available Decompressor for the compression
+    format (such as 'xz'), or None if there is none.
+    '''
+    for decompressor in DECOMPRESSORS:
+        if decompressor.compression != compression:
+            continue
+        if decompressor.is_available():
+            return decompressor
+    return None
+
+
+# Multi-threaded commands:
+register_decompressor(Decompressor("xz -T0", 'xz',
+                                   command=["xz", "-d", "-c", "-T0"]))
+register_decompressor(Decompressor("pigz", 'gz',
+                                   command=["pigz", "-d", "-c"]))
+register_decompressor(Decompressor("lbzip2", 'bz2',
+                                   command=["lbzip2", "-d", "-c"]))
+register_decompressor(Decompressor("pbzip2", 'bz2',
+                                   command=["pbzip2", "-d", "-c"]))
+# Standard library fallbacks (one core):
+register_decompressor(Decompressor("lzma", 'xz', module="lzma"))
+register_decompressor(Decompressor("gzip", 'gz', module="gzip"))
+register_decompressor(Decompressor("bz2", 'bz2', module="bz2"))
+# Formats without a codec in the standard library before Python 3.14
+#   (The command or an optional module is required):
+register_decompressor(Decompressor("zstd", 'zst',
+                                   command=["zstd", "-d", "-c"]))
+register_decompressor(Decompressor("compression.zstd", 'zst',
+                                   module="compression.zstd"))
+register_decompressor(Decompressor("zstandard", 'zst', module="zstandard"))
+register_decompressor(Decompressor("lz4", 'lz4',
+                                   command=["lz4", "-d", "-c"]))
+register_decompressor(Decompressor("lz4.frame", 'lz4', module="lz4.frame"))
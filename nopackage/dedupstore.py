@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+'''
+A content-addressed store that hard links identical files across
+installed programs (such as several versions of Blender installed with
+--multi-version), so each distinct file is only on disk (and in the
+page cache) once.
+
+Layout of the store directory (which must be on the same filesystem as
+the programs, so it is in the programs directory such as
+~/.local/lib64/.nopackage-store):
+- objects/<ab>/<sha256>-<mode>: One hard link to each distinct file,
+  where <ab> is the first 2 characters of the SHA-256 and <mode> is
+  the permission bits in octal (Hard links share the mode, so files
+  that only differ in mode are not linked together).
+
+The reference count of an object is its link count minus the link in
+the store, so the filesystem keeps it accurate whatever removes an
+installed file. Removing one version only removes its links: release
+removes the objects that only the removed version used (checking only
+the files in its manifest), and collect_garbage checks every object.
+
+If the manifest of a program is known (See nopackage.integrity), its
+SHA-256 of each file is used instead of reading the file again, unless
+the size, mode or modification time of the file shows it changed.
+
+A file installed this way is the same inode as identical files in the
+other versions, so do not use it for programs that modify their own
+files in place.
+'''
+from __future__ import print_function
+
+import errno
+import os
+import stat
+import sys
+
+from nopackage.integrity import sha256_file
+
+STORE_NAME = ".nopackage-store"
+TMP_SUFFIX = ".nopackage-dedup"
+
+
+def echo0(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+class DedupStore(object):
+    '''
+    Deduplicate files by hard linking them to objects in the store (See
+    the module documentation).
+    '''
+    def __init__(self, path):
+        '''
+        Sequential arguments:
+        path -- The store directory (created on first use).
+        '''
+        self.path = path
+        self.objects = os.path.join(path, "objects")
+
+    @classmethod
+    def for_programs(cls, programs_dir):
+        '''
+        Get the store for the installed programs in programs_dir (such
+        as ~/.local/lib64).
+        '''
+        return cls(os.path.join(programs_dir, STORE_NAME))
+
+    def object_path(self, digest, mode):
+        return os.path.join(self.objects, digest[:2],
+                            "{}-{:o}".format(digest, mode))
+
+    def refcount(self, object_path):
+        '''
+        Get the number of installed files that use the object.
+        '''
+        return os.stat(object_path).st_nlink - 1
+
+    def dedup_file(self, path, digest=None, st=None):
+        '''
+        Replace path with a hard link to the object with the same content
+        and mode, or add it as the object if there is none.
+
+        Keyword arguments:
+        digest -- The SHA-256 of the file if known (otherwise it is
+            read).
+        st -- The result of os.lstat(path) if known.
+
+        Returns:
+        The number of bytes freed (0 if the file was added to the
+        store, was already linked, or could not be linked).
+        '''
+        if st is None:
+            st = os.lstat(path)
+        if digest is None:
+            digest = sha256_file(path)
+        mode = stat.S_IMODE(st.st_mode)
+        object_path = self.object_path(digest, mode)
+        try:
+            obj_st = os.stat(object_path)
+        except OSError as ex:
+            if ex.errno != errno.ENOENT:
+                raise
+            parent = os.path.dirname(object_path)
+            if not os.path.isdir(parent):
+                os.makedirs(parent)
+            try:
+                os.link(path, object_path)
+            except OSError as ex:
+                if ex.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM):
+                    raise
+                echo0("* not deduplicating {}: {}".format(path, ex))
+            return 0
+        if (obj_st.st_dev, obj_st.st_ino) == (st.st_dev, st.st_ino):
+            return 0
+        tmp = path + TMP_SUFFIX
+        try:
+            os.link(object_path, tmp)
+        except OSError as ex:
+            if ex.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM):
+                raise
+            echo0("* not deduplicating {}: {}".format(path, ex))
+            return 0
+        os.rename(tmp, path)
+        # ^ Atomic, so path is never missing.
+        if st.st_nlink > 1:
+            return 0  # Another link (such as a cache) still uses it.
+        return st.st_size
+
+    def dedup_tree(self, root, manifest=None, since=None):
+        '''
+        Deduplicate every regular file under root (Symlinks and empty
+        files are skipped).
+
+        Keyword arguments:
+        manifest -- The manifest of root ({relative path: [size, mode,
+            sha256]}). If set, only the files in it are deduplicated,
+            and the SHA-256 in it is used for each file that has the
+            same size and mode (and was not modified after since).
+        since -- The time (as from time.time) when the manifest was
+            recorded, or None if the files were not modified since then
+            (such as right after extracting them).
+
+        Returns:
+        A dict with 'files' (the number of files checked), 'hashed'
+        (the number of files read to hash them) and 'freed' (bytes).
+        '''
+        result = {'files': 0, 'hashed': 0, 'freed': 0}
+        for path, entry in self._files(root, manifest):
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue  # Such as if it was removed after the install.
+            if (not stat.S_ISREG(st.st_mode)) or (st.st_size == 0):
+                continue
+            digest = None
+            if ((entry is not None) and (entry[0] == st.st_size)
+                    and (entry[1] == stat.S_IMODE(st.st_mode))
+                    and ((since is None) or (st.st_mtime <= since))):
+                digest = entry[2]
+            else:
+                result['hashed'] += 1
+            result['files'] += 1
+            result['freed'] += self.dedup_file(path, digest=digest, st=st)
+        return result
+
+    def _files(self, root, manifest):
+        '''
+        Yield a (path, entry) tuple for each file in the manifest, or for
+        each file under root (with entry None) if manifest is None.
+        '''
+        if manifest is not None:
+            for rel, entry in manifest.items():
+                yield os.path.join(root, *rel.split("/")), entry
+            return
+        for parent, dir_names, file_names in os.walk(root):
+            for name in file_names:
+                yield os.path.join(parent, name), None
+
+    def release(self, root, manifest):
+        '''
+        Remove the objects that only the files of root use, before root
+        is removed (The removed files keep their content). Only the
+        files in the manifest are checked, so this doesn't scan the
+        store.
+
+        Sequential arguments:
+        root -- The installed directory that will be removed.
+        manifest -- The manifest of root (See dedup_tree).
+
+        Returns:
+        A tuple of (objects removed, bytes freed once root is deleted).
+        '''
+        removed = 0
+        freed = 0
+        if not os.path.isdir(self.objects):
+            return removed, freed
+        for path, entry in self._files(root, manifest):
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            if (not stat.S_ISREG(st.st_mode)) or (st.st_nlink != 2):
+                continue
+                # ^ Only this file and the object use the inode.
+            object_path = self.object_path(entry[2],
+                                           stat.S_IMODE(st.st_mode))
+            try:
+                obj_st = os.lstat(object_path)
+            except OSError:
+                continue
+            if (obj_st.st_dev, obj_st.st_ino) != (st.st_dev, st.st_ino):
+                continue  # Such as if the file was changed in place.
+            os.remove(object_path)
+            removed += 1
+            freed += st.st_size
+            try:
+                os.rmdir(os.path.dirname(object_path))
+            except OSError:
+                pass  # Other objects are still in it.
+        return removed, freed
+
+    def collect_garbage(self):
+        '''
+        Remove the objects that no installed file uses (See refcount),
+        checking every object in the store (See release to only check
+        the objects of one program).
+
+        Returns:
+        A tuple of (objects removed, bytes freed).
+        '''
+        removed = 0
+        freed = 0
+        if not os.path.isdir(self.objects):
+            return removed, freed
+        for prefix in os.listdir(self.objects):
+            folder = os.path.join(self.objects, prefix)
+            for name in os.listdir(folder):
+                object_path = os.path.join(folder, name)
+                st = os.stat(object_path)
+                if st.st_nlink > 1:
+                    continue
+                os.remove(object_path)
+                removed += 1
+                freed += st.st_size
+            if not os.listdir(folder):
+                os.rmdir(folder)
+        return removed, freed
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+'''
+An opt-in cache of extracted archives keyed by the SHA-256 of the
+archive, so that reinstalling an unchanged archive only links the
+files into place instead of decompressing it again.
+
+Layout of the cache directory:
+- index.json: The entries (size, last use, stripped root directory),
+  the hit, miss and eviction counters, and the size, mtime and key of
+  each archive that was added (See source_key).
+- trees/<sha256>/: The extracted tree. Files are hard links to the
+  installed files where possible, so a cached tree that is installed
+  uses no additional disk space.
+- manifests/<sha256>.json: The size and mtime of each file, so an entry
+  is discarded if an installed copy (which may be the same inode) was
+  modified.
+- manifests/<sha256>.files.json: The integrity manifest recorded when
+  the archive was extracted (See nopackage.integrity), if any.
+
+Entries are evicted least-recently-used first when the total size
+exceeds the quota.
+'''
+from __future__ import print_function
+
+import errno
+import json
+import os
+import shutil
+import sys
+import time
+
+from nopackage.metastore import write_json_atomic
+
+DEFAULT_QUOTA = 4 * 1024 * 1024 * 1024  # bytes
+
+
+def echo0(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+def file_signature(st):
+    '''
+    Get [size, mtime in nanoseconds] from an os.stat result.
+    '''
+    mtime_ns = getattr(st, 'st_mtime_ns', None)
+    if mtime_ns is None:
+        mtime_ns = int(st.st_mtime * 1000000000)  # Python 2
+    return [st.st_size, mtime_ns]
+
+
+def link_or_copy(src, dst):
+    '''
+    Hard link src to dst, or copy it if a link is not possible (such as
+    if they are on different filesystems).
+    '''
+    try:
+        os.link(src, dst)
+    except OSError as ex:
+        if ex.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK,
+                            errno.ENOTSUP):
+            raise
+        shutil.copy2(src, dst)
+
+
+def link_tree(src, dst):
+    '''
+    Recreate the directory tree src at dst (which must not exist) using
+    hard links for files (See link_or_copy) and copies of symlinks.
+
+    Returns:
+    a dict of {relative path: [size, mtime_ns]} for each file.
+    '''
+    manifest = {}
+    dirs = []
+    for parent, dir_names, file_names in os.walk(src):
+        rel_parent = os.path.relpath(parent, src)
+        if rel_parent == ".":
+            rel_parent = ""
+        dst_parent = os.path.join(dst, rel_parent)
+        os.makedirs(dst_parent)
+        dirs.append((parent, dst_parent))
+        for name in list(dir_names):
+            path = os.path.join(parent, name)
+            if os.path.islink(path):
+                # os.walk doesn't follow it, so copy the link itself.
+                os.symlink(os.readlink(path), os.path.join(dst_parent, name))
+                dir_names.remove(name)
+        for name in file_names:
+            path = os.path.join(parent, name)
+            dst_path = os.path.join(dst_parent, name)
+            if os.path.islink(path):
+                os.symlink(os.readlink(path), dst_path)
+                continue
+            link_or_copy(path, dst_path)
+            manifest[os.path.join(rel_parent, name)] = \
+                file_signature(os.stat(dst_path))
+    for parent, dst_parent in reversed(dirs):
+        shutil.copystat(parent, dst_parent)
+    return manifest
+
+
+class ExtractionCache(object):
+    '''
+    Keep extracted archives (See the module documentation).
+    '''
+    def __init__(self, path, quota=DEFAULT_QUOTA):
+        '''
+        Sequential arguments:
+        path -- The cache directory (created if not present).
+
+        Keyword arguments:
+        quota -- The maximum total size in bytes of the cached files.
+        '''
+        self.path = path
+        self.quota = quota
+        self.index_path = os.path.join(path, "index.json")
+        self.trees = os.path.join(path, "trees")
+        self.manifests = os.path.join(path, "manifests")
+        for folder in (self.trees, self.manifests):
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+        self.index = {'entries': {}, 'sources': {}, 'hits': 0,
+                      'misses': 0, 'evictions': 0}
+        if os.path.isfile(self.index_path):
+            with open(self.index_path, 'r') as ins:
+                self.index.update(json.load(ins))
+
+    def save(self):
+        write_json_atomic(self.index_path, self.index)
+
+    def tree_path(self, key):
+        return os.path.join(self.trees, key)
+
+    def manifest_path(self, key):
+        return os.path.join(self.manifests, key + ".json")
+
+    def files_path(self, key):
+        return os.path.join(self.manifests, key + ".files.json")
+
+    def load_files(self, key):
+        '''
+        Get the integrity manifest saved by add, or None if there is none.
+        '''
+        path = self.files_path(key)
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'r') as ins:
+            return json.load(ins)
+
+    def total_size(self):
+        return sum(entry['size'] for entry in self.index['entries'].values())
+
+    def stats(self):
+        '''
+        Get a dict of the counters and totals (for showing to the user).
+        '''
+        return {
+            'hits': self.index['hits'],
+            'misses': self.index['misses'],
+            'evictions': self.index['evictions'],
+            'entries': len(self.index['entries']),
+            'size': self.total_size(),
+            'quota': self.quota,
+        }
+
+    def _is_intact(self, key):
+        manifest_path = self.manifest_path(key)
+        if not os.path.isfile(manifest_path):
+            return False
+        with open(manifest_path, 'r') as ins:
+            manifest = json.load(ins)
+        tree = self.tree_path(key)
+        for rel_path, signature in manifest.items():
+            try:
+                st = os.stat(os.path.join(tree, rel_path))
+            except OSError:
+                return False
+            if file_signature(st) != signature:
+                return False
+        return True
+
+    def source_key(self, path):
+        '''
+        Get the key of an archive that was added from path (See add) if
+        its size and mtime haven't changed since, so an unchanged
+        archive doesn't have to be read to compute its SHA-256.
+
+        Returns:
+        The key, or None if path is unknown or was modified.
+        '''
+        source = self.index['sources'].get(os.path.abspath(path))
+        if source is None:
+            return None
+        try:
+            signature = file_signature(os.stat(path))
+        except OSError:
+            return None
+        if signature != source[:2]:
+            return None
+        return source[2]
+
+    def get(self, key):
+        '''
+        Look up an extracted archive and count a hit or miss. A modified
+        entry (See _is_intact) is removed and counts as a miss.
+
+        Sequential arguments:
+        key -- The SHA-256 of the archive (See sha256_file in
+            integrity.py), or None to count a miss without a lookup
+            (such as if the key is only known after extracting).
+
+        Returns:
+        The entry dict (with 'root', the stripped top-level directory,
+        and 'size'), or None.
+        '''
+        entry = None
+        if key is not None:
+            entry = self.index['entries'].get(key)
+        if (entry is not None) and (not self._is_intact(key)):
+            echo0("* discarding the modified extraction cache entry {}"
+                  "".format(key))
+            self.remove(key)
+            entry = None
+        if entry is None:
+            self.index['misses'] += 1
+        else:
+            self.index['hits'] += 1
+            entry['last_used'] = time.time()
+        self.save()
+        return entry
+
+    def materialize(self, key, dst):
+        '''
+        Create dst (which must not exist) from the cached tree using hard
+        links (or copies if not possible).
+        '''
+        link_tree(self.tree_path(key), dst)
+
+    def add(self, key, src, root=None, source=None, files=None):
+        '''
+        Cache the extracted tree src (such as the installed directory)
+        using hard links, then evict entries over the quota.
+
+        Keyword arguments:
+        root -- The top-level directory that was stripped (if any).
+        source -- The path of the archive (See source_key).
+        files -- The integrity manifest of the extracted files (See
+            load_files).
+
+        Returns:
+        True if added, or False if the tree alone exceeds the quota.
+        '''
+        if key in self.index['entries']:
+            self.remove(key)
+        tmp = self.tree_path(key) + ".tmp"
+        if os.path.isdir(tmp):
+            shutil.rmtree(tmp)
+        manifest = link_tree(src, tmp)
+        size = sum(size for size, _ in manifest.values())
+        if size > self.quota:
+            shutil.rmtree(tmp)
+            echo0("* not caching {} since {} bytes exceeds the quota {}"
+                  "".format(source, size, self.quota))
+            return False
+        write_json_atomic(self.manifest_path(key), manifest, compact=True)
+        if files is not None:
+            write_json_atomic(self.files_path(key), files, compact=True)
+        os.rename(tmp, self.tree_path(key))
+        self.index['entries'][key] = {
+            'size': size,
+            'last_used': time.time(),
+            'root': root,
+            'source': source,
+        }
+        if (source is not None) and os.path.isfile(source):
+            self.index['sources'][os.path.abspath(source)] = \
+                file_signature(os.stat(source)) + [key]
+        self.evict(keep=key)
+        self.save()
+        return True
+
+    def remove(self, key):
+        self.index['entries'].pop(key, None)
+        sources = self.index['sources']
+        for path in [path for path, source in sources.items()
+                     if source[2] == key]:
+            del sources[path]
+        tree = self.tree_path(key)
+        if os.path.isdir(tree):
+            shutil.rmtree(tree)
+        for path in (self.manifest_path(key), self.files_path(key)):
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def evict(self, keep=None):
+        '''
+        Remove the least-recently-used entries until the total size is
+        within the quota.
+
+        Keyword arguments:
+        keep -- A key that must not be evicted (such as the one just
+            added).
+        '''
+        entries = self.index['entries']
+        by_age = sorted(entries.keys(), key=lambda k: entries[k]['last_used'])
+        total = self.total_size()
+        for key in by_age:
+            if total <= self.quota:
+                break
+            if key == keep:
+                continue
+            total -= entries[key]['size']
+            self.remove(key)
+            self.index['evictions'] += 1
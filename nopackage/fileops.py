@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+'''
+Copy, move and delete directory trees with a pool of threads, so that
+many files are in flight at once (an SSD or NVMe drive is faster with a
+deeper queue) instead of waiting for one system call at a time as
+shutil.copytree and shutil.rmtree do.
+
+Each directory is scanned (os.scandir) by a worker, which also deletes
+or copies its files, and its subdirectories are queued for other
+workers. File contents are copied by the kernel where possible
+(os.copy_file_range, which can also share extents on btrfs or XFS, or
+os.sendfile) instead of through Python buffers.
+
+This module only uses the standard library (See nopackage.trash).
+'''
+from __future__ import print_function
+
+import errno
+import os
+import shutil
+import stat
+import sys
+
+MAX_WORKERS = 32
+CHUNK_SIZE = 1024 * 1024
+RANGE_COPY_ERRNOS = (errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                     errno.EOPNOTSUPP, errno.EBADF, errno.ENOTSUP)
+# ^ A kernel copy function can't be used (fall back to the next one).
+
+
+def echo0(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+def default_workers():
+    '''
+    Get the default number of threads. The work is I/O-bound, so it
+    is more than the number of CPUs (as in ThreadPoolExecutor).
+    '''
+    cpu_count = None
+    if hasattr(os, 'cpu_count'):
+        cpu_count = os.cpu_count()
+    return min(MAX_WORKERS, (cpu_count or 1) + 4)
+
+
+def _kernel_copy(fsrc, fdst):
+    '''
+    Copy the content of one open file to another in the kernel.
+
+    Returns:
+    True if copied, or False if no kernel copy function copied anything
+    (such as if none is supported for these files, or the file is
+    empty).
+    '''
+    in_fd = fsrc.fileno()
+    out_fd = fdst.fileno()
+    functions = []
+    if hasattr(os, 'copy_file_range'):
+        functions.append(lambda offset: os.copy_file_range(
+            in_fd, out_fd, CHUNK_SIZE * 8))
+    if sys.platform.startswith("linux") and hasattr(os, 'sendfile'):
+        # ^ Only Linux supports a regular file as the destination.
+        functions.append(lambda offset: os.sendfile(
+            out_fd, in_fd, offset, CHUNK_SIZE * 8))
+    for function in functions:
+        offset = 0
+        try:
+            while True:
+                sent = function(offset)
+                if sent == 0:
+                    break
+                offset += sent
+        except OSError as ex:
+            if (offset > 0) or (ex.errno not in RANGE_COPY_ERRNOS):
+                raise
+        if offset > 0:
+            return True
+        # ^ Nothing at the start may mean the function doesn't work for
+        #   these files (copy_file_range returns 0 for files in /proc or
+        #   on some filesystems), so try the next one or copyfileobj.
+    return False
+
+
+def copy_file(src, dst):
+    '''
+    Copy a file with its permissions and times (like shutil.copy2) using
+    a kernel copy function if possible (See _kernel_copy).
+    '''
+    with open(src, 'rb') as fsrc:
+        with open(dst, 'wb') as fdst:
+            if not _kernel_copy(fsrc, fdst):
+                shutil.copyfileobj(fsrc, fdst, CHUNK_SIZE)
+    shutil.copystat(src, dst)
+
+
+def _run_tree(root, visit, workers):
+    '''
+    Scan a tree with a pool of threads.
+
+    Sequential arguments:
+    root -- The directory.
+    visit -- A function that accepts a directory path and a list of the
+        DirEntry objects in it, handles the entries that aren't
+        directories, and returns the paths of the subdirectories to
+        scan.
+    workers -- The number of threads (None for default_workers()).
+
+    Returns:
+    The list of directories (parents before children).
+    '''
+    from concurrent.futures import (
+        FIRST_COMPLETED,
+        ThreadPoolExecutor,
+        wait,
+    )
+    if workers is None:
+        workers = default_workers()
+
+    def scan(path):
+        entries = list(os.scandir(path))
+        # ^ Close the directory before changing it.
+        return visit(path, entries)
+
+    dirs = [root]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = set([executor.submit(scan, root)])
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for sub_path in future.result():
+                    dirs.append(sub_path)
+                    pending.add(executor.submit(scan, sub_path))
+    return dirs
+
+
+def delete_tree(path, workers=None):
+    '''
+    Delete a directory tree (like shutil.rmtree, but files in many
+    directories are deleted at once). Symlinks are removed, not
+    followed.
+    '''
+    if os.path.islink(path) or not os.path.isdir(path):
+        os.remove(path)
+        return
+
+    def visit(parent, entries):
+        sub_dirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                sub_dirs.append(entry.path)
+            else:
+                os.unlink(entry.path)
+        return sub_dirs
+
+    dirs = _run_tree(path, visit, workers)
+    for dir_path in reversed(dirs):
+        os.rmdir(dir_path)
+
+
+def copy_tree(src, dst, workers=None):
+    '''
+    Copy a directory tree (like shutil.copytree with symlinks=True, but
+    files in many directories are copied at once). dst must not exist.
+    '''
+    os.mkdir(dst)
+
+    def target(path):
+        rel = os.path.relpath(path, src)
+        if rel == ".":
+            return dst
+        return os.path.join(dst, rel)
+
+    def visit(parent, entries):
+        sub_dirs = []
+        dst_parent = target(parent)
+        for entry in entries:
+            dst_path = os.path.join(dst_parent, entry.name)
+            if entry.is_symlink():
+                os.symlink(os.readlink(entry.path), dst_path)
+            elif entry.is_dir():
+                os.mkdir(dst_path)
+                # ^ Before returning, so it exists before its contents.
+                sub_dirs.append(entry.path)
+            elif entry.is_file():
+                copy_file(entry.path, dst_path)
+            else:
+                echo0("* skipped special file {}".format(entry.path))
+        return sub_dirs
+
+    dirs = _run_tree(src, visit, workers)
+    for dir_path in reversed(dirs):
+        shutil.copystat(dir_path, target(dir_path))
+        # ^ After the contents, in case it isn't writable.
+
+
+def move_path(src, dst, workers=None):
+    '''
+    Move a file or directory (like shutil.move to a path that doesn't
+    exist). If it is on another filesystem, it is copied then deleted
+    using copy_tree and delete_tree.
+    '''
+    try:
+        os.rename(src, dst)
+        return
+    except OSError as ex:
+        if ex.errno != errno.EXDEV:
+            raise
+    if os.path.isdir(src) and not os.path.islink(src):
+        copy_tree(src, dst, workers=workers)
+        delete_tree(src, workers=workers)
+    elif os.path.islink(src):
+        os.symlink(os.readlink(src), dst)
+        os.unlink(src)
+    elif stat.S_ISREG(os.stat(src).st_mode):
+        copy_file(src, dst)
+        os.unlink(src)
+    else:
+        shutil.move(src, dst)
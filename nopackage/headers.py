@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+'''
+Classify a file by its first bytes (ELF, shebang script, PE or jar), so
+the binary of a program can be detected even if the archive did not
+store its mode, and so an ELF file for another architecture is never
+chosen.
+
+Only HEADER_SIZE bytes of each file are read (See read_headers, which
+reads many files at once using a pool of threads).
+'''
+from __future__ import print_function
+
+import platform
+import struct
+import sys
+
+HEADER_SIZE = 64
+
+ELF_MAGIC = b"\x7fELF"
+PE_MAGIC = b"MZ"
+ZIP_MAGIC = b"PK\x03\x04"
+SHEBANG = b"#!"
+
+ELF_MACHINES = {
+    # platform.machine(): (e_machine, bits)
+    'x86_64': (62, 64),
+    'amd64': (62, 64),
+    'i386': (3, 32),
+    'i486': (3, 32),
+    'i586': (3, 32),
+    'i686': (3, 32),
+    'x86': (3, 32),
+    'aarch64': (183, 64),
+    'arm64': (183, 64),
+    'armv6l': (40, 32),
+    'armv7l': (40, 32),
+    'ppc64le': (21, 64),
+    'ppc64': (21, 64),
+    'riscv64': (243, 64),
+    's390x': (22, 64),
+}
+COMPATIBLE_MACHINES = {
+    62: (3,),  # An x86_64 kernel can run i386 programs (multilib).
+    183: (40,),  # Likewise for aarch64 and 32-bit arm.
+}
+
+SCORES = {
+    'elf': 5,  # for the host architecture
+    'elf-compatible': 4,
+    'script': 3,
+    'jar': 2,
+    'pe': 1,  # runs with wine
+    None: 0,  # unknown (such as if the header could not be read)
+    'zip': -1,
+    'data': -1,
+    'elf-foreign': -2,
+}
+# ^ See score_header. A negative score means it can't be the binary.
+
+
+def echo0(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+def host_machine():
+    '''
+    Get the (e_machine, bits) of ELF programs for this computer, or
+    (None, bits) if the architecture isn't in ELF_MACHINES.
+    '''
+    machine = ELF_MACHINES.get(platform.machine().lower())
+    if machine is None:
+        return None, struct.calcsize('P') * 8
+    return machine
+
+
+def host_bits():
+    '''
+    Get whether this computer runs 64-bit or 32-bit programs (The
+    architecture of the system, not of the Python build).
+    '''
+    return host_machine()[1]
+
+
+def classify_header(data, name=None):
+    '''
+    Classify the first bytes of a file.
+
+    Sequential arguments:
+    data -- The first bytes (up to HEADER_SIZE), or None if unknown.
+
+    Keyword arguments:
+    name -- The file name (so ".jar" is a jar even if the first entry
+        is not META-INF).
+
+    Returns:
+    a (kind, detail) tuple where kind is a key in SCORES ('elf' etc.)
+    and detail is the e_machine for ELF, the interpreter (such as
+    "python3") for a script, or None.
+    '''
+    if data is None:
+        return None, None
+    if data.startswith(ELF_MAGIC):
+        if len(data) < 20:
+            return 'data', None
+        order = ">" if data[5:6] == b"\x02" else "<"
+        machine = struct.unpack(order + "H", data[18:20])[0]
+        return 'elf', machine
+    if data.startswith(SHEBANG):
+        line = data[2:].split(b"\n", 1)[0].strip()
+        parts = line.decode('utf-8', 'replace').split()
+        interpreter = None
+        if parts:
+            interpreter = parts[0].rsplit("/", 1)[-1]
+            if (interpreter == "env") and (len(parts) > 1):
+                interpreter = parts[1]
+        return 'script', interpreter
+    if data.startswith(PE_MAGIC):
+        return 'pe', None
+    if data.startswith(ZIP_MAGIC):
+        if name and name.lower().endswith(".jar"):
+            return 'jar', None
+        if data[30:38] == b"META-INF":
+            # ^ The name of the first entry (after the 30-byte local
+            #   header), which is the manifest in a jar.
+            return 'jar', None
+        return 'zip', None
+    return 'data', None
+
+
+def score_header(kind, detail, machine=None):
+    '''
+    Score the result of classify_header (See SCORES).
+
+    Keyword arguments:
+    machine -- The e_machine of the host (default: host_machine()).
+    '''
+    if kind == 'elf':
+        if machine is None:
+            machine = host_machine()[0]
+        if (machine is not None) and (detail != machine):
+            if detail in COMPATIBLE_MACHINES.get(machine, ()):
+                kind = 'elf-compatible'
+            else:
+                kind = 'elf-foreign'
+    return SCORES[kind]
+
+
+def read_headers(tree, names, workers=None):
+    '''
+    Read the first HEADER_SIZE bytes of several files at once.
+
+    Sequential arguments:
+    tree -- A DirectoryTree or MemberTree (See nopackage.trees).
+    names -- Paths relative to the tree.
+
+    Keyword arguments:
+    workers -- The number of threads (default: see
+        nopackage.fileops.default_workers).
+
+    Returns:
+    A dict of {name: (kind, detail, score)} (See classify_header).
+    '''
+    from concurrent.futures import ThreadPoolExecutor
+    from nopackage.fileops import default_workers
+    names = list(names)
+    if workers is None:
+        workers = default_workers()
+    workers = max(1, min(workers, len(names)))
+
+    def read(name):
+        return tree.read_header(name, HEADER_SIZE)
+
+    if workers == 1:
+        datas = [read(name) for name in names]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            datas = list(executor.map(read, names))
+    machine = host_machine()[0]
+    results = {}
+    for name, data in zip(names, datas):
+        kind, detail = classify_header(data, name=name)
+        results[name] = (kind, detail, score_header(kind, detail, machine))
+    return results
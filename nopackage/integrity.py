@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+'''
+Integrity records of installed programs:
+- The SHA-256 of the archive. A tar or deb is read in order while it is
+  extracted, so it is hashed during that read (See HashingReader). A
+  zip is read by member instead, so hashing it is one more read of the
+  file (See sha256_file), which is only done if the digest is needed.
+- A manifest of each installed file: {relative path: [size, mode,
+  sha256]} where the path uses "/" and mode is the permission bits,
+  computed while each file is extracted (See ManifestTarFile and
+  extract_zip_member in nopackage.archives).
+
+The archive can also be checked against a SHA256SUMS file (the output
+of sha256sum) before anything is installed (See verify_sha256sums).
+'''
+from __future__ import print_function
+
+import hashlib
+import os
+import sys
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def echo0(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+def sha256_file(path):
+    '''
+    Get the SHA-256 hex digest of a file without loading it all into
+    memory.
+    '''
+    sha = hashlib.sha256()
+    with open(path, 'rb') as ins:
+        while True:
+            chunk = ins.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class HashingReader(object):
+    '''
+    A readable stream that computes the SHA-256 of everything read from
+    another stream.
+    '''
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.name = getattr(fileobj, 'name', None)
+        self.sha = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.sha.update(data)
+        return data
+
+    def drain(self):
+        '''
+        Read the rest of the stream (such as after the end-of-archive
+        marker of a tar) so the digest is of the whole file.
+        '''
+        while self.read(CHUNK_SIZE):
+            pass
+
+    def hexdigest(self):
+        return self.sha.hexdigest()
+
+
+def parse_sha256sums(path):
+    '''
+    Read a SHA256SUMS file (lines of "<sha256>  <name>", or
+    "<sha256> *<name>" for binary mode).
+
+    Returns:
+    a dict of {name: lowercase sha256}.
+    '''
+    sums = {}
+    with open(path, 'r') as ins:
+        for rawL in ins:
+            line = rawL.strip()
+            if (not line) or line.startswith("#"):
+                continue
+            parts = line.split(None, 1)
+            if len(parts) != 2:
+                echo0("{}: Warning: skipped bad line: {}"
+                      "".format(path, line))
+                continue
+            digest, name = parts
+            if name.startswith("*"):
+                name = name[1:]
+            sums[name] = digest.lower()
+    return sums
+
+
+def verify_sha256sums(sums_path, path, digest):
+    '''
+    Check the digest of a file against a SHA256SUMS file.
+
+    Sequential arguments:
+    sums_path -- The SHA256SUMS file.
+    path -- The file that was hashed (matched by name).
+    digest -- The SHA-256 hex digest of path.
+
+    Raises:
+    ValueError if the file is not listed or the digest does not match.
+    '''
+    sums = parse_sha256sums(sums_path)
+    name = os.path.basename(path)
+    expected = sums.get(name)
+    if expected is None:
+        for listed, listed_digest in sums.items():
+            if os.path.basename(listed) == name:
+                expected = listed_digest
+                break
+    if expected is None:
+        raise ValueError("{} is not listed in {}".format(name, sums_path))
+    if expected != digest.lower():
+        raise ValueError("The SHA-256 of {} is {} but {} expects {}"
+                         "".format(path, digest, sums_path, expected))
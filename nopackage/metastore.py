@@ -0,0 +1,495 @@
+#!/usr/bin/env python
+'''
+Storage backends for the metadata of installed programs (formerly only
+the localMachine dict saved as local_machine.json).
+
+The metadata is organized as categories (such as 'programs' or
+'packages') of entries (indexed by luid in 'programs' and by sc_name in
+'packages') where each entry is a dict of keys and JSON-compatible
+values. The getDeepValue, setDeepValue and addDeepValue functions in
+nopackage use whichever MetaStore is active:
+- JSONMetaStore keeps everything in one dict and rewrites the whole
+  JSON file on save.
+- SQLiteMetaStore keeps one row per entry and one row per value, so
+  lookups and writes only touch the rows involved regardless of how
+  many programs are tracked.
+'''
+from __future__ import print_function
+
+import copy
+import json
+import os
+import sqlite3
+import stat
+import sys
+import tempfile
+
+
+def echo0(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+def file_mode_for(path):
+    '''
+    Get the permissions of path, or the permissions that a new file
+    would have (0666 except what the umask removes) if it doesn't exist.
+    '''
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        pass
+    umask = os.umask(0)
+    os.umask(umask)
+    # ^ The only way to read the umask (set it back right away).
+    return 0o666 & ~umask
+
+
+def write_json_atomic(path, data, compact=False):
+    '''
+    Write data as JSON so that path is either the old file or the
+    complete new file, even if the process is killed during the write:
+    The data is written to a temporary file in the same directory,
+    flushed to disk (fsync), then renamed over path.
+
+    Sequential arguments:
+    path -- The destination JSON file.
+    data -- Any JSON-serializable object.
+
+    Keyword arguments:
+    compact -- Write without indentation or spaces after separators
+        (faster for large data, but harder to read).
+    '''
+    parent = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(
+        prefix="." + os.path.basename(path) + ".",
+        suffix=".tmp",
+        dir=parent,
+    )
+    try:
+        if hasattr(os, 'fchmod'):
+            os.fchmod(fd, file_mode_for(path))
+            # ^ mkstemp uses 0600, which would otherwise replace the
+            #   mode of path (or ignore the umask if path is new).
+        with os.fdopen(fd, 'w') as outs:
+            if compact:
+                json.dump(data, outs, separators=(',', ':'))
+            else:
+                json.dump(data, outs, indent=2)
+            outs.flush()
+            os.fsync(outs.fileno())
+        if hasattr(os, 'replace'):
+            os.replace(tmp_path, path)
+        else:
+            # Python 2 (rename only overwrites on POSIX)
+            os.rename(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if hasattr(os, 'O_DIRECTORY'):
+        # Also persist the rename itself (POSIX only).
+        dir_fd = os.open(parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        except OSError:
+            pass  # Some filesystems do not support fsync on directories.
+        finally:
+            os.close(dir_fd)
+
+
+class MetaStore(object):
+    '''
+    The interface of a metadata backend. Values must be
+    JSON-compatible. Changes are only guaranteed to be persistent after
+    save().
+
+    Transactions: begin() marks a point that rollback() returns to.
+    save() makes every change since then permanent.
+    '''
+    compact = False  # Only used by backends that write text files.
+
+    def has_category(self, category):
+        raise NotImplementedError("has_category")
+
+    def has_entry(self, category, entry_id):
+        raise NotImplementedError("has_entry")
+
+    def entry_ids(self, category):
+        '''
+        Get a list of entry ids (luids for 'programs', sc_names for
+        'packages'), or None if there is no such category.
+        '''
+        raise NotImplementedError("entry_ids")
+
+    def get_entry(self, category, entry_id):
+        '''
+        Get the entry as a dict (do not modify it), or None if
+        not present.
+        '''
+        raise NotImplementedError("get_entry")
+
+    def get_value(self, category, entry_id, key):
+        '''
+        Get the value, or None if not present.
+        '''
+        raise NotImplementedError("get_value")
+
+    def set_value(self, category, entry_id, key, value):
+        raise NotImplementedError("set_value")
+
+    def delete_value(self, category, entry_id, key):
+        '''
+        Delete the value and return True, or return False if not present.
+        '''
+        raise NotImplementedError("delete_value")
+
+    def append_value(self, category, entry_id, key, value, unique=True):
+        '''
+        Append value to the list named key (created if not present).
+
+        Keyword arguments:
+        unique -- Only append if the value isn't already in the list.
+        '''
+        raise NotImplementedError("append_value")
+
+    def find(self, category, key, value):
+        '''
+        Get a list of ids of entries where key is value.
+        '''
+        raise NotImplementedError("find")
+
+    def begin(self):
+        raise NotImplementedError("begin")
+
+    def rollback(self):
+        raise NotImplementedError("rollback")
+
+    def save(self):
+        raise NotImplementedError("save")
+
+    def close(self):
+        pass
+
+
+class JSONMetaStore(MetaStore):
+    '''
+    Keep the metadata in one dict (See the data attribute) and save it
+    as a JSON file (local_machine.json).
+    '''
+    def __init__(self, path, data=None):
+        '''
+        Sequential arguments:
+        path -- The JSON file to save to.
+
+        Keyword arguments:
+        data -- The already-loaded metadata dict. If None, it is loaded
+            from path (or is empty if path doesn't exist).
+        '''
+        self.path = path
+        if data is None:
+            data = {'programs': {}}
+            if os.path.isfile(path):
+                with open(path, 'r') as ins:
+                    data = json.load(ins)
+        self.data = data
+        self._snapshot = None
+
+    def has_category(self, category):
+        return self.data.get(category) is not None
+
+    def has_entry(self, category, entry_id):
+        return self.get_entry(category, entry_id) is not None
+
+    def entry_ids(self, category):
+        entries = self.data.get(category)
+        if entries is None:
+            return None
+        return list(entries.keys())
+
+    def get_entry(self, category, entry_id):
+        entries = self.data.get(category)
+        if entries is None:
+            return None
+        return entries.get(entry_id)
+
+    def get_value(self, category, entry_id, key):
+        entry = self.get_entry(category, entry_id)
+        if entry is None:
+            return None
+        return entry.get(key)
+
+    def _entry(self, category, entry_id):
+        '''
+        Get the entry, creating it (and its category) if not present.
+        '''
+        if self.data.get(category) is None:
+            self.data[category] = {}
+        if self.data[category].get(entry_id) is None:
+            self.data[category][entry_id] = {}
+        return self.data[category][entry_id]
+
+    def set_value(self, category, entry_id, key, value):
+        self._entry(category, entry_id)[key] = value
+
+    def delete_value(self, category, entry_id, key):
+        entry = self.get_entry(category, entry_id)
+        if (entry is None) or (key not in entry):
+            return False
+        del entry[key]
+        return True
+
+    def append_value(self, category, entry_id, key, value, unique=True):
+        entry = self._entry(category, entry_id)
+        if entry.get(key) is None:
+            entry[key] = []
+        if (not unique) or (value not in entry[key]):
+            entry[key].append(value)
+
+    def find(self, category, key, value):
+        entries = self.data.get(category)
+        if entries is None:
+            return []
+        return [entry_id for entry_id, entry in entries.items()
+                if entry.get(key) == value]
+
+    def begin(self):
+        self._snapshot = copy.deepcopy(self.data)
+
+    def rollback(self):
+        if self._snapshot is None:
+            raise RuntimeError("rollback was called without begin.")
+        # Keep the same dict object since other code may hold it.
+        self.data.clear()
+        self.data.update(self._snapshot)
+        self._snapshot = None
+
+    def save(self):
+        write_json_atomic(self.path, self.data, compact=self.compact)
+
+
+class SQLiteMetaStore(MetaStore):
+    '''
+    Keep the metadata in an SQLite database with one row per entry (in
+    the entries table, so an entry with no values still exists, as in
+    JSONMetaStore) and one row per value (in the meta table).
+
+    The luid (in 'programs') and the sc_name (in 'packages') are the
+    entry_id, so the primary key indexes them. The values of the keys in
+    INDEXED_KEYS (such as the luid of a package, src_path and dst_path)
+    each have a partial index, so find() is fast for those keys.
+
+    Each change is committed right away unless begin() was called, in
+    which case changes are only committed by save() (or discarded by
+    rollback()).
+    '''
+    INDEXED_KEYS = ('luid', 'src_path', 'dst_path')
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        # ^ No implicit transactions (See begin).
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        hasEntries = self.conn.execute(
+            "SELECT 1 FROM sqlite_master"
+            " WHERE type = 'table' AND name = 'entries'"
+        ).fetchone() is not None
+        self.conn.execute("BEGIN")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " category TEXT NOT NULL,"
+            " entry_id TEXT NOT NULL,"
+            " PRIMARY KEY (category, entry_id)"
+            ") WITHOUT ROWID"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta ("
+            " category TEXT NOT NULL,"
+            " entry_id TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT,"
+            " PRIMARY KEY (category, entry_id, key)"
+            ") WITHOUT ROWID"
+        )
+        for key in SQLiteMetaStore.INDEXED_KEYS:
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS meta_{key}"
+                " ON meta (category, value) WHERE key = '{key}'"
+                "".format(key=key)
+            )
+        if not hasEntries:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO entries (category, entry_id)"
+                " SELECT DISTINCT category, entry_id FROM meta"
+            )
+            # ^ Made before there was an entries table.
+        self.conn.execute("COMMIT")
+
+    def has_category(self, category):
+        row = self.conn.execute(
+            "SELECT 1 FROM entries WHERE category = ? LIMIT 1",
+            (category,)
+        ).fetchone()
+        return row is not None
+
+    def has_entry(self, category, entry_id):
+        row = self.conn.execute(
+            "SELECT 1 FROM entries WHERE category = ? AND entry_id = ?",
+            (category, entry_id)
+        ).fetchone()
+        return row is not None
+
+    def entry_ids(self, category):
+        rows = self.conn.execute(
+            "SELECT entry_id FROM entries WHERE category = ?",
+            (category,)
+        ).fetchall()
+        if not rows:
+            return None
+        return [row[0] for row in rows]
+
+    def get_entry(self, category, entry_id):
+        if not self.has_entry(category, entry_id):
+            return None
+        rows = self.conn.execute(
+            "SELECT key, value FROM meta WHERE category = ? AND entry_id = ?",
+            (category, entry_id)
+        ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def get_value(self, category, entry_id, key):
+        row = self.conn.execute(
+            "SELECT value FROM meta"
+            " WHERE category = ? AND entry_id = ? AND key = ?",
+            (category, entry_id, key)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def set_value(self, category, entry_id, key, value):
+        self._write([
+            ("INSERT OR IGNORE INTO entries (category, entry_id)"
+             " VALUES (?, ?)", (category, entry_id)),
+            ("INSERT OR REPLACE INTO meta (category, entry_id, key, value)"
+             " VALUES (?, ?, ?, ?)",
+             (category, entry_id, key, json.dumps(value))),
+        ])
+
+    def _write(self, statements):
+        '''
+        Run a list of (sql, params) statements together: in the open
+        transaction if begin() was called, otherwise in a transaction
+        of their own.
+        '''
+        if self.conn.in_transaction:
+            for sql, params in statements:
+                self.conn.execute(sql, params)
+            return
+        self.conn.execute("BEGIN")
+        try:
+            for sql, params in statements:
+                self.conn.execute(sql, params)
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def delete_value(self, category, entry_id, key):
+        cursor = self.conn.execute(
+            "DELETE FROM meta WHERE category = ? AND entry_id = ? AND key = ?",
+            (category, entry_id, key)
+        )
+        return cursor.rowcount > 0
+
+    def append_value(self, category, entry_id, key, value, unique=True):
+        values = self.get_value(category, entry_id, key)
+        if values is None:
+            values = []
+        if (not unique) or (value not in values):
+            values.append(value)
+        self.set_value(category, entry_id, key, values)
+
+    def find(self, category, key, value):
+        if key in SQLiteMetaStore.INDEXED_KEYS:
+            # The key must be literal for the partial index to be used.
+            sql = ("SELECT entry_id FROM meta WHERE key = '{}'"
+                   " AND category = ? AND value = ?".format(key))
+            params = (category, json.dumps(value))
+        else:
+            sql = ("SELECT entry_id FROM meta WHERE key = ?"
+                   " AND category = ? AND value = ?")
+            params = (key, category, json.dumps(value))
+        return [row[0] for row in self.conn.execute(sql, params)]
+
+    def begin(self):
+        if self.conn.in_transaction:
+            self.conn.execute("COMMIT")
+            # ^ Keep what was already done, like JSONMetaStore.begin.
+        self.conn.execute("BEGIN")
+
+    def rollback(self):
+        if not self.conn.in_transaction:
+            raise RuntimeError("rollback was called without begin.")
+        self.conn.execute("ROLLBACK")
+
+    def save(self):
+        if self.conn.in_transaction:
+            self.conn.execute("COMMIT")
+
+    def close(self):
+        self.conn.close()
+
+    def import_data(self, data):
+        '''
+        Add every value from a localMachine-style dict (such as loaded
+        from local_machine.json) in one transaction.
+
+        Returns:
+        The number of values imported.
+        '''
+        entryRows = []
+        rows = []
+        for category, entries in data.items():
+            if not isinstance(entries, dict):
+                echo0("Warning: skipped non-category {} in metadata"
+                      "".format(category))
+                continue
+            for entry_id, entry in entries.items():
+                entryRows.append((category, entry_id))
+                for key, value in entry.items():
+                    rows.append((category, entry_id, key, json.dumps(value)))
+        self.begin()
+        try:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO entries (category, entry_id)"
+                " VALUES (?, ?)",
+                entryRows
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO meta (category, entry_id, key, value)"
+                " VALUES (?, ?, ?, ?)",
+                rows
+            )
+        except BaseException:
+            self.rollback()
+            raise
+        self.save()
+        return len(rows)
+
+
+def import_json_to_sqlite(json_path, db_path):
+    '''
+    Copy the metadata from a local_machine.json file into an SQLite
+    database (created if not present). The JSON file is not changed.
+
+    Returns:
+    The number of values imported.
+    '''
+    with open(json_path, 'r') as ins:
+        data = json.load(ins)
+    store = SQLiteMetaStore(db_path)
+    try:
+        return store.import_data(data)
+    finally:
+        store.close()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+'''
+Remember what was parsed from the name of each file in a scanned
+directory (See `nopackage scan`), so scanning it again only parses
+files that are new or changed (by size or modification time).
+
+Each scanned directory has one JSON file in the cache directory (such
+as ~/.cache/nopackage/scan), named by the SHA-1 of the absolute path of
+the directory:
+{"format": 2, "directory": path, "entries": {name: [size, mtime_ns,
+result]}} where result is from PackageInfo.parse_many (with the
+'version_key' and 'version_flavor' that find_upgrades adds).
+'''
+from __future__ import print_function
+
+import hashlib
+import json
+import os
+import sys
+
+from nopackage.metastore import write_json_atomic
+
+CACHE_FORMAT = 2
+# ^ Change this if the result of parsing a name changes, so old caches
+#   are ignored.
+
+
+def echo0(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+class ScanCache(object):
+    '''
+    The cached results for one directory (loaded on construction).
+    Call save() after scanning to write any changes.
+    '''
+    def __init__(self, cache_dir, directory):
+        self.directory = os.path.abspath(directory)
+        digest = hashlib.sha1(self.directory.encode('utf-8',
+                                                    'surrogateescape'))
+        self.path = os.path.join(cache_dir, digest.hexdigest() + ".json")
+        self.entries = {}
+        self.changed = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as ins:
+                data = json.load(ins)
+        except (OSError, IOError):
+            return
+        except ValueError as ex:
+            echo0("* ignoring corrupt scan cache {}: {}"
+                  "".format(self.path, ex))
+            self.changed = True
+            return
+        if ((data.get('format') != CACHE_FORMAT)
+                or (data.get('directory') != self.directory)):
+            self.changed = True
+            return
+        self.entries = data.get('entries', {})
+
+    def get(self, name, size, mtime_ns):
+        '''
+        Get the cached result for name, or None if it was not cached or
+        the file has changed since then.
+        '''
+        entry = self.entries.get(name)
+        if (entry is None) or (entry[0] != size) or (entry[1] != mtime_ns):
+            return None
+        return entry[2]
+
+    def set(self, name, size, mtime_ns, result):
+        self.entries[name] = [size, mtime_ns, result]
+        self.changed = True
+
+    def prune(self, names):
+        '''
+        Forget every entry except names (the files that still exist).
+        '''
+        for name in list(self.entries):
+            if name not in names:
+                del self.entries[name]
+                self.changed = True
+
+    def save(self):
+        '''
+        Write the cache if anything changed.
+        '''
+        if not self.changed:
+            return
+        parent = os.path.dirname(self.path)
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+        write_json_atomic(self.path, {
+            'format': CACHE_FORMAT,
+            'directory': self.directory,
+            'entries': self.entries,
+        }, compact=True)
+        self.changed = False
@@ -0,0 +1,429 @@
+#!/usr/bin/env python
+'''
+Random access to the members of a compressed tar (such as an icon or a
+.desktop file in a multi-GB .tar.xz) without decompressing everything
+before the member.
+
+The archive is read once to build a SeekIndex: the offset and size of
+each member in the uncompressed tar, and the restart points where
+decompression can begin without the data before them:
+- xz: each block (from the index at the end of each xz stream, so no
+  decompression is needed to find them). Multi-threaded xz (the default
+  in xz 5.6 or later, or xz -T) writes many blocks; a single-threaded
+  xz writes only one, so that only has a restart point at the start.
+- gz: each gzip member (such as in bgzip or concatenated gzip files).
+  Python's zlib cannot resume in the middle of a deflate stream (it has
+  no inflatePrime), so a plain single-member .tar.gz only has a restart
+  point at the start (but reading still stops at the end of the member).
+- uncompressed tar: any offset.
+
+Reading a member then costs only the data from the nearest restart
+point before it to its end.
+
+Instead of reading the archive again (See SeekIndex.build), the index
+of an archive that is being extracted anyway can be made from the
+member offsets recorded during extraction (See SeekIndex.from_members
+and TarArchive.offsets), which only reads the index of an xz file.
+'''
+from __future__ import print_function
+
+import hashlib
+import json
+import lzma
+import os
+import struct
+import sys
+import tarfile
+import zlib
+
+from nopackage.archives import (
+    normalize_member_name,
+    sniff_file,
+)
+from nopackage.metastore import write_json_atomic
+
+INDEX_FORMAT = 1
+CHUNK_SIZE = 1024 * 1024
+XZ_HEADER_SIZE = 12
+XZ_FOOTER_SIZE = 12
+XZ_FOOTER_MAGIC = b"YZ"
+GZIP_MAGIC = b"\x1f\x8b"
+SEEKABLE_COMPRESSIONS = (None, 'gz', 'xz')
+
+
+def echo0(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+def _read_varint(data, pos):
+    '''
+    Read an xz multibyte integer.
+
+    Returns:
+    a (value, position after it) tuple.
+    '''
+    value = 0
+    shift = 0
+    while True:
+        byte = bytearray(data[pos:pos+1])[0]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _write_varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _pad4(size):
+    return (size + 3) & ~3
+
+
+def xz_blocks(fileobj, file_size):
+    '''
+    List the blocks of an xz file (which may have several streams) from
+    the index of each stream, without decompressing anything.
+
+    Returns:
+    a list of [compressed offset, uncompressed offset, unpadded size,
+    uncompressed size, stream offset] lists in file order.
+    '''
+    streams = []
+    end = file_size
+    while end > 0:
+        fileobj.seek(end - 4)
+        if fileobj.read(4) == b"\0\0\0\0":
+            end -= 4  # Stream padding
+            continue
+        fileobj.seek(end - XZ_FOOTER_SIZE)
+        footer = fileobj.read(XZ_FOOTER_SIZE)
+        if footer[10:12] != XZ_FOOTER_MAGIC:
+            raise ValueError("There is no xz stream footer at {}"
+                             "".format(end - XZ_FOOTER_SIZE))
+        backward_size = (struct.unpack("<I", footer[4:8])[0] + 1) * 4
+        index_start = end - XZ_FOOTER_SIZE - backward_size
+        fileobj.seek(index_start)
+        index = fileobj.read(backward_size)
+        count, pos = _read_varint(index, 1)
+        records = []
+        for _ in range(count):
+            unpadded, pos = _read_varint(index, pos)
+            uncompressed, pos = _read_varint(index, pos)
+            records.append((unpadded, uncompressed))
+        stream_start = (index_start - XZ_HEADER_SIZE
+                        - sum(_pad4(unpadded) for unpadded, _ in records))
+        streams.insert(0, (stream_start, records))
+        end = stream_start
+    blocks = []
+    uncompressed_offset = 0
+    for stream_start, records in streams:
+        offset = stream_start + XZ_HEADER_SIZE
+        for unpadded, uncompressed in records:
+            blocks.append([offset, uncompressed_offset, unpadded,
+                           uncompressed, stream_start])
+            offset += _pad4(unpadded)
+            uncompressed_offset += uncompressed
+    return blocks
+
+
+def wrap_xz_block(stream_header, block, unpadded, uncompressed):
+    '''
+    Make a complete single-block xz stream from one block of another
+    stream, so the lzma module can decompress the block by itself.
+
+    Sequential arguments:
+    stream_header -- The 12-byte header of the original stream (it has
+        the check type that the block uses).
+    block -- The block including its padding.
+    unpadded -- The unpadded size of the block (from the xz index).
+    uncompressed -- The uncompressed size of the block.
+    '''
+    index = bytearray(b"\0")
+    index += _write_varint(1)
+    index += _write_varint(unpadded)
+    index += _write_varint(uncompressed)
+    index += b"\0" * (_pad4(len(index)) - len(index))
+    index += struct.pack("<I", zlib.crc32(bytes(index)) & 0xFFFFFFFF)
+    flags = stream_header[6:8]
+    backward = struct.pack("<I", len(index) // 4 - 1)
+    footer = (struct.pack("<I", zlib.crc32(backward + flags) & 0xFFFFFFFF)
+              + backward + flags + XZ_FOOTER_MAGIC)
+    return stream_header + block + bytes(index) + footer
+
+
+class CheckpointReader(object):
+    '''
+    Decompress a gzip file (which may have several members) as a
+    readable stream, and record where each gzip member starts.
+    '''
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.checkpoints = [[0, 0]]
+        # ^ [compressed offset, uncompressed offset] of each member
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._consumed = 0  # compressed bytes given to _decompressor
+        self._produced = 0
+        self._buffer = b""
+        self._eof = False
+
+    def _fill(self):
+        while (not self._buffer) and (not self._eof):
+            if self._decompressor.eof:
+                rest = self._decompressor.unused_data
+                start = self._consumed - len(rest)
+                if not rest:
+                    rest = self.fileobj.read(CHUNK_SIZE)
+                    start = self._consumed
+                    self._consumed += len(rest)
+                if (not rest) or (not rest.startswith(GZIP_MAGIC[:len(rest)])):
+                    self._eof = True  # Such as trailing zeros
+                    return
+                self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                self.checkpoints.append([start, self._produced])
+                data = rest
+            else:
+                data = self._decompressor.unconsumed_tail
+                if not data:
+                    data = self.fileobj.read(CHUNK_SIZE)
+                    if not data:
+                        self._eof = True
+                        return
+                    self._consumed += len(data)
+            self._buffer = self._decompressor.decompress(data, CHUNK_SIZE)
+            self._produced += len(self._buffer)
+
+    def read(self, size=-1):
+        chunks = []
+        while (size is None) or (size < 0) or (size > 0):
+            self._fill()
+            if not self._buffer:
+                break
+            if (size is None) or (size < 0):
+                chunk = self._buffer
+            else:
+                chunk = self._buffer[:size]
+                size -= len(chunk)
+            self._buffer = self._buffer[len(chunk):]
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+
+def index_file_name(path):
+    '''
+    Get the name of the index file for an archive in an index directory
+    (from the SHA-256 of the absolute path).
+    '''
+    path = os.path.abspath(path)
+    return hashlib.sha256(path.encode('utf-8')).hexdigest() + ".json"
+
+
+def _file_signature(path):
+    st = os.stat(path)
+    return [st.st_size, getattr(st, 'st_mtime_ns',
+                                int(st.st_mtime * 1000000000))]
+
+
+class SeekIndex(object):
+    '''
+    The member offsets and restart points of a tar archive (See the
+    module documentation).
+    '''
+    def __init__(self, path, data):
+        '''
+        Use build or load instead.
+        '''
+        self.path = path
+        self.data = data
+
+    @staticmethod
+    def _new_data(path, compression):
+        if compression not in SEEKABLE_COMPRESSIONS:
+            raise ValueError("Random access to {} archives is not"
+                             " supported.".format(compression))
+        return {
+            'format': INDEX_FORMAT,
+            'path': os.path.abspath(path),
+            'signature': _file_signature(path),
+            'compression': compression,
+            'checkpoints': [[0, 0]],
+            'members': {},
+        }
+
+    @classmethod
+    def build(cls, path):
+        '''
+        Read the archive once to make the index.
+        '''
+        category, compression = sniff_file(path)
+        if category != 'tar':
+            raise ValueError("{} is not a tar archive.".format(path))
+        data = cls._new_data(path, compression)
+        with open(path, 'rb') as ins:
+            if compression == 'xz':
+                data['checkpoints'] = xz_blocks(ins, data['signature'][0])
+                ins.seek(0)
+                stream = lzma.open(ins, 'rb')
+            elif compression == 'gz':
+                stream = CheckpointReader(ins)
+            else:
+                stream = ins
+            tar = tarfile.open(fileobj=stream, mode="r|")
+            for member in tar:
+                if not member.isfile():
+                    continue
+                data['members'][normalize_member_name(member.name)] = \
+                    [member.offset_data, member.size]
+            tar.close()
+            if compression == 'gz':
+                data['checkpoints'] = stream.checkpoints
+        return cls(path, data)
+
+    @classmethod
+    def from_members(cls, path, compression, members):
+        '''
+        Make the index from the member offsets recorded while the archive
+        was extracted, without decompressing it again. A gz archive then
+        only has a restart point at the start (finding where each gzip
+        member starts takes the decompression that build does).
+
+        Sequential arguments:
+        path -- The archive.
+        compression -- The compression (See sniff_file).
+        members -- A dict of {member name: [offset, size]} where offset
+            is where the data starts in the uncompressed tar.
+        '''
+        data = cls._new_data(path, compression)
+        for name, entry in members.items():
+            data['members'][normalize_member_name(name)] = entry
+        if compression == 'xz':
+            with open(path, 'rb') as ins:
+                data['checkpoints'] = xz_blocks(ins, data['signature'][0])
+        return cls(path, data)
+
+    @classmethod
+    def load(cls, index_path, path):
+        '''
+        Load the index of an archive, or return None if there is none or
+        the archive changed since the index was built.
+        '''
+        if not os.path.isfile(index_path):
+            return None
+        with open(index_path, 'r') as ins:
+            data = json.load(ins)
+        if data.get('format') != INDEX_FORMAT:
+            return None
+        if data.get('signature') != _file_signature(path):
+            return None
+        return cls(path, data)
+
+    @classmethod
+    def load_or_build(cls, index_dir, path):
+        '''
+        Get the index of an archive from index_dir (See index_file_name),
+        building and saving it if it is missing or outdated.
+        '''
+        index_path = os.path.join(index_dir, index_file_name(path))
+        index = cls.load(index_path, path)
+        if index is not None:
+            return index
+        index = cls.build(path)
+        index.save(index_dir)
+        return index
+
+    def save(self, index_dir):
+        '''
+        Write the index to index_dir (See index_file_name).
+        '''
+        if not os.path.isdir(index_dir):
+            os.makedirs(index_dir)
+        write_json_atomic(os.path.join(index_dir, index_file_name(self.path)),
+                          self.data, compact=True)
+
+    def names(self):
+        return sorted(self.data['members'])
+
+    def _restart_point(self, offset):
+        '''
+        Get the index of the last checkpoint at or before offset.
+        '''
+        found = 0
+        for i, checkpoint in enumerate(self.data['checkpoints']):
+            if checkpoint[1] > offset:
+                break
+            found = i
+        return found
+
+    def _iter_from(self, ins, i):
+        '''
+        Yield the uncompressed data from checkpoint i onward (of an xz
+        or gz archive).
+        '''
+        checkpoints = self.data['checkpoints']
+        compression = self.data['compression']
+        if compression == 'xz':
+            for offset, _, unpadded, size, stream in checkpoints[i:]:
+                ins.seek(stream)
+                header = ins.read(XZ_HEADER_SIZE)
+                ins.seek(offset)
+                block = ins.read(_pad4(unpadded))
+                decompressor = lzma.LZMADecompressor(lzma.FORMAT_XZ)
+                data = wrap_xz_block(header, block, unpadded, size)
+                while not decompressor.eof:
+                    chunk = decompressor.decompress(data, CHUNK_SIZE)
+                    data = b""
+                    if not chunk and decompressor.needs_input:
+                        raise ValueError("The xz block at {} is truncated."
+                                         "".format(offset))
+                    yield chunk
+            return
+        ins.seek(checkpoints[i][0])
+        stream = CheckpointReader(ins)
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def read_member(self, name):
+        '''
+        Get the content of a regular file in the archive, decompressing
+        only from the nearest restart point before it.
+
+        Sequential arguments:
+        name -- The member name (a leading "./" is ignored).
+        '''
+        entry = self.data['members'].get(normalize_member_name(name))
+        if entry is None:
+            raise KeyError("There is no file {} in {}"
+                           "".format(name, self.path))
+        offset, size = entry
+        if self.data['compression'] is None:
+            with open(self.path, 'rb') as ins:
+                ins.seek(offset)
+                return ins.read(size)
+        i = self._restart_point(offset)
+        skip = offset - self.data['checkpoints'][i][1]
+        chunks = []
+        remaining = size
+        with open(self.path, 'rb') as ins:
+            for chunk in self._iter_from(ins, i):
+                if skip >= len(chunk):
+                    skip -= len(chunk)
+                    continue
+                chunk = chunk[skip:skip+remaining]
+                skip = 0
+                chunks.append(chunk)
+                remaining -= len(chunk)
+                if remaining < 1:
+                    break
+        if remaining > 0:
+            raise ValueError("{} ended before the end of {}"
+                             "".format(self.path, name))
+        return b"".join(chunks)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+'''
+Stage installs on the same filesystem as the programs directory, so an
+extracted program is moved into place by one os.rename (constant time,
+and a partly extracted program is never at the installed path).
+tempfile.mkdtemp would use /tmp, which is usually another filesystem,
+where moving is a copy and delete.
+
+Layout of the staging directory (such as
+~/.local/lib64/.nopackage-staging):
+- <pid>.<random>: The temporary directory of a running install (See
+  make_staging_dir). If that process is not running anymore, the
+  directory is left from an install that was stopped, and
+  clean_staging moves it to the trash (See nopackage.trash).
+'''
+from __future__ import print_function
+
+import errno
+import os
+import sys
+import tempfile
+
+from nopackage.trash import (
+    TRASH_NAME,
+    move_to_trash,
+    pid_alive,
+)
+
+STAGING_NAME = ".nopackage-staging"
+
+
+def echo0(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+def staging_dir_for(programs_dir):
+    return os.path.join(programs_dir, STAGING_NAME)
+
+
+def make_staging_dir(programs_dir):
+    '''
+    Create a temporary directory in the staging directory of
+    programs_dir (such as ~/.local/lib64).
+
+    Returns:
+    The path of the new directory.
+    '''
+    staging_dir = staging_dir_for(programs_dir)
+    if not os.path.isdir(staging_dir):
+        os.makedirs(staging_dir)
+    return tempfile.mkdtemp(prefix="{}.".format(os.getpid()),
+                            dir=staging_dir)
+
+
+def commit_staged(staged_path, dst):
+    '''
+    Move a staged file or directory to its installed path with one
+    rename. dst must not exist (move an old install to the trash first).
+    '''
+    if os.path.lexists(dst):
+        raise OSError(errno.EEXIST, "'{}' already exists".format(dst))
+        # ^ os.rename would replace a file or an empty directory.
+    os.rename(staged_path, dst)
+
+
+def clean_staging(programs_dir):
+    '''
+    Move the temporary directories of installs that are not running
+    anymore (such as if one was stopped) to the trash of programs_dir.
+
+    Returns:
+    The number of directories moved.
+    '''
+    staging_dir = staging_dir_for(programs_dir)
+    if not os.path.isdir(staging_dir):
+        return 0
+    count = 0
+    trash_dir = os.path.join(programs_dir, TRASH_NAME)
+    for name in os.listdir(staging_dir):
+        try:
+            pid = int(name.split(".", 1)[0])
+        except ValueError:
+            pid = 0
+        if pid and pid_alive(pid):
+            continue
+        try:
+            move_to_trash(os.path.join(staging_dir, name),
+                          trash_dir=trash_dir)
+        except OSError as ex:
+            echo0("* could not remove stale staging directory {}: {}"
+                  "".format(name, ex))
+            continue
+        count += 1
+    return count
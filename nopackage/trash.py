@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+'''
+Remove installed directories without making the user wait: the
+directory is renamed into a trash directory on the same filesystem
+(constant time), then deleted by a detached process (See
+purge_in_background). If that process is stopped early, the next run
+of nopackage starts it again (See resume_purge).
+
+Layout of the trash directory (such as ~/.local/lib64/.nopackage-trash):
+- <name>.<time>.<pid>: A removed directory.
+- <name>.<time>.<pid>.files.json: The relative paths of the installed
+  files (from the manifest in the metadata, if any), so they can be
+  unlinked without listing every directory first.
+- purge.pid: The process ID of the running purge process.
+
+This module only uses the standard library and nopackage.fileops,
+since the purge process runs it as a script (without importing
+nopackage).
+'''
+from __future__ import print_function
+
+import errno
+import json
+import os
+import subprocess
+import sys
+import time
+
+if __package__:
+    from nopackage.fileops import delete_tree
+else:
+    from fileops import delete_tree  # Run as a script (See main).
+
+TRASH_NAME = ".nopackage-trash"
+FILES_SUFFIX = ".files.json"
+LOCK_NAME = "purge.pid"
+
+
+def echo0(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+def trash_dir_for(path):
+    '''
+    Get the trash directory for a path (in the same parent directory, so
+    it is on the same filesystem).
+    '''
+    return os.path.join(os.path.dirname(os.path.abspath(path)), TRASH_NAME)
+
+
+def move_to_trash(path, files=None, trash_dir=None):
+    '''
+    Rename a directory into the trash (See the module documentation).
+
+    Sequential arguments:
+    path -- The directory to remove.
+
+    Keyword arguments:
+    files -- The relative paths ("/"-separated) of the files in it, such
+        as the keys of the manifest in the metadata (optional).
+    trash_dir -- The trash directory (default: trash_dir_for(path)). It
+        must be on the same filesystem as path.
+
+    Returns:
+    The path in the trash.
+    '''
+    if trash_dir is None:
+        trash_dir = trash_dir_for(path)
+    if not os.path.isdir(trash_dir):
+        os.makedirs(trash_dir)
+    entry = os.path.join(trash_dir, "{}.{}.{}".format(
+        os.path.basename(os.path.abspath(path)), int(time.time() * 1000),
+        os.getpid()))
+    if files:
+        with open(entry + FILES_SUFFIX, 'w') as outs:
+            json.dump(sorted(files), outs)
+    os.rename(path, entry)
+    return entry
+
+
+def remove_entry(entry):
+    '''
+    Delete a directory in the trash, unlinking the files listed in its
+    files.json (if any) before removing anything that remains.
+    '''
+    files_path = entry + FILES_SUFFIX
+    files = None
+    if os.path.isfile(files_path):
+        try:
+            with open(files_path, 'r') as ins:
+                files = json.load(ins)
+        except ValueError:
+            files = None  # Such as if it was only partly written.
+    if files is not None:
+        dirs = set()
+        for rel in files:
+            parts = rel.split("/")
+            try:
+                os.unlink(os.path.join(entry, *parts))
+            except OSError:
+                pass  # Such as if it was already removed.
+            for i in range(1, len(parts)):
+                dirs.add(tuple(parts[:i]))
+        for parts in sorted(dirs, key=len, reverse=True):
+            try:
+                os.rmdir(os.path.join(entry, *parts))
+            except OSError:
+                pass  # Such as if it has files not in the manifest.
+    if os.path.lexists(entry):
+        try:
+            delete_tree(entry)
+        except OSError as ex:
+            echo0("* could not delete {}: {}".format(entry, ex))
+    if os.path.isfile(files_path):
+        os.remove(files_path)
+
+
+def list_entries(trash_dir):
+    if not os.path.isdir(trash_dir):
+        return []
+    return [os.path.join(trash_dir, name)
+            for name in sorted(os.listdir(trash_dir))
+            if (name != LOCK_NAME) and (not name.endswith(FILES_SUFFIX))]
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as ex:
+        return ex.errno == errno.EPERM
+    return True
+
+
+def _acquire_lock(trash_dir):
+    '''
+    Create the lock file for this process, or return False if another
+    purge process (that is still running) has it.
+    '''
+    lock_path = os.path.join(trash_dir, LOCK_NAME)
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                raise
+            try:
+                with open(lock_path, 'r') as ins:
+                    pid = int(ins.read().strip() or 0)
+            except (IOError, OSError, ValueError):
+                pid = 0
+            if pid and pid_alive(pid):
+                return False
+            try:
+                os.remove(lock_path)  # stale
+            except OSError:
+                pass
+            continue
+        os.write(fd, str(os.getpid()).encode('ascii'))
+        os.close(fd)
+        return True
+
+
+def purge(trash_dir):
+    '''
+    Delete everything in the trash directory (unless another purge
+    process is already doing it).
+
+    Returns:
+    The number of directories removed.
+    '''
+    if not os.path.isdir(trash_dir):
+        return 0
+    if not _acquire_lock(trash_dir):
+        return 0
+    count = 0
+    done = set()
+    try:
+        while True:
+            entries = [entry for entry in list_entries(trash_dir)
+                       if entry not in done]
+            # ^ List again in case more were added while purging (but
+            #   don't retry one that could not be deleted).
+            if not entries:
+                break
+            for entry in entries:
+                remove_entry(entry)
+                done.add(entry)
+                count += 1
+    finally:
+        try:
+            os.remove(os.path.join(trash_dir, LOCK_NAME))
+        except OSError:
+            pass
+    return count
+
+
+def purge_in_background(trash_dir):
+    '''
+    Start a detached process that purges the trash directory (it keeps
+    running after nopackage exits).
+
+    Returns:
+    The subprocess.Popen object.
+    '''
+    kwargs = {}
+    if hasattr(os, 'setsid'):
+        if sys.version_info.major >= 3:
+            kwargs['start_new_session'] = True
+        else:
+            kwargs['preexec_fn'] = os.setsid
+    devnull = open(os.devnull, 'r+b')
+    try:
+        return subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), trash_dir],
+            stdin=devnull, stdout=devnull, stderr=devnull,
+            close_fds=True, **kwargs
+        )
+    finally:
+        devnull.close()
+
+
+def resume_purge(programs_dir):
+    '''
+    Start purging the trash of programs_dir in the background if a
+    previous purge did not finish (such as if it was stopped).
+    '''
+    trash_dir = os.path.join(programs_dir, TRASH_NAME)
+    if list_entries(trash_dir):
+        purge_in_background(trash_dir)
+
+
+def main():
+    if len(sys.argv) != 2:
+        echo0("Usage: {} <trash directory>".format(sys.argv[0]))
+        return 1
+    purge(sys.argv[1])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
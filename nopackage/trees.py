@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+'''
+Read-only views of a file tree (a directory on disk or the member list
+of an archive) with the same queries, so that binary detection (See
+detect_binary in nopackage) can run before an archive is extracted.
+
+Every path is relative to the root of the tree and "" is the root.
+'''
+from __future__ import print_function
+
+import os
+import stat
+
+
+class DirectoryTree(object):
+    '''
+    Query a directory on disk. Each directory is read by one os.scandir
+    the first time it is queried, then its DirEntry objects (which
+    cache the file type, and the stat result once it is read) answer the
+    queries, so detecting the binary among thousands of files only
+    takes a few system calls. It is a snapshot, so make another one
+    after changing the directory.
+    '''
+    def __init__(self, root):
+        self.root = root
+        self._entries = {}  # directory name: {name: DirEntry} or None
+
+    def _path(self, rel):
+        if not rel:
+            return self.root
+        return os.path.join(self.root, rel)
+
+    def _key(self, rel):
+        return rel.replace(os.sep, "/").strip("/")
+
+    def _index(self, key):
+        '''
+        Get the {name: DirEntry} dict of a directory, or None if it is
+        not a readable directory.
+        '''
+        if key in self._entries:
+            return self._entries[key]
+        entries = None
+        try:
+            scan = os.scandir(self._path(key))
+        except OSError:
+            pass
+        else:
+            try:
+                entries = {entry.name: entry for entry in scan}
+            finally:
+                if hasattr(scan, 'close'):
+                    scan.close()
+        self._entries[key] = entries
+        return entries
+
+    def _entry(self, rel):
+        parent, _, name = self._key(rel).rpartition("/")
+        entries = self._index(parent)
+        if (not name) or (entries is None):
+            return None
+        return entries.get(name)
+
+    def listdir(self, rel=""):
+        entries = self._index(self._key(rel))
+        if entries is None:
+            return os.listdir(self._path(rel))
+            # ^ Raise the same error as before (or list it if it became
+            #   readable).
+        return list(entries)
+
+    def isfile(self, rel):
+        entry = self._entry(rel)
+        try:
+            return (entry is not None) and entry.is_file()
+        except OSError:
+            return False
+
+    def isdir(self, rel):
+        if not self._key(rel):
+            return self._index("") is not None
+        entry = self._entry(rel)
+        try:
+            return (entry is not None) and entry.is_dir()
+        except OSError:
+            return False
+
+    def is_executable(self, rel):
+        entry = self._entry(rel)
+        if entry is None:
+            return os.access(self._path(rel), os.X_OK)
+        try:
+            mode = entry.stat().st_mode
+        except OSError:
+            return False
+        return bool(mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH))
+
+    def read_header(self, rel, size):
+        '''
+        Read the first size bytes of a file (See nopackage.headers), or
+        return None if it can't be read.
+        '''
+        try:
+            with open(self._path(rel), 'rb') as ins:
+                return ins.read(size)
+        except (IOError, OSError):
+            return None
+
+
+class MemberTree(object):
+    '''
+    Query the member list of an archive without extracting it.
+    Directories that only exist implicitly (as the parent of a member,
+    which is common in zip files) are also directories in the tree.
+    '''
+    def __init__(self, entries, read=None):
+        '''
+        Sequential arguments:
+        entries -- An iterable of (name, is_dir, mode) tuples where name
+            is relative to the root of the tree (entries with the name
+            "" are ignored) and mode is the permission bits or None if
+            unknown.
+
+        Keyword arguments:
+        read -- A function that accepts a name (as in entries) and a
+            size, and returns the first size bytes of the member (only
+            for archives that can read a member without reading the
+            ones before it, such as a zip). If None, read_header always
+            returns None.
+        '''
+        self._read = read
+        self._names = {}  # key: name as in entries
+        self._modes = {}  # file name: mode
+        self._children = {"": set()}  # directory name: set of names
+        for original, is_dir, mode in entries:
+            name = original.replace(os.sep, "/").strip("/")
+            if not name:
+                continue
+            if is_dir:
+                self._add_dir(name)
+            else:
+                self._add_parents(name)
+                self._modes[name] = mode
+                self._names[name] = original
+
+    def _add_parents(self, name):
+        parts = name.split("/")
+        for i in range(len(parts)):
+            parent = "/".join(parts[:i])
+            self._children.setdefault(parent, set()).add(parts[i])
+
+    def _add_dir(self, name):
+        self._add_parents(name)
+        self._children.setdefault(name, set())
+
+    def _key(self, rel):
+        return rel.replace(os.sep, "/").strip("/")
+
+    def listdir(self, rel=""):
+        key = self._key(rel)
+        if key not in self._children:
+            raise OSError("There is no directory {} in the archive"
+                          "".format(rel))
+        return sorted(self._children[key])
+
+    def isfile(self, rel):
+        return self._key(rel) in self._modes
+
+    def isdir(self, rel):
+        return self._key(rel) in self._children
+
+    def is_executable(self, rel):
+        mode = self._modes.get(self._key(rel))
+        if mode is None:
+            return False
+        return bool(mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH))
+
+    def read_header(self, rel, size):
+        key = self._key(rel)
+        if (self._read is None) or (key not in self._modes):
+            return None
+        return self._read(self._names[key], size)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+'''
+Order the free-form version strings that PackageInfo.join_version
+makes (such as "2.79b", "3.3.2 stable mono" or "1.3.1-dev").
+
+version_key turns a version into a string that sorts (as a plain
+string) in version order, so it can be stored beside the version
+(See 'version_key' in the metadata of packages) and compared later
+without parsing the version again, even by SQLite.
+
+Order of the parts of a version:
+- Numbers compare as numbers (2.10 is after 2.9).
+- Pre-release words (See PRE_RELEASES) are before the release, such as
+  1.0-dev < 1.0-alpha < 1.0-beta2 < 1.0-rc1 < 1.0.
+- Letters after a number are after it, such as 2.79 < 2.79a < 2.79b
+  (as allowed by is_version with allowLettersAtEnd).
+- "stable" is the same as no word.
+
+Flavors (See FLAVORS) are not part of the key: "3.3.2 stable mono" is
+a different build of 3.3.2, not a newer one, so version_key gives it
+the same key as "3.3.2". Get both with parse_version, and only compare
+the keys of versions with the same flavor (such as to upgrade a mono
+build only to a newer mono build).
+'''
+from __future__ import print_function
+
+import re
+import sys
+from functools import lru_cache
+
+PRE_RELEASES = {
+    'dev': 0,
+    'master': 0,
+    'prealpha': 1,
+    'alpha': 2,
+    'beta': 3,
+    'rc': 4,
+}
+RELEASES = {'stable'}
+FLAVORS = {'mono'}
+# ^ Together, these are the words of PackageInfo.VPARTS.
+
+PRE_TAG = "0"
+END_TAG = "1"
+WORD_TAG = "2"
+NUMBER_TAG = "3"
+SEPARATOR = "."
+# ^ Each part of a key is a tag, then the value, then SEPARATOR (which
+#   sorts before any digit or letter, so "b." < "ba."). The key of a
+#   release ends with END_TAG, which sorts after PRE_TAG but before any
+#   other part, so 1.0-rc1 < 1.0 < 1.0a < 1.0.1.
+
+_TOKEN = re.compile("[0-9]+|[a-z]+")
+
+
+def echo0(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+@lru_cache(maxsize=4096)
+def parse_version(version):
+    '''
+    Split a version into its key and its flavor (See the module
+    documentation).
+
+    Sequential arguments:
+    version -- A version such as "2.79b" or "3.3.2 stable mono" (None
+        sorts before any version).
+
+    Returns:
+    A tuple of (key, flavor) where key is a string that sorts in
+    version order and flavor is the flavor words separated by spaces
+    (such as "mono"), or "" if there are none.
+    '''
+    if not version:
+        return "", ""
+    tokens = _TOKEN.findall(version.lower())
+    if (len(tokens) > 1) and (tokens[0] == "v") and tokens[1].isdigit():
+        tokens = tokens[1:]
+        # ^ Such as "v1.0" (join_version usually removed it already).
+    parts = []
+    flavors = []
+    for token in tokens:
+        if token.isdigit():
+            digits = token.lstrip("0") or "0"
+            parts.append("{}{:02d}{}".format(NUMBER_TAG, len(digits),
+                                             digits))
+        elif token in PRE_RELEASES:
+            parts.append("{}{}".format(PRE_TAG, PRE_RELEASES[token]))
+        elif token in RELEASES:
+            continue
+        elif token in FLAVORS:
+            if token not in flavors:
+                flavors.append(token)
+        else:
+            parts.append(WORD_TAG + token)
+    parts.append(END_TAG)
+    return SEPARATOR.join(parts), " ".join(sorted(flavors))
+
+
+def version_key(version):
+    '''
+    Get a string that sorts in version order, without the flavor (See
+    parse_version).
+    '''
+    return parse_version(version)[0]
+
+
+def version_flavor(version):
+    '''
+    Get the flavor of a version, such as "mono", or "" if it has none
+    (See parse_version).
+    '''
+    return parse_version(version)[1]
+
+
+def sort_versions(versions, reverse=False):
+    '''
+    Sort versions (oldest first unless reverse is True). Versions with
+    the same key are sorted by flavor (so each flavor is after the same
+    version without one), and versions with the same key and flavor
+    (such as "1.01" and "1.1") stay in the same order.
+    '''
+    return sorted(versions, key=parse_version, reverse=reverse)
+
+
+def newest(items, key=None):
+    '''
+    Get the item with the newest version, or None if there are no
+    items. Only pass items of the same flavor (See version_flavor),
+    since the flavor is not compared.
+
+    Keyword arguments:
+    key -- A function that gets the version_key of an item, or a tuple
+        that starts with it to break ties (default: the item is a
+        version string). If several items have the newest key, the
+        first is returned.
+    '''
+    if key is None:
+        key = version_key
+    best = None
+    bestKey = None
+    for item in items:
+        itemKey = key(item)
+        if (best is None) or (itemKey > bestKey):
+            best = item
+            bestKey = itemKey
+    return best
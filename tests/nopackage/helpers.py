@@ -0,0 +1,46 @@
+'''
+Functions shared by the tests in this directory (import them as
+tests.nopackage.helpers).
+'''
+import io
+import os
+import tarfile
+
+
+def make_tree(path, files, mode=None):
+    '''
+    Make a directory of files.
+
+    Sequential arguments:
+    path -- The directory (created if not present).
+    files -- A dict of {relative path: bytes}, or a list of relative
+        paths (each file contains b"x"). Use "/" as the separator.
+
+    Keyword arguments:
+    mode -- Set the permissions of every file (default: keep the
+        permissions from the umask).
+    '''
+    if not isinstance(files, dict):
+        files = {name: b"x" for name in files}
+    for name, data in files.items():
+        file_path = os.path.join(path, *name.split("/"))
+        parent = os.path.dirname(file_path)
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+        with open(file_path, 'wb') as outs:
+            outs.write(data)
+        if mode is not None:
+            os.chmod(file_path, mode)
+
+
+def make_tar_gz(files):
+    '''
+    Make a gzipped tar from a dict of {name: bytes}.
+    '''
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
@@ -0,0 +1,285 @@
+import io
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+if __name__ == "__main__":
+    TEST_MODULE_DIR = os.path.dirname(os.path.realpath(__file__))
+    TESTS_DIR = os.path.dirname(TEST_MODULE_DIR)
+    REPO_DIR = os.path.dirname(TESTS_DIR)
+    sys.path.insert(0, REPO_DIR)
+
+from nopackage.archives import (
+    AR_MAGIC,
+    common_root,
+    deb_member_filter,
+    extract_archive,
+    extract_deb_data,
+    iter_ar_members,
+    open_archive,
+    open_tar_stream,
+    partition_by_size,
+    sniff_format,
+)
+from tests.nopackage.helpers import make_tar_gz
+
+
+def make_ar(members):
+    '''
+    Make a Unix ar archive.
+
+    Sequential arguments:
+    members -- A list of (name, data) tuples where name is the literal
+        16-byte name field (such as "data.tar.gz/" or "#1/12").
+    '''
+    chunks = [AR_MAGIC]
+    for name, data in members:
+        header = "{:<16}{:<12}{:<6}{:<6}{:<8}{:<10}`\n".format(
+            name, 0, 0, 0, 100644, len(data))
+        chunks.append(header.encode('ascii'))
+        chunks.append(data)
+        if len(data) % 2 == 1:
+            chunks.append(b"\n")
+    return b"".join(chunks)
+
+
+class TestArchives(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_iter_ar_members(self):
+        ar = make_ar([
+            ("debian-binary", b"2.0\n"),
+            ("odd/", b"abc"),
+            ("#1/16", b"long_name.tar.gz" + b"xyz"),
+        ])
+        got = [(name, size, stream.read(2))
+               for name, size, stream in iter_ar_members(io.BytesIO(ar))]
+        # ^ Only partly read each member to ensure the rest is skipped.
+        self.assertEqual(got, [
+            ("debian-binary", 4, b"2."),
+            ("odd", 3, b"ab"),
+            ("long_name.tar.gz", 3, b"xy"),
+        ])
+        with self.assertRaises(ValueError):
+            list(iter_ar_members(io.BytesIO(b"not an ar archive")))
+
+    def test_deb_member_filter(self):
+        self.assertTrue(deb_member_filter("./usr/share/foo/foo"))
+        self.assertTrue(deb_member_filter("./opt/Foo/foo"))
+        self.assertTrue(deb_member_filter("./usr/share/icons/a/foo.png"))
+        self.assertTrue(deb_member_filter("./usr/share/"))
+        self.assertFalse(deb_member_filter("./usr/share/doc/foo/copyright"))
+        self.assertFalse(deb_member_filter("./usr/bin/foo"))
+        self.assertFalse(deb_member_filter("./etc/foo.conf"))
+
+    def test_extract_deb_data(self):
+        data = make_tar_gz({
+            "./usr/share/foo/foo": b"#!/bin/sh\n",
+            "./usr/share/doc/foo/copyright": b"GPL",
+            "./usr/share/icons/hicolor/foo.png": b"PNG",
+            "./etc/foo.conf": b"x=1",
+        })
+        deb_path = os.path.join(self.tmp, "foo_1.0_amd64.deb")
+        with open(deb_path, 'wb') as outs:
+            outs.write(make_ar([
+                ("debian-binary", b"2.0\n"),
+                ("control.tar.gz", make_tar_gz({"./control": b"x"})),
+                ("data.tar.gz", data),
+            ]))
+        dst = os.path.join(self.tmp, "dst")
+        os.mkdir(dst)
+        self.assertEqual(extract_deb_data(deb_path, dst)[0], "data.tar.gz")
+        self.assertTrue(os.path.isfile(
+            os.path.join(dst, "usr", "share", "foo", "foo")))
+        self.assertTrue(os.path.isfile(
+            os.path.join(dst, "usr", "share", "icons", "hicolor", "foo.png")))
+        self.assertFalse(os.path.exists(
+            os.path.join(dst, "usr", "share", "doc")))
+        self.assertFalse(os.path.exists(os.path.join(dst, "etc")))
+        self.assertEqual(sorted(os.listdir(self.tmp)),
+                         ["dst", "foo_1.0_amd64.deb"])
+        # ^ No intermediate files.
+
+    def test_extract_deb_data_missing(self):
+        deb_path = os.path.join(self.tmp, "empty.deb")
+        with open(deb_path, 'wb') as outs:
+            outs.write(make_ar([("debian-binary", b"2.0\n")]))
+        with self.assertRaises(ValueError):
+            extract_deb_data(deb_path, self.tmp)
+
+    def test_common_root(self):
+        self.assertEqual(common_root([("foo-1.0/", True),
+                                      ("foo-1.0/bin/foo", False)]),
+                         "foo-1.0")
+        self.assertEqual(common_root([("./foo/foo", False)]), "foo")
+        self.assertIsNone(common_root([("foo/foo", False),
+                                       ("README", False)]))
+        self.assertIsNone(common_root([("foo", False)]))
+        self.assertIsNone(common_root([("foo/a", False), ("bar/b", False)]))
+
+    def test_extract_archive(self):
+        tar_path = os.path.join(self.tmp, "foo-1.0.tar.gz")
+        with open(tar_path, 'wb') as outs:
+            outs.write(make_tar_gz({
+                "foo-1.0/foo": b"#!/bin/sh\n",
+                "foo-1.0/lib/a.so": b"ELF",
+            }))
+        zip_path = os.path.join(self.tmp, "bar.zip")
+        with zipfile.ZipFile(zip_path, 'w') as zf:
+            zf.writestr("bar", b"#!/bin/sh\n")
+            zf.writestr("data/a.txt", b"a")
+        dst = os.path.join(self.tmp, "lib64", "foo-1.0")
+        self.assertEqual(extract_archive(tar_path, 'tar', dst), "foo-1.0")
+        self.assertEqual(sorted(os.listdir(dst)), ["foo", "lib"])
+        dst = os.path.join(self.tmp, "lib64", "bar")
+        self.assertIsNone(extract_archive(zip_path, 'zip', dst))
+        self.assertEqual(sorted(os.listdir(dst)), ["bar", "data"])
+
+    def test_archive_tree(self):
+        zip_path = os.path.join(self.tmp, "foo-1.0.zip")
+        with zipfile.ZipFile(zip_path, 'w') as zf:
+            zf.writestr("foo-1.0/foo", b"#!/bin/sh\n")
+            zf.writestr("foo-1.0/lib/a.so", b"ELF")
+        with open_archive(zip_path, 'zip') as archive:
+            self.assertEqual(archive.root, "foo-1.0")
+            self.assertEqual(archive.total_size(), 13)
+            tree = archive.tree()
+            self.assertEqual(tree.listdir(), ["foo", "lib"])
+            self.assertTrue(tree.isfile("lib/a.so"))
+        self.assertEqual(os.listdir(self.tmp), ["foo-1.0.zip"])
+        # ^ Inspecting must not extract anything.
+
+    def test_tar_one_pass(self):
+        tar_path = os.path.join(self.tmp, "foo-1.0.tar.gz")
+        with open(tar_path, 'wb') as outs:
+            outs.write(make_tar_gz({
+                "foo-1.0/foo": b"#!/bin/sh\n",
+                "foo-1.0/lib/a.so": b"ELF",
+            }))
+        dst = os.path.join(self.tmp, "lib64", "foo-1.0")
+        with open_archive(tar_path, 'tar') as archive:
+            self.assertFalse(archive.listed)
+            with mock.patch('nopackage.archives.open_tar_stream',
+                            wraps=open_tar_stream) as opened:
+                self.assertEqual(archive.extract(dst), "foo-1.0")
+            self.assertEqual(opened.call_count, 1)
+            # ^ Listed and extracted while decompressing once.
+            self.assertEqual(archive.total_size(), 13)
+            self.assertEqual(archive.stored_mode("foo"), 0o644)
+            self.assertEqual(sorted(archive.manifest), ["foo", "lib/a.so"])
+        self.assertEqual(sorted(os.listdir(dst)), ["foo", "lib"])
+        self.assertEqual(os.listdir(os.path.join(self.tmp, "lib64")),
+                         ["foo-1.0"])
+        # ^ Nothing is left beside dst.
+
+    def test_partition_by_size(self):
+        parts = partition_by_size([b"a" * 5, b"b" * 4, b"c" * 3, b"d" * 2],
+                                  2)
+        self.assertEqual(sorted(sum(len(item) for item in part)
+                                for part in parts), [7, 7])
+        self.assertEqual(len(partition_by_size([b"a"], 8)), 1)
+
+    def test_parallel_zip(self):
+        zip_path = os.path.join(self.tmp, "many.zip")
+        expected = {}
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for i in range(100):
+                name = "many/d{}/sub/f{}.txt".format(i % 7, i)
+                expected[name[len("many/"):]] = ("x" * i).encode('ascii')
+                zf.writestr(name, expected[name[len("many/"):]])
+            zf.writestr("many/empty/", b"")
+        for workers in (1, 4):
+            dst = os.path.join(self.tmp, "out{}".format(workers))
+            self.assertEqual(extract_archive(zip_path, 'zip', dst,
+                                             workers=workers),
+                             "many")
+            for name, data in expected.items():
+                with open(os.path.join(dst, name), 'rb') as ins:
+                    self.assertEqual(ins.read(), data)
+            self.assertTrue(os.path.isdir(os.path.join(dst, "empty")))
+
+    def test_zip_modes(self):
+        zip_path = os.path.join(self.tmp, "bar.zip")
+
+        def add(zf, name, mode, data=b""):
+            info = zipfile.ZipInfo(name)
+            info.create_system = 3
+            info.external_attr = mode << 16
+            zf.writestr(info, data)
+
+        with zipfile.ZipFile(zip_path, 'w') as zf:
+            add(zf, "bar/bar", 0o100755, b"#!/bin/sh\n")
+            add(zf, "bar/helper", 0o104777, b"#!/bin/sh\n")
+            add(zf, "bar/data/", 0o40555)
+            add(zf, "bar/data/a.txt", 0o100444, b"a")
+            add(zf, "bar/lib", 0o120777, b"data")
+            add(zf, "bar/lib/evil", 0o100644, b"x")
+            # ^ Must not be written through the symlink.
+            info = zipfile.ZipInfo("bar/plain.txt")
+            info.create_system = 0  # MS-DOS (no Unix mode)
+            zf.writestr(info, b"p")
+        for workers in (1, 4):
+            dst = os.path.join(self.tmp, "out{}".format(workers))
+            with open_archive(zip_path, 'zip') as archive:
+                archive.extract(dst, workers=workers)
+                manifest = archive.manifest
+                self.assertEqual(archive.stored_mode("bar") & 0o777, 0o755)
+                self.assertIsNone(archive.stored_mode("plain.txt"))
+                # ^ So the install marks it executable if it is the binary
+
+            def mode(name):
+                return os.lstat(os.path.join(dst, name)).st_mode & 0o7777
+
+            self.assertEqual(mode("bar"), 0o755)
+            self.assertEqual(manifest["bar"][1], 0o755)
+            self.assertEqual(mode("helper"), 0o755)
+            # ^ Without setuid nor write permission for others.
+            self.assertEqual(mode("data"), 0o555)
+            self.assertEqual(mode("data/a.txt"), 0o444)
+            self.assertEqual(os.readlink(os.path.join(dst, "lib")), "data")
+            self.assertFalse(os.path.exists(os.path.join(dst, "data",
+                                                         "evil")))
+            self.assertNotIn("lib", manifest)
+            self.assertIn("plain.txt", manifest)
+            os.chmod(os.path.join(dst, "data"), 0o755)
+            # ^ So tearDown can delete it.
+
+    def test_sniff_format(self):
+        self.assertEqual(sniff_format(AR_MAGIC + b"debian-binary"),
+                         ('ar', None))
+        self.assertEqual(sniff_format(b"PK\x03\x04"), ('zip', None))
+        self.assertEqual(sniff_format(make_tar_gz({"a": b"a"})),
+                         ('tar', 'gz'))
+        self.assertEqual(sniff_format(b"\x28\xb5\x2f\xfd\x00"),
+                         ('tar', 'zst'))
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w") as tar:
+            tar.addfile(tarfile.TarInfo("a"), io.BytesIO(b""))
+        self.assertEqual(sniff_format(buf.getvalue()), ('tar', None))
+        self.assertEqual(sniff_format(b"\x7fELF"), (None, None))
+
+    def test_extract_deb_data_by_content(self):
+        # The name of the data member must not determine the compression.
+        deb_path = os.path.join(self.tmp, "foo.deb")
+        with open(deb_path, 'wb') as outs:
+            outs.write(make_ar([
+                ("debian-binary", b"2.0\n"),
+                ("data.tar.zst", make_tar_gz({"./opt/foo/foo": b"x"})),
+            ]))
+        dst = os.path.join(self.tmp, "dst")
+        name, backend = extract_deb_data(deb_path, dst)
+        self.assertEqual(name, "data.tar.zst")
+        self.assertTrue(os.path.isfile(os.path.join(dst, "opt", "foo", "foo")))
+
+
+if __name__ == "__main__":
+    unittest.main()
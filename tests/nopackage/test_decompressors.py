@@ -0,0 +1,118 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import unittest
+
+if __name__ == "__main__":
+    TEST_MODULE_DIR = os.path.dirname(os.path.realpath(__file__))
+    TESTS_DIR = os.path.dirname(TEST_MODULE_DIR)
+    REPO_DIR = os.path.dirname(TESTS_DIR)
+    sys.path.insert(0, REPO_DIR)
+
+from nopackage.archives import (
+    TarArchive,
+)
+from nopackage.decompressors import (
+    DECOMPRESSORS,
+    Decompressor,
+    find_decompressor,
+)
+
+COMPRESSORS = {
+    'gz': gzip.compress,
+    'xz': lzma.compress,
+    'bz2': bz2.compress,
+}
+
+
+class TestDecompressors(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_every_available_backend(self):
+        data = os.urandom(1024) * 300
+        tested = []
+        for decompressor in DECOMPRESSORS:
+            if not decompressor.is_available():
+                continue
+            if decompressor.compression not in COMPRESSORS:
+                continue  # No compressor in the standard library.
+            path = os.path.join(self.tmp, "data")
+            with open(path, 'wb') as outs:
+                outs.write(COMPRESSORS[decompressor.compression](data))
+            with open(path, 'rb') as ins:
+                sources = [path, io.BytesIO(ins.read())]
+            for source in sources:
+                stream = decompressor.open(source)
+                try:
+                    self.assertEqual(stream.read(), data)
+                finally:
+                    stream.close()
+            tested.append(decompressor.name)
+        self.assertIn("lzma", tested)
+        self.assertIn("gzip", tested)
+        self.assertIn("bz2", tested)
+
+    def test_find_decompressor(self):
+        self.assertIsNone(find_decompressor('rar'))
+        self.assertEqual(find_decompressor('gz').compression, 'gz')
+        missing = Decompressor("missing", 'gz',
+                               command=["nopackage-missing-command"])
+        self.assertFalse(missing.is_available())
+
+    def test_command_failure(self):
+        decompressor = find_decompressor('xz')
+        if decompressor.command is None:
+            self.skipTest("There is no xz command.")
+        stream = decompressor.open(io.BytesIO(b"not xz data"))
+        stream.read()
+        with self.assertRaises(IOError):
+            stream.close()
+
+    def test_tar_archive(self):
+        path = os.path.join(self.tmp, "foo-1.0.tar.xz")
+        with tarfile.open(path, "w:xz") as tar:
+            info = tarfile.TarInfo("foo-1.0/foo")
+            info.size = 3
+            info.mode = 0o755
+            tar.addfile(info, io.BytesIO(b"abc"))
+        with TarArchive(path) as archive:
+            self.assertEqual(archive.backend, find_decompressor('xz').name)
+            dst = os.path.join(self.tmp, "foo-1.0")
+            self.assertEqual(archive.extract(dst), "foo-1.0")
+        self.assertEqual(sorted(os.listdir(self.tmp)),
+                         ["foo-1.0", "foo-1.0.tar.xz"])
+        # ^ The top-level directory was renamed to dst.
+        with open(os.path.join(dst, "foo"), 'rb') as ins:
+            self.assertEqual(ins.read(), b"abc")
+        self.assertTrue(os.access(os.path.join(dst, "foo"), os.X_OK))
+
+    def test_zstd_tar(self):
+        decompressor = find_decompressor('zst')
+        if (decompressor is None) or (decompressor.command is None):
+            self.skipTest("There is no zstd command.")
+        import subprocess
+        path = os.path.join(self.tmp, "foo.tar")
+        with tarfile.open(path, "w") as tar:
+            info = tarfile.TarInfo("foo/foo")
+            info.size = 3
+            tar.addfile(info, io.BytesIO(b"abc"))
+        subprocess.check_call(["zstd", "-q", "--rm", path])
+        # ^ Make foo.tar.zst
+        with TarArchive(path + ".zst") as archive:
+            self.assertEqual(archive.compression, 'zst')
+            archive.extract(os.path.join(self.tmp, "out"))
+            self.assertEqual(archive.root, "foo")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+if __name__ == "__main__":
+    TEST_MODULE_DIR = os.path.dirname(os.path.realpath(__file__))
+    TESTS_DIR = os.path.dirname(TEST_MODULE_DIR)
+    REPO_DIR = os.path.dirname(TESTS_DIR)
+    sys.path.insert(0, REPO_DIR)
+
+from nopackage.dedupstore import DedupStore
+from tests.nopackage.helpers import make_tree
+
+
+def make_manifest(files, mode=0o644):
+    '''
+    Get the manifest (See nopackage.integrity) of the files given to
+    make_tree.
+    '''
+    return {name: [len(data), mode, hashlib.sha256(data).hexdigest()]
+            for name, data in files.items()}
+
+
+class TestDedupStore(unittest.TestCase):
+    def setUp(self):
+        self.programs = tempfile.mkdtemp()
+        self.store = DedupStore.for_programs(self.programs)
+
+    def tearDown(self):
+        shutil.rmtree(self.programs)
+
+    def path(self, *parts):
+        return os.path.join(self.programs, *parts)
+
+    def test_dedup_versions(self):
+        shared = {"lib/a.so": b"ELF" * 100, "empty": b""}
+        make_tree(self.path("blender-4.0"),
+                  dict(shared, blender=b"4.0"))
+        make_tree(self.path("blender-4.1"),
+                  dict(shared, blender=b"4.1"))
+        first = self.store.dedup_tree(self.path("blender-4.0"))
+        self.assertEqual(first, {'files': 2, 'hashed': 2, 'freed': 0})
+        second = self.store.dedup_tree(self.path("blender-4.1"))
+        self.assertEqual(second, {'files': 2, 'hashed': 2, 'freed': 300})
+        self.assertTrue(os.path.samefile(
+            self.path("blender-4.0", "lib", "a.so"),
+            self.path("blender-4.1", "lib", "a.so"),
+        ))
+        self.assertFalse(os.path.samefile(
+            self.path("blender-4.0", "blender"),
+            self.path("blender-4.1", "blender"),
+        ))
+        self.assertEqual(self.store.dedup_tree(self.path("blender-4.1")),
+                         {'files': 2, 'hashed': 2, 'freed': 0})
+        # ^ Already linked.
+
+    def test_dedup_with_manifest(self):
+        files = {"lib/a.so": b"ELF" * 100, "blender": b"4.0"}
+        make_tree(self.path("v1"), files, mode=0o644)
+        make_tree(self.path("v2"), files, mode=0o644)
+        manifest = make_manifest(files)
+        since = time.time()
+        self.assertEqual(
+            self.store.dedup_tree(self.path("v1"), manifest=manifest,
+                                  since=since),
+            {'files': 2, 'hashed': 0, 'freed': 0},
+        )
+        with open(self.path("v2", "blender"), 'wb') as outs:
+            outs.write(b"4.1")
+        os.utime(self.path("v2", "blender"), (since + 10, since + 10))
+        # ^ Same size, but modified after the manifest was recorded.
+        self.assertEqual(
+            self.store.dedup_tree(self.path("v2"), manifest=manifest,
+                                  since=since),
+            {'files': 2, 'hashed': 1, 'freed': 300},
+        )
+        self.assertFalse(os.path.samefile(self.path("v1", "blender"),
+                                          self.path("v2", "blender")))
+        # ^ Not linked using the stale digest.
+
+    def test_mode_is_part_of_the_key(self):
+        make_tree(self.path("a"), {"run": b"x"}, mode=0o755)
+        make_tree(self.path("b"), {"run": b"x"}, mode=0o644)
+        self.store.dedup_tree(self.path("a"))
+        self.store.dedup_tree(self.path("b"))
+        self.assertFalse(os.path.samefile(self.path("a", "run"),
+                                          self.path("b", "run")))
+        self.assertEqual(os.stat(self.path("b", "run")).st_mode & 0o777,
+                         0o644)
+
+    def test_remove_one_version(self):
+        make_tree(self.path("v1"), {"data": b"shared", "only1": b"1"})
+        make_tree(self.path("v2"), {"data": b"shared"})
+        self.store.dedup_tree(self.path("v1"))
+        self.store.dedup_tree(self.path("v2"))
+        shutil.rmtree(self.path("v1"))
+        self.assertEqual(self.store.collect_garbage(), (1, 1))
+        # ^ Only the object of "only1" is no longer used.
+        with open(self.path("v2", "data"), 'rb') as ins:
+            self.assertEqual(ins.read(), b"shared")
+        shutil.rmtree(self.path("v2"))
+        self.assertEqual(self.store.collect_garbage(), (1, 6))
+        self.assertEqual(os.listdir(self.store.objects), [])
+
+    def test_release(self):
+        v1 = {"data": b"shared", "only1": b"1"}
+        make_tree(self.path("v1"), v1, mode=0o644)
+        make_tree(self.path("v2"), {"data": b"shared"}, mode=0o644)
+        self.store.dedup_tree(self.path("v1"))
+        self.store.dedup_tree(self.path("v2"))
+        self.assertEqual(
+            self.store.release(self.path("v1"), make_manifest(v1)),
+            (1, 1),
+        )
+        # ^ Only the object of "only1" is only used by v1.
+        with open(self.path("v1", "only1"), 'rb') as ins:
+            self.assertEqual(ins.read(), b"1")
+            # ^ Still there until v1 is deleted.
+        shutil.rmtree(self.path("v1"))
+        self.assertEqual(self.store.collect_garbage(), (0, 0))
+        with open(self.path("v2", "data"), 'rb') as ins:
+            self.assertEqual(ins.read(), b"shared")
+
+
+if __name__ == "__main__":
+    unittest.main()
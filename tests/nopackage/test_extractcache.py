@@ -0,0 +1,117 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+if __name__ == "__main__":
+    TEST_MODULE_DIR = os.path.dirname(os.path.realpath(__file__))
+    TESTS_DIR = os.path.dirname(TEST_MODULE_DIR)
+    REPO_DIR = os.path.dirname(TESTS_DIR)
+    sys.path.insert(0, REPO_DIR)
+
+from nopackage.extractcache import (
+    ExtractionCache,
+    link_tree,
+)
+from nopackage.integrity import sha256_file
+from tests.nopackage.helpers import make_tree
+
+
+class TestExtractionCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.tmp, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_sha256_file(self):
+        path = os.path.join(self.tmp, "a")
+        with open(path, 'wb') as outs:
+            outs.write(b"abc")
+        self.assertEqual(
+            sha256_file(path),
+            "ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad",
+        )
+
+    def test_link_tree(self):
+        src = os.path.join(self.tmp, "src")
+        make_tree(src, {"foo": b"#!/bin/sh\n", "lib/a.so": b"ELF"})
+        os.symlink("a.so", os.path.join(src, "lib", "b.so"))
+        dst = os.path.join(self.tmp, "dst")
+        manifest = link_tree(src, dst)
+        self.assertEqual(sorted(manifest),
+                         ["foo", os.path.join("lib", "a.so")])
+        self.assertTrue(os.path.samefile(os.path.join(src, "foo"),
+                                         os.path.join(dst, "foo")))
+        self.assertEqual(os.readlink(os.path.join(dst, "lib", "b.so")),
+                         "a.so")
+
+    def test_hit_and_miss(self):
+        src = os.path.join(self.tmp, "installed")
+        make_tree(src, {"foo": b"#!/bin/sh\n", "lib/a.so": b"ELF"})
+        cache = ExtractionCache(self.cache_path)
+        self.assertIsNone(cache.get("k1"))
+        self.assertTrue(cache.add("k1", src, root="foo-1.0", source="x.tgz"))
+        shutil.rmtree(src)
+        # ^ The cache must survive uninstalling the program.
+        cache = ExtractionCache(self.cache_path)
+        entry = cache.get("k1")
+        self.assertEqual(entry['root'], "foo-1.0")
+        self.assertEqual(entry['size'], 13)
+        cache.materialize("k1", src)
+        with open(os.path.join(src, "lib", "a.so"), 'rb') as ins:
+            self.assertEqual(ins.read(), b"ELF")
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_source_key(self):
+        src = os.path.join(self.tmp, "installed")
+        make_tree(src, {"foo": b"#!/bin/sh\n"})
+        archive = os.path.join(self.tmp, "foo-1.0.tgz")
+        make_tree(self.tmp, {"foo-1.0.tgz": b"archive"})
+        cache = ExtractionCache(self.cache_path)
+        self.assertIsNone(cache.source_key(archive))
+        self.assertIsNone(cache.get(None))
+        # ^ A miss, such as for a tar that is only hashed while extracted
+        cache.add("k1", src, source=archive)
+        cache = ExtractionCache(self.cache_path)
+        self.assertEqual(cache.source_key(archive), "k1")
+        st = os.stat(archive)
+        os.utime(archive, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+        self.assertIsNone(cache.source_key(archive))
+        # ^ It may have changed, so it has to be hashed again.
+        cache.remove("k1")
+        self.assertEqual(cache.index['sources'], {})
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_modified_entry_is_discarded(self):
+        src = os.path.join(self.tmp, "installed")
+        make_tree(src, {"foo": b"#!/bin/sh\n"})
+        cache = ExtractionCache(self.cache_path)
+        cache.add("k1", src)
+        with open(os.path.join(src, "foo"), 'ab') as outs:
+            outs.write(b"echo changed\n")
+        # ^ The installed file is the same inode as the cached one.
+        self.assertIsNone(cache.get("k1"))
+        self.assertFalse(os.path.exists(cache.tree_path("k1")))
+
+    def test_evict_least_recently_used(self):
+        cache = ExtractionCache(self.cache_path, quota=10)
+        for key in ("old", "new"):
+            src = os.path.join(self.tmp, key)
+            make_tree(src, {"data": b"x" * 6})
+            self.assertTrue(cache.add(key, src))
+            time.sleep(0.01)
+        self.assertEqual(sorted(cache.index['entries']), ["new"])
+        self.assertEqual(cache.stats()['evictions'], 1)
+        big = os.path.join(self.tmp, "big")
+        make_tree(big, {"data": b"x" * 11})
+        self.assertFalse(cache.add("big", big))
+        self.assertFalse(os.path.exists(cache.tree_path("big") + ".tmp"))
+
+
+if __name__ == "__main__":
+    unittest.main()
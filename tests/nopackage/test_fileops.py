@@ -0,0 +1,132 @@
+import errno
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+if __name__ == "__main__":
+    TEST_MODULE_DIR = os.path.dirname(os.path.realpath(__file__))
+    TESTS_DIR = os.path.dirname(TEST_MODULE_DIR)
+    REPO_DIR = os.path.dirname(TESTS_DIR)
+    sys.path.insert(0, REPO_DIR)
+
+from nopackage import fileops
+from nopackage.fileops import (
+    copy_file,
+    copy_tree,
+    delete_tree,
+    move_path,
+)
+from tests.nopackage.helpers import make_tree
+
+
+def read_tree(path):
+    result = {}
+    for parent, dir_names, file_names in os.walk(path):
+        for name in file_names:
+            file_path = os.path.join(parent, name)
+            rel = os.path.relpath(file_path, path).replace(os.sep, "/")
+            if os.path.islink(file_path):
+                result[rel] = ("link", os.readlink(file_path))
+                continue
+            with open(file_path, 'rb') as ins:
+                result[rel] = (stat.S_IMODE(os.stat(file_path).st_mode),
+                               ins.read())
+    return result
+
+
+FILES = {
+    "foo": b"#!/bin/sh\n",
+    "lib/a.so": b"ELF" * 100000,
+    "share/foo/empty": b"",
+}
+for i in range(30):
+    FILES["share/d{}/f{}".format(i % 4, i)] = ("x" * i).encode('ascii')
+
+
+class TestFileOps(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmp, "src")
+        make_tree(self.src, FILES)
+        os.chmod(os.path.join(self.src, "foo"), 0o755)
+        os.symlink("a.so", os.path.join(self.src, "lib", "a.so.1"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_copy_tree(self):
+        expected = read_tree(self.src)
+        self.assertEqual(expected["lib/a.so.1"], ("link", "a.so"))
+        for workers in (1, 4):
+            dst = os.path.join(self.tmp, str(workers))
+            copy_tree(self.src, dst, workers=workers)
+            self.assertEqual(read_tree(dst), expected)
+
+    def test_delete_tree(self):
+        outside = os.path.join(self.tmp, "outside")
+        make_tree(outside, {"keep": b"keep"})
+        os.symlink(outside, os.path.join(self.src, "share", "outside"))
+        delete_tree(self.src, workers=4)
+        self.assertFalse(os.path.lexists(self.src))
+        self.assertTrue(os.path.isfile(os.path.join(outside, "keep")))
+        # ^ A symlink to a directory is removed, not followed.
+
+    def test_copy_file_fallback(self):
+        # Make every kernel copy function fail as if not supported.
+        def unsupported(*args, **kwargs):
+            raise OSError(errno.ENOSYS, "not supported")
+
+        saved = {}
+        for name in ("copy_file_range", "sendfile"):
+            if hasattr(os, name):
+                saved[name] = getattr(os, name)
+                setattr(os, name, unsupported)
+        try:
+            dst = os.path.join(self.tmp, "a.so")
+            copy_file(os.path.join(self.src, "lib", "a.so"), dst)
+        finally:
+            for name, function in saved.items():
+                setattr(os, name, function)
+        with open(dst, 'rb') as ins:
+            self.assertEqual(ins.read(), FILES["lib/a.so"])
+
+    @unittest.skipUnless(hasattr(os, 'copy_file_range'),
+                         "os.copy_file_range is not available.")
+    def test_copy_file_range_copies_nothing(self):
+        # Some filesystems make copy_file_range return 0 at the start.
+        dst = os.path.join(self.tmp, "a.so")
+        with mock.patch('os.copy_file_range', return_value=0) as copy:
+            copy_file(os.path.join(self.src, "lib", "a.so"), dst)
+        copy.assert_called_once()
+        with open(dst, 'rb') as ins:
+            self.assertEqual(ins.read(), FILES["lib/a.so"])
+
+    def test_move_path_other_filesystem(self):
+        expected = read_tree(self.src)
+        real_rename = os.rename
+
+        def rename(src, dst):
+            if src == self.src:
+                raise OSError(errno.EXDEV, "Invalid cross-device link")
+            return real_rename(src, dst)
+
+        os.rename = rename
+        try:
+            dst = os.path.join(self.tmp, "dst")
+            move_path(self.src, dst, workers=4)
+        finally:
+            os.rename = real_rename
+        self.assertFalse(os.path.lexists(self.src))
+        self.assertEqual(read_tree(dst), expected)
+
+    def test_default_workers(self):
+        self.assertTrue(1 <= fileops.default_workers()
+                        <= fileops.MAX_WORKERS)
+
+
+if __name__ == "__main__":
+    unittest.main()
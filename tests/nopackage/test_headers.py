@@ -0,0 +1,102 @@
+import io
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+import zipfile
+
+if __name__ == "__main__":
+    TEST_MODULE_DIR = os.path.dirname(os.path.realpath(__file__))
+    TESTS_DIR = os.path.dirname(TEST_MODULE_DIR)
+    REPO_DIR = os.path.dirname(TESTS_DIR)
+    sys.path.insert(0, REPO_DIR)
+
+from nopackage.archives import open_archive
+from nopackage.headers import (
+    SCORES,
+    classify_header,
+    read_headers,
+    score_header,
+)
+from nopackage.trees import DirectoryTree
+
+
+def make_elf(machine, big_endian=False):
+    '''
+    Make the first 64 bytes of a 64-bit ELF executable.
+    '''
+    order = ">" if big_endian else "<"
+    ident = b"\x7fELF" + bytes([2, 2 if big_endian else 1, 1]) + b"\0" * 9
+    return ident + struct.pack(order + "HHI", 2, machine, 1) + b"\0" * 40
+
+
+def make_jar():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as zf:
+        zf.writestr("META-INF/MANIFEST.MF", b"Manifest-Version: 1.0\n")
+    return buf.getvalue()
+
+
+class TestHeaders(unittest.TestCase):
+    def test_classify_header(self):
+        self.assertEqual(classify_header(make_elf(62)), ('elf', 62))
+        self.assertEqual(classify_header(make_elf(21, big_endian=True)),
+                         ('elf', 21))
+        self.assertEqual(classify_header(b"#!/bin/sh\nexit 0\n"),
+                         ('script', "sh"))
+        self.assertEqual(classify_header(b"#! /usr/bin/env python3 -u\n"),
+                         ('script', "python3"))
+        self.assertEqual(classify_header(b"MZ\x90\x00"), ('pe', None))
+        self.assertEqual(classify_header(make_jar()[:64]), ('jar', None))
+        self.assertEqual(classify_header(b"PK\x03\x04", name="a.JAR"),
+                         ('jar', None))
+        self.assertEqual(classify_header(b"PK\x03\x04"), ('zip', None))
+        self.assertEqual(classify_header(b"Read me\n"), ('data', None))
+        self.assertEqual(classify_header(None), (None, None))
+
+    def test_score_header(self):
+        self.assertEqual(score_header('elf', 62, machine=62), SCORES['elf'])
+        self.assertEqual(score_header('elf', 3, machine=62),
+                         SCORES['elf-compatible'])
+        self.assertEqual(score_header('elf', 183, machine=62),
+                         SCORES['elf-foreign'])
+        self.assertGreater(score_header('elf', 62, machine=62),
+                           score_header('script', "sh"))
+        self.assertLess(score_header('data', None), 0)
+
+    def test_read_headers(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            files = {
+                "foo": make_elf(62),
+                "foo.sh": b"#!/bin/sh\n",
+                "notes": b"Not a program\n",
+            }
+            for name, data in files.items():
+                with open(os.path.join(tmp, name), 'wb') as outs:
+                    outs.write(data + b"\0" * 100)
+            for workers in (1, 4):
+                headers = read_headers(DirectoryTree(tmp),
+                                       sorted(files) + ["missing"],
+                                       workers=workers)
+                self.assertEqual(headers["foo"][:2], ('elf', 62))
+                self.assertEqual(headers["foo.sh"][:2], ('script', "sh"))
+                self.assertEqual(headers["notes"][:2], ('data', None))
+                self.assertEqual(headers["missing"][:2], (None, None))
+            zip_path = os.path.join(tmp, "foo.zip")
+            with zipfile.ZipFile(zip_path, 'w') as zf:
+                for name, data in files.items():
+                    zf.writestr("foo-1.0/" + name, data)
+            with open_archive(zip_path, 'zip') as archive:
+                headers = read_headers(archive.tree(), sorted(files))
+            self.assertEqual(headers["foo"][:2], ('elf', 62))
+            self.assertEqual(headers["notes"][:2], ('data', None))
+            # ^ Read from the zip without extracting it.
+        finally:
+            shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+TEST_MODULE_DIR = os.path.dirname(os.path.realpath(__file__))
+TESTS_DIR = os.path.dirname(TEST_MODULE_DIR)
+REPO_DIR = os.path.dirname(TESTS_DIR)
+if __name__ == "__main__":
+    sys.path.insert(0, REPO_DIR)
+
+from nopackage.find_hierosoft import hierosoft
+
+HIEROSOFT_REPO = os.path.dirname(os.path.dirname(hierosoft.__file__))
+# ^ The subprocess has a different HOME, so ~/git/hierosoft may not be
+#   found there.
+
+MAX_IMPORT_SECONDS = 1.0
+# ^ Importing must stay near-instant since every command (even
+#   `nopackage help`) pays for it. It is a generous limit for slow CI.
+
+IMPORT_SCRIPT = '''
+import json
+import sys
+import time
+start = time.perf_counter()
+import nopackage
+seconds = time.perf_counter() - start
+print(json.dumps({
+    'seconds': seconds,
+    'MY_CONFS': nopackage.MY_CONFS,
+    'metaStore': nopackage.metaStore is not None,
+    'modules': [name for name in ('sqlite3', 'nopackage.metastore')
+                if name in sys.modules],
+}))
+'''
+
+
+class TestImportTime(unittest.TestCase):
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.home)
+
+    def import_in_subprocess(self):
+        env = os.environ.copy()
+        env['HOME'] = self.home
+        env.pop('XDG_CONFIG_HOME', None)
+        paths = [REPO_DIR, HIEROSOFT_REPO]
+        if env.get('PYTHONPATH'):
+            paths.append(env['PYTHONPATH'])
+        env['PYTHONPATH'] = os.pathsep.join(paths)
+        output = subprocess.check_output(
+            [sys.executable, "-c", IMPORT_SCRIPT],
+            env=env,
+            cwd=self.home,
+        )
+        # Only the last line is the result (hierosoft may print).
+        return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+    def test_import_has_no_side_effects(self):
+        result = self.import_in_subprocess()
+        self.assertFalse(os.path.exists(result['MY_CONFS']),
+                         "importing nopackage should not create {}"
+                         "".format(result['MY_CONFS']))
+        self.assertFalse(result['metaStore'])
+        self.assertEqual(result['modules'], [])
+
+    def test_import_time(self):
+        self.import_in_subprocess()  # Warm up the filesystem cache.
+        result = self.import_in_subprocess()
+        sys.stderr.write("* import nopackage took {:.3f}s\n"
+                         "".format(result['seconds']))
+        self.assertLess(result['seconds'], MAX_IMPORT_SECONDS)
+
+
+if __name__ == "__main__":
+    unittest.main()
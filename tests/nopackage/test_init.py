@@ -1,6 +1,11 @@
+import io
+import json
 import os
+import shutil
 import sys
+import tempfile
 import unittest
+from unittest import mock
 
 if __name__ == "__main__":
     TEST_MODULE_DIR = os.path.dirname(os.path.realpath(__file__))
@@ -8,10 +13,29 @@ if __name__ == "__main__":
     REPO_DIR = os.path.dirname(TESTS_DIR)
     sys.path.insert(0, REPO_DIR)
 
+import nopackage
 from nopackage import (
+    NoVersionError,
+    PackageInfo,
+    detect_binary,
     iconLinks,
+    installed_packages,
     filename_from_url,
+    find_upgrades,
+    getDeepValue,
+    inspect_archive,
+    localMachineTransaction,
+    newest_archive,
+    parse_package_name,
+    scan_entries,
+    setDeepValue,
+    tokenize,
 )
+from nopackage.trees import (
+    DirectoryTree,
+    MemberTree,
+)
+from tests.nopackage.helpers import make_tar_gz
 
 
 class TestNoPackage(unittest.TestCase):
@@ -20,6 +44,299 @@ class TestNoPackage(unittest.TestCase):
         self.assertEqual(filename_from_url("https://github.com/YuriSizov/boscaceoil-blue/blob/main/icon.png?raw=true"), "icon.png")
         self.assertEqual(filename_from_url("https://github.com/JustOff/Basilisk/blob/master/basilisk/branding/official/default48.png?raw=true"), "default48.png")
 
+    def test_transaction_rollback(self):
+        # Nothing is saved, since the transaction is rolled back.
+        with self.assertRaises(RuntimeError):
+            with localMachineTransaction():
+                setDeepValue('tests', 'rollback', 'a', 1)
+                with localMachineTransaction():
+                    setDeepValue('tests', 'rollback', 'b', 2)
+                raise RuntimeError("roll back")
+        self.assertIsNone(getDeepValue('tests', 'rollback', 'a'))
+        self.assertIsNone(getDeepValue('tests', 'rollback', 'b'))
+        self.assertTrue(nopackage.enableSaveOnWrite)
+        self.assertFalse(nopackage.localMachineUnsaved)
+
+    def test_installed_packages(self):
+        # Nothing is saved, since the transaction is rolled back.
+        packages = [
+            ("testprogram-2.9", "2.9", None),
+            ("testprogram-2.10", "2.10", None),
+            ("testprogram-2.10-rc1", "2.10-rc1", None),
+            ("testprogram-1.0", "1.0", False),
+        ]
+        with self.assertRaises(RuntimeError):
+            with localMachineTransaction():
+                for sc_name, version, installed in packages:
+                    setDeepValue('packages', sc_name, 'luid', "testprogram")
+                    setDeepValue('packages', sc_name, 'version', version)
+                    if installed is not None:
+                        setDeepValue('packages', sc_name, 'installed',
+                                     installed)
+                self.assertEqual(
+                    [sc_name for sc_name, _
+                     in installed_packages(luid="testprogram")],
+                    ["testprogram-2.10", "testprogram-2.10-rc1",
+                     "testprogram-2.9"])
+                raise RuntimeError("roll back")
+
+    def test_find_upgrades(self):
+        tmp = tempfile.mkdtemp()
+        cache_dir = os.path.join(tmp, "cache")
+        downloads = os.path.join(tmp, "downloads")
+        os.mkdir(downloads)
+        for name in ("testprogram-1.0.zip", "testprogram-1.2.zip",
+                     "testprogram-1.1.tar.gz", "otherprog-3.0.AppImage",
+                     "otherprog-1.0.zip", "notinstalled-9.0.zip",
+                     "readme-2.0.txt", "Godot_v3.5-stable_mono_x11_64.zip",
+                     "Godot_v3.4-stable_x11.64.zip"):
+            with open(os.path.join(downloads, name), 'w') as outs:
+                outs.write(name)
+        os.mkdir(os.path.join(downloads, "testprogram-9.0.zip"))
+        # ^ Not a file, so not an installer.
+        try:
+            with self.assertRaises(RuntimeError):
+                with localMachineTransaction():
+                    setDeepValue('programs', "testprogram", 'installed',
+                                 True)
+                    setDeepValue('programs', "testprogram", 'version',
+                                 "1.0")
+                    setDeepValue('packages', "otherprog-2.0", 'luid',
+                                 "otherprog")
+                    setDeepValue('packages', "otherprog-2.0", 'version',
+                                 "2.0")
+                    setDeepValue('packages', "godot-3.3.2", 'luid',
+                                 "godot")
+                    setDeepValue('packages', "godot-3.3.2", 'version',
+                                 "3.3.2 stable")
+                    expected = [
+                        ("godot", "3.3.2 stable", "3.4 stable",
+                         "Godot_v3.4-stable_x11.64.zip", True),
+                        # ^ Not the newer mono build (another flavor).
+                        ("otherprog", "2.0", "3.0",
+                         "otherprog-3.0.AppImage", True),
+                        ("testprogram", "1.0", "1.2",
+                         "testprogram-1.2.zip", False),
+                    ]
+                    for parsed in (8, 0):
+                        with mock.patch.object(
+                                nopackage, '_parse_entry',
+                                wraps=nopackage._parse_entry) as parse:
+                            upgrades = find_upgrades(downloads,
+                                                     cache_dir=cache_dir)
+                        self.assertEqual(parse.call_count, parsed)
+                        # ^ Only parse what wasn't cached.
+                        self.assertEqual(
+                            [(upgrade['luid'], upgrade['installed'],
+                              upgrade['version'],
+                              os.path.basename(upgrade['path']),
+                              upgrade['multiVersion'])
+                             for upgrade in upgrades],
+                            expected)
+                    raise RuntimeError("roll back")
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_find_upgrades_for_host(self):
+        tmp = tempfile.mkdtemp()
+        cache_dir = os.path.join(tmp, "cache")
+        downloads = os.path.join(tmp, "downloads")
+        os.mkdir(downloads)
+        for name in ("blender-2.80-windows64.zip",
+                     "blender-2.80-Linux.tar.xz",
+                     "blender-2.80-linux-glibc217-x86_64.tar.bz2",
+                     "blender-2.80-linux-glibc217-i686.tar.bz2",
+                     "Godot_v3.5-stable_mono_x11_64.zip"):
+            with open(os.path.join(downloads, name), 'w') as outs:
+                outs.write(name)
+        hosts = [
+            ("Linux", 64, "blender-2.80-linux-glibc217-x86_64.tar.bz2"),
+            ("Linux", 32, "blender-2.80-linux-glibc217-i686.tar.bz2"),
+            ("Windows", 64, "blender-2.80-windows64.zip"),
+            ("Darwin", 64, None),
+        ]
+        # ^ blender-2.80-Linux.tar.xz (no arch) sorts first but only
+        #   wins if there is no installer for the host's arch.
+        try:
+            with self.assertRaises(RuntimeError):
+                with localMachineTransaction():
+                    setDeepValue('programs', "blender", 'installed', True)
+                    setDeepValue('programs', "blender", 'version',
+                                 "2.79b")
+                    setDeepValue('programs', "godot", 'installed', True)
+                    setDeepValue('programs', "godot", 'version',
+                                 "3.3.2 stable")
+                    for system, bits, expected in hosts:
+                        with mock.patch.object(nopackage.platform,
+                                               'system',
+                                               return_value=system), \
+                                mock.patch('nopackage.headers.host_bits',
+                                           return_value=bits):
+                            upgrades = find_upgrades(downloads,
+                                                     cache_dir=cache_dir)
+                        self.assertEqual(
+                            [os.path.basename(upgrade['path'])
+                             for upgrade in upgrades],
+                            [expected] if expected else [],
+                            (system, bits))
+                        # ^ godot isn't upgraded to mono (another
+                        #   flavor).
+                    raise RuntimeError("roll back")
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_newest_archive(self):
+        paths = ["/tmp/blender-2.79b-linux-glibc219-x86_64.tar.bz2",
+                 "/tmp/blender-4.1.0-linux-x64.tar.xz",
+                 "/tmp/blender-4.1.0-rc1-linux-x64.tar.xz",
+                 "/tmp/godot-9.0.zip",
+                 "/tmp/Godot_v9.1-stable_mono_x11_64.zip"]
+        self.assertEqual(newest_archive(paths, luid="blender"), paths[1])
+        self.assertEqual(newest_archive(paths), paths[3])
+        self.assertEqual(newest_archive(paths, flavor="mono"), paths[4])
+        self.assertIsNone(newest_archive(["/tmp/noversion.zip"]))
+
+    def test_detect_binary_in_members(self):
+        tree = MemberTree([
+            ("blender", False, 0o755),
+            ("readme.html", False, 0o644),
+            ("2.79/scripts/a.py", False, 0o644),
+        ])
+        self.assertEqual(detect_binary(tree, "blender-2.79b-linux"),
+                         "blender")
+        tree = MemberTree([("README.txt", False, 0o644)])
+        self.assertIsNone(detect_binary(tree, "foo-1.0"))
+
+    def test_detect_script_without_shebang(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            files = {
+                "run.sh": (b'cd "$(dirname "$0")"\n./bin/game.x86_64\n',
+                           0o755),
+                "notes": (b"Not a program\n", 0o644),
+            }
+            for name, (data, mode) in files.items():
+                path = os.path.join(tmp, name)
+                with open(path, 'wb') as outs:
+                    outs.write(data)
+                os.chmod(path, mode)
+            self.assertEqual(detect_binary(DirectoryTree(tmp), "game-1.0"),
+                             "run.sh")
+            # ^ Not skipped as 'data' since .sh is in BIN_EXTS.
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_parse_package_name(self):
+        parsed = parse_package_name("flashprint_4.6.2_amd64.deb")
+        self.assertEqual(parsed.luid, "flashprint")
+        self.assertEqual(parsed.casedName, "FlashPrint")
+        self.assertEqual(parsed.caption, "FlashPrint 4.6.2 (deb)")
+        self.assertEqual(parsed.arch, "64bit")
+        self.assertEqual(parsed.suffix, "-deb")
+        with self.assertRaises(AttributeError):
+            parsed.version = "1.0"
+        self.assertIs(parse_package_name("flashprint_4.6.2_amd64.deb"),
+                      parsed)
+        # ^ Cached.
+        parsed = parse_package_name("blender-2.79b-linux-glibc219-x86_64",
+                                    removeExt=False, version="2.79")
+        self.assertEqual(parsed.version, "2.79")
+        self.assertEqual(parsed.caption, "Blender 2.79b")
+        self.assertEqual(parsed.platform, "Linux")
+        with self.assertRaises(NoVersionError):
+            parse_package_name("noversion")
+        self.assertIsNone(parse_package_name("noversion",
+                                             dry_run=True).version)
+
+    def test_package_info_uses_parse_cache(self):
+        src_path = "Mirage-v0.6.4-x86_64.AppImage"
+        parse_package_name.cache_clear()
+        for _ in range(3):
+            pkg = PackageInfo(src_path, is_dir=False)
+        self.assertEqual(pkg.caption, "Mirage 0.6.4 (AppImage)")
+        info = parse_package_name.cache_info()
+        self.assertEqual((info.hits, info.misses), (2, 1))
+
+    def test_parse_many(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            os.mkdir(os.path.join(tmp, "blender-2.79b-linux-glibc219-x86"))
+            os.mkdir(os.path.join(tmp, ".hidden"))
+            for name in ("flashprint_4.6.2_amd64.deb", "1234"):
+                open(os.path.join(tmp, name), 'w').close()
+            entries = scan_entries(tmp)
+            self.assertEqual([(os.path.basename(path), is_dir)
+                              for path, is_dir in entries],
+                             [("1234", False),
+                              ("blender-2.79b-linux-glibc219-x86", True),
+                              ("flashprint_4.6.2_amd64.deb", False)])
+            for processes in (None, 2):
+                results = list(PackageInfo.parse_many(
+                    entries + ["noversion.zip"], processes=processes))
+                self.assertIn("error", results[0])
+                self.assertEqual(
+                    [(result.get('luid'), result.get('version'),
+                      result.get('arch'), result.get('platform'))
+                     for result in results[1:]],
+                    [("blender", "2.79b", "32bit", "Linux"),
+                     ("flashprint", "4.6.2", "64bit", None),
+                     ("noversion", None, None, None)])
+                self.assertFalse(results[3]['is_dir'])
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_inspect_archive(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, "foo-1.0.tar.gz")
+            with open(path, 'wb') as outs:
+                outs.write(make_tar_gz({
+                    "foo-1.0/foo": b"#!/bin/sh\n",
+                    "foo-1.0/share/icons/hicolor/48x48/apps/foo.png": b"PNG",
+                    "foo-1.0/share/applications/foo.desktop": (
+                        b"[Desktop Entry]\nName=Foo\nExec=foo %f\n"
+                        b"Icon=foo\n[Desktop Action New]\nName=New\n"
+                    ),
+                }))
+            index_dir = os.path.join(tmp, "seekindex")
+            with mock.patch.object(nopackage, 'seekIndexPath', index_dir):
+                with mock.patch('sys.stdout', new_callable=io.StringIO) \
+                        as stdout:
+                    self.assertEqual(inspect_archive(path), 0)
+                self.assertEqual(len(os.listdir(index_dir)), 1)
+                with mock.patch('nopackage.seekindex.SeekIndex.build') \
+                        as build:
+                    with mock.patch('sys.stdout',
+                                    new_callable=io.StringIO):
+                        self.assertEqual(inspect_archive(path), 0)
+                build.assert_not_called()
+            result = json.loads(stdout.getvalue().splitlines()[-1])
+            # ^ The last line, since debug output may precede it.
+            self.assertEqual(result['luid'], "foo")
+            self.assertEqual(result['icons'], [
+                "foo-1.0/share/icons/hicolor/48x48/apps/foo.png"])
+            self.assertEqual(result['desktop_entries'], {
+                "foo-1.0/share/applications/foo.desktop": {
+                    "Name": "Foo", "Exec": "foo %f", "Icon": "foo"},
+            })
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_tokenize(self):
+        D = PackageInfo.DELIMITERS
+        self.assertEqual(
+            tokenize("blender-2.79b-linux-glibc219-x86_64", D,
+                     blobs=PackageInfo.ARCHES),
+            (["blender", "2.79b", "linux", "glibc219", "x86_64"],
+             ["-", "-", "-", "-", ""]))
+        self.assertEqual(
+            tokenize("foo-1.0-1.I386", D, blobs=PackageInfo.ARCHES),
+            (["foo", "1.0", "1", "I386"], ["-", "-", ".", ""]))
+        # ^ A dot before a blob splits, and the dot is the old delimiter.
+        self.assertEqual(tokenize("foo_x86_64", D),
+                         (["foo", "x86", "64"], ["_", "_", ""]))
+        self.assertEqual(tokenize("foo", ""), (["foo"], [""]))
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,109 @@
+import gzip
+import hashlib
+import io
+import lzma
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zipfile
+
+if __name__ == "__main__":
+    TEST_MODULE_DIR = os.path.dirname(os.path.realpath(__file__))
+    TESTS_DIR = os.path.dirname(TEST_MODULE_DIR)
+    REPO_DIR = os.path.dirname(TESTS_DIR)
+    sys.path.insert(0, REPO_DIR)
+
+from nopackage.archives import open_archive
+from nopackage.integrity import (
+    HashingReader,
+    parse_sha256sums,
+    sha256_file,
+    verify_sha256sums,
+)
+from tests.nopackage.helpers import make_tar_gz
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class TestIntegrity(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_hashing_reader(self):
+        reader = HashingReader(io.BytesIO(b"abcdef"))
+        self.assertEqual(reader.read(2), b"ab")
+        reader.drain()
+        self.assertEqual(reader.hexdigest(), sha256(b"abcdef"))
+
+    def test_verify_sha256sums(self):
+        path = os.path.join(self.tmp, "foo-1.0.tar.gz")
+        with open(path, 'wb') as outs:
+            outs.write(b"foo")
+        sums_path = os.path.join(self.tmp, "SHA256SUMS")
+        with open(sums_path, 'w') as outs:
+            outs.write("# comment\n")
+            outs.write("{}  bar.zip\n".format(sha256(b"bar")))
+            outs.write("{} *dist/foo-1.0.tar.gz\n".format(sha256(b"foo")))
+        self.assertEqual(parse_sha256sums(sums_path), {
+            "bar.zip": sha256(b"bar"),
+            "dist/foo-1.0.tar.gz": sha256(b"foo"),
+        })
+        verify_sha256sums(sums_path, path, sha256_file(path))
+        with self.assertRaises(ValueError):
+            verify_sha256sums(sums_path, path, sha256(b"other"))
+        with self.assertRaises(ValueError):
+            verify_sha256sums(sums_path, os.path.join(self.tmp, "baz.zip"),
+                              sha256(b"baz"))
+
+    def test_tar_manifest(self):
+        tar_path = os.path.join(self.tmp, "foo-1.0.tar.gz")
+        with open(tar_path, 'wb') as outs:
+            outs.write(make_tar_gz({
+                "foo-1.0/foo": b"#!/bin/sh\n",
+                "foo-1.0/lib/a.so": b"ELF",
+            }))
+        xz_path = os.path.join(self.tmp, "foo-1.0.tar.xz")
+        with open(xz_path, 'wb') as outs:
+            with gzip.open(tar_path, 'rb') as ins:
+                outs.write(lzma.compress(ins.read()))
+        for path in (tar_path, xz_path):
+            # ^ xz may use a command fed by a thread (See CommandStream).
+            with open_archive(path, 'tar') as archive:
+                archive.extract(os.path.join(self.tmp, "foo"))
+                self.assertEqual(archive.sha256, sha256_file(path))
+                # ^ Computed during the extraction.
+                self.assertEqual(archive.manifest, {
+                    "foo": [10, 0o644, sha256(b"#!/bin/sh\n")],
+                    "lib/a.so": [3, 0o644, sha256(b"ELF")],
+                })
+            shutil.rmtree(os.path.join(self.tmp, "foo"))
+
+    def test_zip_manifest(self):
+        zip_path = os.path.join(self.tmp, "many.zip")
+        expected = {}
+        with zipfile.ZipFile(zip_path, 'w') as zf:
+            for i in range(40):
+                data = ("x" * i).encode('ascii')
+                zf.writestr("many/d{}/f{}".format(i % 3, i), data)
+                expected["d{}/f{}".format(i % 3, i)] = (i, sha256(data))
+        for workers in (1, 4):
+            with open_archive(zip_path, 'zip') as archive:
+                archive.extract(os.path.join(self.tmp, str(workers)),
+                                workers=workers)
+                self.assertEqual(
+                    {name: (size, digest) for name, (size, _, digest)
+                     in archive.manifest.items()},
+                    expected,
+                )
+                self.assertEqual(archive.sha256, sha256_file(zip_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+if __name__ == "__main__":
+    TEST_MODULE_DIR = os.path.dirname(os.path.realpath(__file__))
+    TESTS_DIR = os.path.dirname(TEST_MODULE_DIR)
+    REPO_DIR = os.path.dirname(TESTS_DIR)
+    sys.path.insert(0, REPO_DIR)
+
+from nopackage.metastore import (
+    JSONMetaStore,
+    SQLiteMetaStore,
+    import_json_to_sqlite,
+)
+
+
+class MetaStoreCases(object):
+    '''
+    Tests that every MetaStore backend must pass (Subclasses must set
+    self.store in setUp).
+    '''
+    def test_values(self):
+        store = self.store
+        self.assertIsNone(store.get_value('programs', 'blender', 'luid'))
+        self.assertFalse(store.has_entry('programs', 'blender'))
+        store.set_value('programs', 'blender', 'luid', "blender")
+        store.set_value('programs', 'blender', 'src_path', "/tmp/blender")
+        store.set_value('programs', 'godot', 'src_path', "/tmp/godot")
+        self.assertEqual(store.get_value('programs', 'blender', 'luid'),
+                         "blender")
+        self.assertEqual(sorted(store.entry_ids('programs')),
+                         ["blender", "godot"])
+        self.assertIsNone(store.entry_ids('packages'))
+        self.assertEqual(store.find('programs', 'src_path', "/tmp/godot"),
+                         ["godot"])
+        self.assertTrue(store.delete_value('programs', 'godot', 'src_path'))
+        self.assertFalse(store.delete_value('programs', 'godot', 'src_path'))
+        self.assertEqual(store.find('programs', 'src_path', "/tmp/godot"),
+                         [])
+
+    def test_append(self):
+        store = self.store
+        store.append_value('programs', 'blender', 'icon_paths', "a.png")
+        store.append_value('programs', 'blender', 'icon_paths', "a.png")
+        store.append_value('programs', 'blender', 'icon_paths', "b.png")
+        self.assertEqual(
+            store.get_value('programs', 'blender', 'icon_paths'),
+            ["a.png", "b.png"],
+        )
+
+    def test_rollback(self):
+        store = self.store
+        store.set_value('programs', 'blender', 'installed', True)
+        store.save()
+        store.begin()
+        store.set_value('programs', 'blender', 'installed', False)
+        store.set_value('programs', 'godot', 'installed', True)
+        store.rollback()
+        self.assertIs(store.get_value('programs', 'blender', 'installed'),
+                      True)
+        self.assertFalse(store.has_entry('programs', 'godot'))
+        with self.assertRaises(RuntimeError):
+            store.rollback()
+            # ^ Already rolled back.
+
+    def test_empty_entry(self):
+        store = self.store
+        store.set_value('programs', 'blender', 'luid', "blender")
+        self.assertTrue(store.delete_value('programs', 'blender', 'luid'))
+        store.save()
+        store = self.reopen()
+        self.assertEqual(store.get_entry('programs', 'blender'), {})
+        self.assertTrue(store.has_entry('programs', 'blender'))
+        self.assertEqual(store.entry_ids('programs'), ["blender"])
+        self.assertIsNone(store.get_entry('programs', 'godot'))
+
+
+class TestJSONMetaStore(MetaStoreCases, unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "local_machine.json")
+        self.store = JSONMetaStore(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def reopen(self):
+        self.store = JSONMetaStore(self.path)
+        return self.store
+
+    def test_save(self):
+        self.store.set_value('programs', 'blender', 'luid', "blender")
+        self.store.compact = True
+        self.store.save()
+        with open(self.path, 'r') as ins:
+            self.assertEqual(
+                ins.read(),
+                '{"programs":{"blender":{"luid":"blender"}}}',
+            )
+        self.assertEqual(os.listdir(self.tmp), ["local_machine.json"])
+        # ^ The temporary file must be gone.
+
+    def test_save_mode(self):
+        self.store.set_value('programs', 'blender', 'luid', "blender")
+        umask = os.umask(0o022)
+        try:
+            self.store.save()
+            self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o644)
+            # ^ Like any new file (not 0600 from mkstemp).
+            os.chmod(self.path, 0o640)
+            self.store.set_value('programs', 'blender', 'caption', "B")
+            self.store.save()
+            self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o640)
+        finally:
+            os.umask(umask)
+
+
+class TestSQLiteMetaStore(MetaStoreCases, unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "local_machine.sqlite3")
+        self.store = SQLiteMetaStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp)
+
+    def reopen(self):
+        self.store.close()
+        self.store = SQLiteMetaStore(self.path)
+        return self.store
+
+    def test_add_entries_table(self):
+        self.store.set_value('programs', 'blender', 'luid', "blender")
+        self.store.conn.execute("DROP TABLE entries")
+        # ^ Like a database made before the entries table was added.
+        store = self.reopen()
+        self.assertEqual(store.entry_ids('programs'), ["blender"])
+        self.assertEqual(store.get_entry('programs', 'blender'),
+                         {'luid': "blender"})
+
+    def test_import_json(self):
+        json_path = os.path.join(self.tmp, "local_machine.json")
+        data = {
+            'programs': {
+                'blender': {'luid': "blender", 'icon_paths': ["a.png"]},
+            },
+            'packages': {
+                'blender-2.79b': {'luid': "blender", 'installed': True},
+            },
+        }
+        with open(json_path, 'w') as outs:
+            json.dump(data, outs)
+        self.assertEqual(import_json_to_sqlite(json_path, self.path), 4)
+        self.assertEqual(self.store.get_entry('programs', 'blender'),
+                         data['programs']['blender'])
+        self.assertEqual(self.store.find('packages', 'luid', "blender"),
+                         ["blender-2.79b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
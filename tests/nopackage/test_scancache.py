@@ -0,0 +1,57 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+if __name__ == "__main__":
+    TEST_MODULE_DIR = os.path.dirname(os.path.realpath(__file__))
+    TESTS_DIR = os.path.dirname(TEST_MODULE_DIR)
+    REPO_DIR = os.path.dirname(TESTS_DIR)
+    sys.path.insert(0, REPO_DIR)
+
+from nopackage.scancache import ScanCache
+
+
+class TestScanCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp, "scan")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_reload(self):
+        cache = ScanCache(self.cache_dir, self.tmp)
+        cache.set("foo-1.0.zip", 3, 100, {'luid': "foo"})
+        cache.set("bar-1.0.zip", 4, 100, {'luid': "bar"})
+        cache.save()
+        cache = ScanCache(self.cache_dir, self.tmp)
+        self.assertFalse(cache.changed)
+        self.assertEqual(cache.get("foo-1.0.zip", 3, 100), {'luid': "foo"})
+        self.assertIsNone(cache.get("foo-1.0.zip", 3, 101))
+        self.assertIsNone(cache.get("foo-1.0.zip", 5, 100))
+        self.assertIsNone(cache.get("baz-1.0.zip", 3, 100))
+        cache.prune({"bar-1.0.zip"})
+        self.assertTrue(cache.changed)
+        cache.save()
+        cache = ScanCache(self.cache_dir, self.tmp)
+        self.assertEqual(list(cache.entries), ["bar-1.0.zip"])
+        self.assertEqual(ScanCache(self.cache_dir, self.cache_dir).entries,
+                         {})
+        # ^ Each directory has its own cache.
+
+    def test_corrupt(self):
+        cache = ScanCache(self.cache_dir, self.tmp)
+        cache.set("foo-1.0.zip", 3, 100, {'luid': "foo"})
+        cache.save()
+        with open(cache.path, 'w') as outs:
+            outs.write("{")
+        cache = ScanCache(self.cache_dir, self.tmp)
+        self.assertEqual(cache.entries, {})
+        self.assertTrue(cache.changed)
+        # ^ So saving replaces the corrupt file.
+
+
+if __name__ == "__main__":
+    unittest.main()
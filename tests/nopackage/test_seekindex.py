@@ -0,0 +1,130 @@
+import gzip
+import io
+import lzma
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import unittest
+
+if __name__ == "__main__":
+    TEST_MODULE_DIR = os.path.dirname(os.path.realpath(__file__))
+    TESTS_DIR = os.path.dirname(TEST_MODULE_DIR)
+    REPO_DIR = os.path.dirname(TESTS_DIR)
+    sys.path.insert(0, REPO_DIR)
+
+from nopackage.archives import TarArchive
+from nopackage.decompressors import which
+from nopackage.seekindex import (
+    SeekIndex,
+    index_file_name,
+)
+
+FILES = {
+    "./foo-1.0/bin/foo": b"#!/bin/sh\n" * 3000,
+    "./foo-1.0/lib/libfoo.so": os.urandom(50000),
+    "./foo-1.0/share/icons/foo.png": b"PNG" + os.urandom(3000),
+    "./foo-1.0/share/applications/foo.desktop": b"[Desktop Entry]\n",
+}
+
+
+def make_tar():
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        for name, data in sorted(FILES.items()):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+
+def split_chunks(data, size):
+    return [data[i:i+size] for i in range(0, len(data), size)]
+
+
+class TestSeekIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.tar = make_tar()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'wb') as outs:
+            outs.write(data)
+        return path
+
+    def check_members(self, index):
+        self.assertEqual(index.names(), sorted(
+            name[2:] for name in FILES))
+        for name, data in FILES.items():
+            self.assertEqual(index.read_member(name), data)
+
+    def test_tar(self):
+        index = SeekIndex.build(self.write("foo.tar", self.tar))
+        self.check_members(index)
+
+    def test_multi_member_gzip(self):
+        data = b"".join(gzip.compress(chunk)
+                        for chunk in split_chunks(self.tar, 16384))
+        index = SeekIndex.build(self.write("foo.tar.gz", data))
+        self.assertGreater(len(index.data['checkpoints']), 3)
+        self.check_members(index)
+
+    def test_single_member_gzip(self):
+        index = SeekIndex.build(self.write("foo.tar.gz",
+                                           gzip.compress(self.tar)))
+        self.assertEqual(index.data['checkpoints'], [[0, 0]])
+        self.check_members(index)
+
+    def test_multi_stream_xz(self):
+        data = b"".join(lzma.compress(chunk)
+                        for chunk in split_chunks(self.tar, 16384))
+        data += b"\0" * 8  # Stream padding
+        index = SeekIndex.build(self.write("foo.tar.xz", data))
+        self.assertGreater(len(index.data['checkpoints']), 3)
+        self.check_members(index)
+
+    def test_multi_block_xz(self):
+        if which("xz") is None:
+            self.skipTest("The xz command is not installed.")
+        path = self.write("foo.tar", self.tar)
+        subprocess.check_call(["xz", "-T2", "--block-size=8192", path])
+        index = SeekIndex.build(path + ".xz")
+        self.assertGreater(len(index.data['checkpoints']), 3)
+        self.check_members(index)
+
+    def test_from_members(self):
+        data = b"".join(lzma.compress(chunk)
+                        for chunk in split_chunks(self.tar, 16384))
+        path = self.write("foo.tar.xz", data)
+        archive = TarArchive(path)
+        archive.extract(os.path.join(self.tmp, "foo"))
+        index = SeekIndex.from_members(path, archive.compression,
+                                       archive.offsets)
+        self.assertEqual(index.data, SeekIndex.build(path).data)
+        self.check_members(index)
+
+    def test_not_tar(self):
+        with self.assertRaises(ValueError):
+            SeekIndex.build(self.write("foo.zip", b"PK\x05\x06" + 18 * b"\0"))
+
+    def test_load_or_build(self):
+        path = self.write("foo.tar.gz", gzip.compress(self.tar))
+        index_dir = os.path.join(self.tmp, "seekindex")
+        SeekIndex.load_or_build(index_dir, path)
+        index_path = os.path.join(index_dir, index_file_name(path))
+        self.assertIsNotNone(SeekIndex.load(index_path, path))
+        self.write("foo.tar.gz", gzip.compress(self.tar + b"\0" * 1024))
+        self.assertIsNone(SeekIndex.load(index_path, path))
+        # ^ Outdated since the archive changed.
+        with self.assertRaises(KeyError):
+            SeekIndex.load_or_build(index_dir, path).read_member("bar")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+if __name__ == "__main__":
+    TEST_MODULE_DIR = os.path.dirname(os.path.realpath(__file__))
+    TESTS_DIR = os.path.dirname(TEST_MODULE_DIR)
+    REPO_DIR = os.path.dirname(TESTS_DIR)
+    sys.path.insert(0, REPO_DIR)
+
+from nopackage.staging import (
+    STAGING_NAME,
+    clean_staging,
+    commit_staged,
+    make_staging_dir,
+)
+from nopackage.trash import (
+    TRASH_NAME,
+    list_entries,
+)
+
+
+class TestStaging(unittest.TestCase):
+    def setUp(self):
+        self.programs = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.programs)
+
+    def test_commit_staged(self):
+        stage = make_staging_dir(self.programs)
+        self.assertEqual(os.path.dirname(stage),
+                         os.path.join(self.programs, STAGING_NAME))
+        staged_path = os.path.join(stage, "foo-1.0")
+        os.mkdir(staged_path)
+        with open(os.path.join(staged_path, "foo"), 'w') as outs:
+            outs.write("#!/bin/sh\n")
+        dst = os.path.join(self.programs, "foo-1.0")
+        commit_staged(staged_path, dst)
+        self.assertTrue(os.path.isfile(os.path.join(dst, "foo")))
+        self.assertEqual(os.listdir(stage), [])
+        os.mkdir(staged_path)
+        with self.assertRaises(OSError):
+            commit_staged(staged_path, dst)
+            # ^ Even though os.rename could replace an empty directory.
+
+    def test_clean_staging(self):
+        self.assertEqual(clean_staging(self.programs), 0)
+        running = make_staging_dir(self.programs)
+        stale = os.path.join(self.programs, STAGING_NAME, "0.stopped")
+        os.mkdir(stale)
+        self.assertEqual(clean_staging(self.programs), 1)
+        self.assertTrue(os.path.isdir(running))
+        self.assertFalse(os.path.exists(stale))
+        entries = list_entries(os.path.join(self.programs, TRASH_NAME))
+        self.assertEqual([os.path.basename(entry).split(".")[0]
+                          for entry in entries], ["0"])
+
+
+if __name__ == "__main__":
+    unittest.main()
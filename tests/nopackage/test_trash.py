@@ -0,0 +1,73 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+if __name__ == "__main__":
+    TEST_MODULE_DIR = os.path.dirname(os.path.realpath(__file__))
+    TESTS_DIR = os.path.dirname(TEST_MODULE_DIR)
+    REPO_DIR = os.path.dirname(TESTS_DIR)
+    sys.path.insert(0, REPO_DIR)
+
+from nopackage.trash import (
+    LOCK_NAME,
+    TRASH_NAME,
+    list_entries,
+    move_to_trash,
+    purge,
+    purge_in_background,
+)
+from tests.nopackage.helpers import make_tree
+
+
+class TestTrash(unittest.TestCase):
+    def setUp(self):
+        self.programs = tempfile.mkdtemp()
+        self.trash = os.path.join(self.programs, TRASH_NAME)
+
+    def tearDown(self):
+        shutil.rmtree(self.programs)
+
+    def test_move_to_trash(self):
+        path = os.path.join(self.programs, "foo")
+        make_tree(path, ["foo", "lib/a.so"])
+        entry = move_to_trash(path, files={"foo": [1, 0o755, "0"]})
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.isfile(os.path.join(entry, "lib", "a.so")))
+        self.assertEqual(list_entries(self.trash), [entry])
+
+    def test_purge(self):
+        files = ["foo", "lib/a.so", "share/foo/data.txt"]
+        for name in ("a", "b"):
+            path = os.path.join(self.programs, name)
+            make_tree(path, files)
+            make_tree(path, ["lib/__pycache__/not_in_manifest.pyc"])
+            move_to_trash(path, files=files if name == "a" else None)
+        self.assertEqual(purge(self.trash), 2)
+        self.assertEqual(os.listdir(self.trash), [])
+
+    def test_purge_locked(self):
+        path = os.path.join(self.programs, "foo")
+        make_tree(path, ["foo"])
+        move_to_trash(path)
+        with open(os.path.join(self.trash, LOCK_NAME), 'w') as outs:
+            outs.write(str(os.getpid()))
+        self.assertEqual(purge(self.trash), 0)
+        # ^ A running process (this one) is purging it.
+        with open(os.path.join(self.trash, LOCK_NAME), 'w') as outs:
+            outs.write("0")
+        self.assertEqual(purge(self.trash), 1)
+        # ^ The stale lock is ignored.
+
+    def test_purge_in_background(self):
+        path = os.path.join(self.programs, "foo")
+        make_tree(path, ["foo", "lib/a.so"])
+        move_to_trash(path)
+        proc = purge_in_background(self.trash)
+        self.assertEqual(proc.wait(), 0)
+        self.assertEqual(os.listdir(self.trash), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+if __name__ == "__main__":
+    TEST_MODULE_DIR = os.path.dirname(os.path.realpath(__file__))
+    TESTS_DIR = os.path.dirname(TEST_MODULE_DIR)
+    REPO_DIR = os.path.dirname(TESTS_DIR)
+    sys.path.insert(0, REPO_DIR)
+
+from nopackage.trees import (
+    DirectoryTree,
+    MemberTree,
+)
+
+
+class TreeCases(object):
+    '''
+    Tests that every tree must pass (Subclasses must set self.tree in
+    setUp to a tree containing bin/foo (executable), data/ and
+    README.md).
+    '''
+    def test_queries(self):
+        tree = self.tree
+        self.assertEqual(sorted(tree.listdir()), ["README.md", "bin", "data"])
+        self.assertEqual(tree.listdir("bin"), ["foo"])
+        self.assertTrue(tree.isdir("bin"))
+        self.assertTrue(tree.isdir("data"))
+        self.assertFalse(tree.isfile("bin"))
+        self.assertTrue(tree.isfile(os.path.join("bin", "foo")))
+        self.assertTrue(tree.is_executable(os.path.join("bin", "foo")))
+        self.assertFalse(tree.is_executable("README.md"))
+        self.assertFalse(tree.isfile("missing"))
+
+
+class TestMemberTree(TreeCases, unittest.TestCase):
+    def setUp(self):
+        self.tree = MemberTree([
+            ("", True, None),
+            ("bin/foo", False, 0o755),  # The parent is only implied.
+            ("data/", True, 0o755),
+            ("README.md", False, 0o644),
+        ])
+
+
+class TestDirectoryTree(TreeCases, unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.tmp, "bin"))
+        os.makedirs(os.path.join(self.tmp, "data"))
+        for name, mode in (("bin/foo", 0o755), ("README.md", 0o644)):
+            path = os.path.join(self.tmp, name)
+            with open(path, 'w') as outs:
+                outs.write("x")
+            os.chmod(path, mode)
+        self.tree = DirectoryTree(self.tmp)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_one_scan_per_directory(self):
+        real_scandir = os.scandir
+        scanned = []
+
+        def scandir(path):
+            scanned.append(path)
+            return real_scandir(path)
+
+        os.scandir = scandir
+        try:
+            tree = self.tree
+            for _ in range(3):
+                self.test_queries()
+                for name in tree.listdir():
+                    tree.isdir(name)
+                    tree.is_executable(name)
+                self.assertFalse(tree.isfile("bin/missing/foo"))
+        finally:
+            os.scandir = real_scandir
+        self.assertEqual(len(scanned), len(set(scanned)))
+        with self.assertRaises(OSError):
+            tree.listdir("missing")
+
+
+if __name__ == "__main__":
+    unittest.main()
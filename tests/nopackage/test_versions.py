@@ -0,0 +1,74 @@
+import os
+import sys
+import unittest
+
+if __name__ == "__main__":
+    TEST_MODULE_DIR = os.path.dirname(os.path.realpath(__file__))
+    TESTS_DIR = os.path.dirname(TEST_MODULE_DIR)
+    REPO_DIR = os.path.dirname(TESTS_DIR)
+    sys.path.insert(0, REPO_DIR)
+
+from nopackage.versions import (
+    newest,
+    parse_version,
+    sort_versions,
+    version_flavor,
+    version_key,
+)
+
+
+class TestVersions(unittest.TestCase):
+    def test_sort_versions(self):
+        expected = [
+            None,
+            "master",
+            "1.0-dev",
+            "1.0alpha",
+            "1.0 beta2",
+            "1.0-rc1",
+            "1.0",
+            "1.0a",
+            "1.0.1",
+            "2.79",
+            "2.79b",
+            "2.79.1",
+            "2.80",
+            "3.3.2 stable",
+            "3.3.2 stable mono",
+            "3.3.10",
+            "2019.2.0",
+        ]
+        for versions in (expected, list(reversed(expected))):
+            self.assertEqual(sort_versions(versions), expected)
+        self.assertEqual(sort_versions(expected, reverse=True),
+                         list(reversed(expected)))
+
+    def test_version_key(self):
+        self.assertEqual(version_key("3.3.2 stable"), version_key("3.3.2"))
+        self.assertEqual(version_key("v1.01"), version_key("1.1"))
+        self.assertEqual(version_key("1.3.1-dev"), version_key("1.3.1dev"))
+        self.assertLess(version_key("1.3.1-dev"), version_key("1.3.1"))
+        self.assertIs(version_key("2.79b"), version_key("2.79b"))
+        # ^ Cached.
+        self.assertEqual(version_key("3.3.2 stable mono"),
+                         version_key("3.3.2"))
+        # ^ A flavor is not newer.
+        self.assertEqual(parse_version("3.3.2 stable mono"),
+                         (version_key("3.3.2"), "mono"))
+        self.assertEqual(version_flavor("3.3.2 stable"), "")
+        self.assertEqual(parse_version(None), ("", ""))
+
+    def test_newest(self):
+        self.assertEqual(newest(["2.79b", "2.80", "2.8"]), "2.80")
+        self.assertIsNone(newest([]))
+        self.assertEqual(newest(["3.3.2 stable", "3.3.2 stable mono"]),
+                         "3.3.2 stable")
+        entries = [("blender-2.79b", version_key("2.79b")),
+                   ("blender-4.1.0", version_key("4.1.0")),
+                   ("blender-4.1.0-rc1", version_key("4.1.0-rc1"))]
+        self.assertEqual(newest(entries, key=lambda entry: entry[1])[0],
+                         "blender-4.1.0")
+
+
+if __name__ == "__main__":
+    unittest.main()